@@ -1,35 +1,127 @@
 import os
 import uuid
+import threading
+import contextlib
 from datetime import datetime, timezone
 
 import cv2
 import numpy as np
 
-from Model.yolo_service import YoloService
+from Model.yolo_pool import YoloPool
+from Model.yolo_service import ImgszPolicy
 from Model.metrics_service import MetricsService
 from Model.evidence_service import EvidenceService
 from Model.roi_mask_service import ROIMaskService
+from Model.tracking_service import TrackingService
+from Model.change_gate_service import ChangeGateService
+from Model.camera_profile_service import CameraProfileService
+from Model.timeseries_service import TimeSeriesService
+from Model.heatmap_service import HeatmapService
+from Model.image_decode_service import ImageDecodeService
+from Model.buffer_pool import BufferPool
+from Model.overlay_service import OverlayService
+from Model.encoder_pool import EncoderPool
+from Model.profiling_service import ProfilingService
 
 
 class AppController:
-    def __init__(self, model_path: str, outputs_dir: str = "outputs"):
+    def __init__(
+        self,
+        model_path: str,
+        outputs_dir: str = "outputs",
+        pool_size: int = 1,
+        intra_op_threads: int = None,
+        checkout_timeout: float = 30.0,
+        change_gate: ChangeGateService = None,
+        imgsz_policy: ImgszPolicy = None,
+        profiles_dir: str = "profiles",
+        timeseries_dir: str = None,
+        heatmaps_dir: str = None,
+        heatmap_half_life_s: float = None,
+        reduced_decode: bool = False,
+        overlay_mode: str = "lazy",
+        events=None,
+        model_variant: str = None,
+        encoder: EncoderPool = None,
+        profiling: ProfilingService = None,
+    ):
+        """
+        pool_size: nº de réplicas del modelo (None => según cores/memoria).
+        Con pool_size > 1 el controller se puede llamar desde varios hilos.
+        change_gate: si se pasa, los frames casi idénticos al último analizado
+        de la misma cámara reutilizan sus detecciones sin llamar a YOLO.
+        imgsz_policy: cómo elegir el tamaño de inferencia por crop (por defecto adaptativo).
+        profiles_dir: perfiles de cámara guardados (polígono + máscara/SAT precalculadas).
+        timeseries_dir: rollups por minuto de cada cámara (None, por defecto => desactivado).
+        heatmaps_dir: mapas de calor de ocupación por cámara (None, por defecto =>
+          desactivado); heatmap_half_life_s da decaimiento exponencial (None => acumulado).
+          Ambos van por source_name: para cámaras fijas, no para ficheros sueltos.
+          Al apagar, close() vuelca lo pendiente.
+        reduced_decode: decodifica los JPEG a 1/2, 1/4 o 1/8 cuando el modelo
+          va a trabajar a menos resolución que la del crop (overlay reducido).
+        overlay_mode: "lazy" => overlay.jpg se pinta al pedirlo (render_overlay);
+          "eager" => se pinta y guarda en cada análisis, como antes.
+        events: EventBus donde se publica un evento "frame" por análisis (dashboard).
+        model_variant: variante cuantizada del modelo ("int8", "fp16"...) que
+          haya pasado la puerta de precisión (tools/quantize_model.py).
+        encoder: EncoderPool para original/overlay (formato, calidad, hilos y
+          tope de memoria); por defecto JPEG calidad 90.
+        profiling: perfilado de peticiones muestreadas o lentas, guardado en
+          <escena>/perf/ (por defecto según ROUNDABOUT_PROFILE; sin ella, nada).
+        """
+        if overlay_mode not in ("lazy", "eager"):
+            raise ValueError(f"overlay_mode inválido: {overlay_mode!r} (lazy | eager)")
         self.model_path = model_path
-        self.yolo = YoloService(model_path)
+        self.pool = YoloPool(
+            model_path,
+            size=pool_size,
+            intra_op_threads=intra_op_threads,
+            checkout_timeout=checkout_timeout,
+            imgsz_policy=imgsz_policy,
+            variant=model_variant,
+        )
         self.evidence = EvidenceService(outputs_dir)
         self.outputs_dir = outputs_dir
+        self.change_gate = change_gate
+        self.profiles = CameraProfileService(profiles_dir)
+        self.timeseries = TimeSeriesService(timeseries_dir) if timeseries_dir else None
+        self.heatmaps = HeatmapService(heatmaps_dir, half_life_s=heatmap_half_life_s) if heatmaps_dir else None
+        self.reduced_decode = bool(reduced_decode)
+        # Máscaras y lienzos del overlay se reutilizan entre frames (mismas formas por cámara)
+        self.buffers = BufferPool()
+        self.overlay_mode = overlay_mode
+        # Codificación fuera del hilo que analiza (original no JPEG, overlay, previews de la UI)
+        self.encoder = encoder or EncoderPool()
+        self.overlays = OverlayService(outputs_dir, buffers=self.buffers, encoder=self.encoder)
+        self.events = events
+        self.profiling = profiling or ProfilingService.from_env()
+        self._last_scene = {}  # source_name -> último frame (para pintar el heatmap encima)
+
+        # Un tracker por cámara (source_name) para secuencias de frames
+        self.trackers = {}
+        self._trackers_lock = threading.Lock()
 
     @staticmethod
     def _make_scene_id() -> str:
         ts = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
         return f"{ts}_{uuid.uuid4().hex[:6]}"
 
+    def _create_scene_dir(self):
+        # makedirs sin exist_ok es atómico: si otro hilo/proceso ya creó ese
+        # scene_id (colisión de timestamp+uuid), generamos otro.
+        for _ in range(16):
+            scene_id = self._make_scene_id()
+            scene_dir = os.path.join(self.outputs_dir, scene_id)
+            try:
+                os.makedirs(scene_dir)
+                return scene_id, scene_dir
+            except FileExistsError:
+                continue
+        raise RuntimeError("No se pudo reservar un scene_id único.")
+
     @staticmethod
     def _bytes_to_bgr(image_bytes: bytes) -> np.ndarray:
-        arr = np.frombuffer(image_bytes, dtype=np.uint8)
-        img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
-        if img is None:
-            raise ValueError("No se pudo decodificar la imagen.")
-        return img
+        return ImageDecodeService.decode(image_bytes)
 
     @staticmethod
     def _clip_xyxy(xyxy, w, h):
@@ -44,54 +136,132 @@ class AppController:
             y2 = min(h, y1 + 1)
         return [x1, y1, x2, y2]
 
-    def analyze_image_bytes(
-        self,
-        image_bytes: bytes,
-        source_name: str,
-        conf: float = 0.25,
-        iou: float = 0.7,
-        poly_points=None,  # lista [(x,y),...]
-    ):
-        img_bgr = self._bytes_to_bgr(image_bytes)
-        h, w = img_bgr.shape[:2]
+    def _estimate_crop_hw(self, h: int, w: int, poly_points=None, profile_id: str = None):
+        # Tamaño aproximado del crop antes de decodificar (solo para elegir la escala)
+        if profile_id:
+            profile = self.profiles.load(profile_id)
+            ph, pw = profile["frame_size"]
+            x1, y1, x2, y2 = profile["crop_xyxy"]
+            return (y2 - y1) * h / float(ph), (x2 - x1) * w / float(pw)
+        if poly_points and len(poly_points) >= 3:
+            bx1, by1, bx2, by2 = ROIMaskService.bounding_rect(poly_points)
+            x1, y1, x2, y2 = self._clip_xyxy([bx1, by1, bx2 + 1, by2 + 1], w, h)
+            return y2 - y1, x2 - x1
+        return h, w
+
+    def _decode(self, image_bytes: bytes, poly_points=None, profile_id: str = None):
+        """
+        Devuelve (img_bgr, (h, w) a resolución completa, escala).
+        Con reduced_decode y JPEG, se decodifica a 1/2, 1/4 o 1/8 si el crop
+        sigue quedando por encima del imgsz que va a usar el modelo.
+        """
+        probe = ImageDecodeService.probe_jpeg_size(image_bytes) if self.reduced_decode else None
+        scale = 1
+        if probe is not None:
+            crop_h, crop_w = self._estimate_crop_hw(probe[0], probe[1], poly_points, profile_id)
+            scale = ImageDecodeService.choose_scale(crop_h, crop_w, self.pool.choose_imgsz(crop_h, crop_w))
 
-        scene_id = self._make_scene_id()
-        scene_dir = os.path.join(self.outputs_dir, scene_id)
-        os.makedirs(scene_dir, exist_ok=True)
+        img_bgr = ImageDecodeService.decode(image_bytes, scale)
+        h, w = ImageDecodeService.full_size(img_bgr.shape, probe, scale)
+        return img_bgr, (h, w), scale
 
-        original_path = os.path.join(scene_dir, "original.jpg")
-        cv2.imwrite(original_path, img_bgr)
+    def _prepare_frame(self, image_bytes: bytes, poly_points=None, profile_id: str = None) -> dict:
+        """
+        Decodifica la imagen y calcula máscara + crop (todo lo previo a YOLO).
+        La máscara de carretera se guarda solo en el tamaño del crop.
+        Con profile_id, polígono, máscara y SAT salen del perfil (mmap).
+
+        Geometría (polígono, crop_xyxy, máscara, métricas) siempre en
+        coordenadas de resolución completa; img_bgr puede estar reducida
+        ("scale") y "crop" es una vista de img_bgr, sin copia.
+        Los buffers que salen de self.buffers van en frame["buffers"] y se
+        devuelven con _release_frame.
+        """
+        img_bgr, (h, w), scale = self._decode(image_bytes, poly_points, profile_id)
+        buffers = []
 
         # --- máscara de carretera ---
         road_mask = None
+        road_sat = None
+        road_area = None
+        entry_rois = None
         crop_xyxy = [0, 0, w, h]
 
-        if poly_points and len(poly_points) >= 3:
-            road_mask = ROIMaskService.polygon_mask(h, w, poly_points)
-            crop_xyxy = ROIMaskService.bounding_rect(poly_points)
-            crop_xyxy = self._clip_xyxy(crop_xyxy, w, h)
+        if profile_id:
+            profile = self.profiles.load(profile_id, h, w)
+            poly_points = profile["poly_points"]
+            entry_rois = profile["entry_rois"] or None
+            crop_xyxy = list(profile["crop_xyxy"])
+            road_mask = profile["mask_crop"]
+            road_sat = profile["sat"]
+            road_area = profile["road_area"]
+        elif poly_points and len(poly_points) >= 3:
+            # bounding_rect es inclusivo: +1 para que la última fila/columna del polígono quede en el crop
+            bx1, by1, bx2, by2 = ROIMaskService.bounding_rect(poly_points)
+            crop_xyxy = self._clip_xyxy([bx1, by1, bx2 + 1, by2 + 1], w, h)
+            x1, y1, x2, y2 = crop_xyxy
+            if y2 - y1 >= 2 and x2 - x1 >= 2:
+                road_mask = self.buffers.acquire((y2 - y1, x2 - x1), np.uint8)
+                try:
+                    ROIMaskService.polygon_mask_into(road_mask, poly_points, offset=(-x1, -y1))
+                except Exception:
+                    self.buffers.release(road_mask)  # aún sin frame que lo devuelva
+                    raise
+                buffers.append(road_mask)
+                road_area = cv2.countNonZero(road_mask)
         else:
             # si no hay polígono, analizamos todo (pero sin máscara)
             road_mask = None
             crop_xyxy = [0, 0, w, h]
 
         x1, y1, x2, y2 = crop_xyxy
-        crop = img_bgr[y1:y2, x1:x2].copy()
-        ch, cw = crop.shape[:2]
-        if ch < 2 or cw < 2:
+        if y2 - y1 < 2 or x2 - x1 < 2:
             raise ValueError("ROI/crop demasiado pequeña.")
 
-        # ✅ YOLO SOLO sobre el crop
-        res = self.yolo.predict(crop, conf=conf, iou=iou)
+        # Crop en la imagen decodificada (reducida si scale > 1): vista, YOLO no la modifica
+        rx1, ry1 = x1 // scale, y1 // scale
+        rx2, ry2 = -(-x2 // scale), -(-y2 // scale)
+        crop = img_bgr[ry1:ry2, rx1:rx2]
 
-        # Remap detecciones a coords de imagen original
+        return {
+            "image_bytes": image_bytes,
+            "img_bgr": img_bgr,
+            "image_size": (h, w),
+            "scale": scale,
+            "road_mask": road_mask,
+            "road_sat": road_sat,
+            "road_area": road_area,
+            "crop_xyxy": crop_xyxy,
+            "crop_hw": (y2 - y1, x2 - x1),
+            "crop": crop,
+            "crop_origin": (rx1 * scale, ry1 * scale),  # esquina del crop decodificado, en coords completas
+            "poly_points": poly_points,
+            "entry_rois": entry_rois,
+            "profile_id": profile_id,
+            "buffers": buffers,
+        }
+
+    def _profile(self, kind: str):
+        # Sin perfilado: contexto vacío (la lista de escenas se ignora)
+        if self.profiling is None:
+            return contextlib.nullcontext([])
+        return self.profiling.capture(kind)
+
+    def _release_frame(self, frame: dict):
+        for buf in frame["buffers"]:
+            self.buffers.release(buf)
+        frame["buffers"] = []
+
+    @staticmethod
+    def _remap_detections(res, x1: int, y1: int, scale: int = 1) -> list:
+        # Remap detecciones a coords de imagen original (deshaciendo la reducción)
         detections = []
         names = res.names
         if res.boxes is not None and len(res.boxes) > 0:
             for b in res.boxes:
                 cls_id = int(b.cls.item())
                 conf_v = float(b.conf.item())
-                bx1, by1, bx2, by2 = [float(v) for v in b.xyxy[0].tolist()]
+                bx1, by1, bx2, by2 = [float(v) * scale for v in b.xyxy[0].tolist()]
                 detections.append(
                     {
                         "class_id": cls_id,
@@ -100,66 +270,374 @@ class AppController:
                         "bbox_xyxy": [bx1 + x1, by1 + y1, bx2 + x1, by2 + y1],
                     }
                 )
+        return detections
+
+    def get_tracker(self, source_name: str, image_h: int, image_w: int, entry_rois: dict = None, poly_points=None):
+        """
+        Tracker de la cámara source_name. Las ROIs de entrada/salida son
+        entry_rois ({nombre: [(x,y),...]}) o, si no hay, el propio segmento.
+        Si cambia el tamaño de frame se crea uno nuevo.
+        """
+        with self._trackers_lock:
+            tr = self.trackers.get(source_name)
+            if tr is not None and tr.frame_size == (image_h, image_w):
+                return tr
+
+            polys = entry_rois or ({"segmento": poly_points} if poly_points and len(poly_points) >= 3 else {})
+            rois = {name: ROIMaskService.polygon_mask(image_h, image_w, pts) for name, pts in polys.items()}
+            tr = TrackingService(rois=rois, frame_size=(image_h, image_w))
+            self.trackers[source_name] = tr
+            return tr
+
+    def _gate_frame(self, frame: dict, source_name: str, conf: float, iou: float):
+        """
+        Consulta la puerta de cambios (si está activa). Devuelve la decisión
+        o None si no hay puerta.
+        """
+        if self.change_gate is None:
+            return None
+
+        mask_crop = frame["road_mask"]
+        poly = [tuple(p) for p in frame["poly_points"]] if frame["poly_points"] else None
+        context = (poly, float(conf), float(iou))
+
+        decision = self.change_gate.check(source_name, frame["crop"], mask_crop, context=context)
+        decision["context"] = context
+        return decision
+
+    def _finalize_frame(
+        self,
+        frame: dict,
+        detections: list,
+        source_name: str,
+        conf: float,
+        iou: float,
+        frame_ts: float = None,
+        entry_rois: dict = None,
+        gate: dict = None,
+        imgsz=None,
+    ) -> dict:
+        """
+        Post-proceso tras YOLO: métricas, overlay y evidencia en disco.
+        gate: decisión de ChangeGateService; si gate["skip"], las detecciones
+        y métricas vienen del frame de referencia.
+        imgsz: tamaño de inferencia usado (None si no hubo inferencia).
+        """
+        img_bgr = frame["img_bgr"]
+        road_mask = frame["road_mask"]
+        crop_xyxy = frame["crop_xyxy"]
+        poly_points = frame["poly_points"]
+        entry_rois = entry_rois or frame["entry_rois"]
+        h, w = frame["image_size"]
+        scale = frame["scale"]
+        x1, y1 = crop_xyxy[:2]
+        skipped = bool(gate and gate["skip"])
+
+        scene_id, scene_dir = self._create_scene_dir()
 
-        # Métricas usando máscara (si hay)
-        metrics = MetricsService.compute(detections, w, h, road_mask=road_mask)
-
-        # Overlay sobre imagen original
-        overlay_bgr = img_bgr.copy()
-
-        # Pintar carretera (segmento coloreado) si hay máscara
-        if road_mask is not None:
-            overlay_bgr = ROIMaskService.overlay_mask(overlay_bgr, road_mask, alpha=0.35, color_bgr=(0, 0, 255))
-            overlay_bgr = ROIMaskService.draw_polygon_edges(overlay_bgr, poly_points, color_bgr=(0, 255, 0), thickness=3)
-
-        # Dibujar cajas SOLO si el centro cae dentro de máscara (si existe)
-        for d in detections:
-            bx1, by1, bx2, by2 = [int(v) for v in d["bbox_xyxy"]]
-            cx = int((bx1 + bx2) / 2)
-            cy = int((by1 + by2) / 2)
-
-            if road_mask is not None:
-                if not (0 <= cx < w and 0 <= cy < h and road_mask[cy, cx] > 0):
-                    continue
-
-            cv2.rectangle(overlay_bgr, (bx1, by1), (bx2, by2), (255, 255, 0), 2)
-            cv2.putText(
-                overlay_bgr,
-                f"{d['class_name']} {d['conf']:.2f}",
-                (bx1, max(0, by1 - 6)),
-                cv2.FONT_HERSHEY_SIMPLEX,
-                0.7,
-                (255, 255, 0),
-                2,
+        # Las codificaciones van al EncoderPool y corren en paralelo con el
+        # resto del post-proceso; se esperan justo antes de guardar la evidencia
+        original_job = None
+        if ImageDecodeService.is_jpeg(frame["image_bytes"]):
+            # Los bytes recibidos tal cual: ni recodificar ni perder resolución
+            original_path = os.path.join(scene_dir, "original.jpg")
+            with open(original_path, "wb") as f:
+                f.write(frame["image_bytes"])
+        else:
+            original_path = os.path.join(scene_dir, "original" + self.encoder.ext())
+            original_job = self.encoder.submit(img_bgr, original_path)
+
+        # Métricas usando máscara (si hay); en frames saltados se reutilizan
+        if skipped:
+            metrics = dict(gate["ref"]["metrics"])
+        else:
+            metrics = MetricsService.compute(
+                detections,
+                w,
+                h,
+                road_mask=road_mask,
+                mask_offset=(x1, y1),
+                road_sat=frame["road_sat"],
+                road_area=frame["road_area"],
             )
 
-        overlay_path = os.path.join(scene_dir, "overlay.jpg")
-        if not cv2.imwrite(overlay_path, overlay_bgr):
-            raise RuntimeError("No se pudo guardar overlay.jpg")
+        # Serie temporal por cámara: estado suavizado con histéresis (en el
+        # instante del frame si lo hay: un backlog cae en sus minutos, no en el actual)
+        series = self.timeseries.add(source_name, metrics, t=frame_ts) if self.timeseries is not None else None
+
+        # Huellas de las detecciones en el mapa de calor de la cámara
+        if self.heatmaps is not None:
+            self.heatmaps.add(source_name, detections, h, w)
+            self._last_scene[source_name] = {"original_path": original_path, "poly_points": poly_points}
+
+        # Tracking (solo en secuencias: requiere el instante del frame)
+        tracking = None
+        if frame_ts is not None:
+            tracker = self.get_tracker(source_name, h, w, entry_rois=entry_rois, poly_points=poly_points)
+            tracking = tracker.update(detections, frame_ts)
+            tracking["flow"] = tracker.flow(frame_ts)
+
+        # Overlay: en modo eager se pinta directamente sobre img_bgr (ya no se
+        # necesita intacta), a la resolución decodificada; en lazy, al pedirlo
+        overlay_path = None
+        overlay_job = None
+        if self.overlay_mode == "eager":
+            if original_job is not None:
+                original_job.result()  # el original se codifica desde img_bgr: antes de pintar encima
+            self.overlays.draw(img_bgr, detections, poly_points, crop_xyxy, road_mask, scale=scale)
+            overlay_path = os.path.join(scene_dir, OverlayService.cache_name(ext=self.encoder.ext()))
+            overlay_job = self.encoder.submit(img_bgr, overlay_path)
 
         result_obj = {
             "scene_id": scene_id,
             "timestamp_utc": datetime.now(timezone.utc).isoformat(),
-            "model": {"weights": os.path.basename(self.model_path), "conf": conf, "iou": iou},
-            "image": {"width": w, "height": h, "source_name": source_name},
+            "model": {
+                "weights": os.path.basename(self.model_path),
+                "variant": self.pool.variant,
+                "conf": conf,
+                "iou": iou,
+                "imgsz": imgsz,
+            },
+            "image": {"width": w, "height": h, "source_name": source_name, "decode_scale": scale},
             "poly_points": poly_points,
+            "profile_id": frame["profile_id"],
             "crop_xyxy": crop_xyxy,
             "metrics": metrics,
             "detections": detections,
         }
+        if series is not None:
+            result_obj["traffic_state_smoothed"] = series["traffic_state_smoothed"]
+        if tracking is not None:
+            result_obj["frame_ts"] = frame_ts
+            result_obj["tracking"] = tracking
+        if gate is not None:
+            result_obj["change_gate"] = {"skipped": skipped, "score": gate["score"], "reason": gate["reason"]}
+            if skipped:
+                # Evidencia propia del frame, apuntando a la escena cuyas detecciones reutiliza
+                result_obj["reused_from"] = {
+                    "scene_id": gate["ref"]["scene_id"],
+                    "sha256_result_json": gate["ref"]["sha256_result_json"],
+                }
 
+        for job in (original_job, overlay_job):
+            if job is not None:
+                job.result()  # propaga el error de codificación, si lo hubo
+        if self.profiling is not None:
+            self.profiling.checkpoint("finalize")  # reservas con el frame aún vivo
         ev = self.evidence.save_evidence(scene_id, original_path, overlay_path, result_obj)
 
+        if gate is not None and not skipped:
+            self.change_gate.commit(
+                source_name,
+                gate["sig"],
+                {
+                    "scene_id": scene_id,
+                    "sha256_result_json": ev["sha256_result_json"],
+                    "detections": detections,
+                    "metrics": metrics,
+                },
+                context=gate["context"],
+            )
+
+        if self.events is not None and self.events.has_subscribers:
+            # Resumen ligero: el dashboard no necesita detecciones ni imagen
+            # (y con el dashboard cerrado ni se construye)
+            self.events.publish(
+                "frame",
+                {
+                    "source_name": source_name,
+                    "scene_id": scene_id,
+                    "original_path": os.path.abspath(original_path),
+                    "overlay_path": os.path.abspath(overlay_path) if overlay_path else None,
+                    "traffic_state": metrics.get("traffic_state"),
+                    "traffic_state_smoothed": series["traffic_state_smoothed"] if series else None,
+                    "road_occupancy": metrics.get("road_occupancy"),
+                    "counts_by_class": metrics.get("counts_by_class"),
+                    "total_objects": metrics.get("total_objects"),
+                    "skipped_inference": skipped,
+                },
+            )
+
         return {
             "scene_id": scene_id,
             "metrics": metrics,
             "sha256_result_json": ev["sha256_result_json"],
-            "overlay_path": os.path.abspath(overlay_path),
+            "overlay_path": os.path.abspath(overlay_path) if overlay_path else None,
             "original_path": os.path.abspath(original_path),
             "result_path": os.path.abspath(ev["result_path"]),
             "scene_dir": os.path.abspath(ev["scene_dir"]),
+            "tracking": tracking,
+            "skipped_inference": skipped,
+            "traffic_state_smoothed": series["traffic_state_smoothed"] if series else None,
+            "rollups": series["rollups"] if series else None,
         }
 
+    def analyze_image_bytes(
+        self,
+        image_bytes: bytes,
+        source_name: str,
+        conf: float = 0.25,
+        iou: float = 0.7,
+        poly_points=None,  # lista [(x,y),...]
+        frame_ts: float = None,  # segundos; activa tracking por source_name
+        entry_rois: dict = None,  # {nombre: [(x,y),...]} entradas de la rotonda
+        profile_id: str = None,  # perfil de cámara guardado, en lugar de poly_points
+    ):
+        with self._profile("analyze_image_bytes") as scene_dirs:
+            frame = self._prepare_frame(image_bytes, poly_points, profile_id=profile_id)
+            try:
+                gate = self._gate_frame(frame, source_name, conf, iou)
+
+                imgsz = None
+                if gate is not None and gate["skip"]:
+                    detections = [dict(d) for d in gate["ref"]["detections"]]
+                else:
+                    # ✅ YOLO SOLO sobre el crop (réplica en exclusiva mientras dura el predict)
+                    with self.pool.replica() as yolo:
+                        # imgsz según el crop a resolución completa (igual con o sin decodificación reducida)
+                        imgsz = yolo.choose_imgsz(*frame["crop_hw"])
+                        res = yolo.predict(frame["crop"], conf=conf, iou=iou, imgsz=imgsz)
+                    detections = self._remap_detections(res, *frame["crop_origin"], scale=frame["scale"])
+
+                out = self._finalize_frame(
+                    frame,
+                    detections,
+                    source_name,
+                    conf,
+                    iou,
+                    frame_ts=frame_ts,
+                    entry_rois=entry_rois,
+                    gate=gate,
+                    imgsz=imgsz,
+                )
+                scene_dirs.append(out["scene_dir"])
+                return out
+            finally:
+                self._release_frame(frame)
+
+    def analyze_batch(self, items: list, conf: float = 0.25, iou: float = 0.7) -> list:
+        """
+        items: lista de dicts {"image_bytes", "source_name", "poly_points"}
+               (opcional "frame_ts" y "entry_rois" para tracking, "profile_id")
+        Hace UN solo forward de YOLO con todos los crops.
+        Devuelve una lista alineada con items: el dict de resultado o la
+        excepción de ese elemento (un fallo no tumba al resto del lote).
+        """
+        with self._profile("analyze_batch") as scene_dirs:
+            out = [None] * len(items)
+            frames = []
+            gates = []
+            idx_ok = []
+            # Todo frame preparado devuelve sus buffers al pool, falle lo que falle
+            # (puerta, forward del lote...); _release_frame es idempotente
+            prepared = []
+            try:
+                for i, it in enumerate(items):
+                    try:
+                        frame = self._prepare_frame(it["image_bytes"], it.get("poly_points"), profile_id=it.get("profile_id"))
+                        prepared.append(frame)
+                        gates.append(self._gate_frame(frame, it.get("source_name", ""), conf, iou))
+                        frames.append(frame)
+                        idx_ok.append(i)
+                    except Exception as ex:
+                        out[i] = ex
+
+                # Solo van a YOLO los frames que la puerta no ha saltado
+                to_predict = [k for k, g in enumerate(gates) if not (g is not None and g["skip"])]
+                results = {}
+                imgsz = None
+                if to_predict:
+                    crops = [frames[k]["crop"] for k in to_predict]
+                    with self.pool.replica() as yolo:
+                        imgsz = yolo.choose_imgsz(
+                            max(frames[k]["crop_hw"][0] for k in to_predict),
+                            max(frames[k]["crop_hw"][1] for k in to_predict),
+                        )
+                        preds = yolo.predict_batch(crops, conf=conf, iou=iou, imgsz=imgsz)
+                    results = dict(zip(to_predict, preds))
+
+                for k, (i, frame, gate) in enumerate(zip(idx_ok, frames, gates)):
+                    it = items[i]
+                    try:
+                        if k in results:
+                            detections = self._remap_detections(results[k], *frame["crop_origin"], scale=frame["scale"])
+                        else:
+                            detections = [dict(d) for d in gate["ref"]["detections"]]
+                        out[i] = self._finalize_frame(
+                            frame,
+                            detections,
+                            it.get("source_name", ""),
+                            conf,
+                            iou,
+                            frame_ts=it.get("frame_ts"),
+                            entry_rois=it.get("entry_rois"),
+                            gate=gate,
+                            imgsz=imgsz if k in results else None,
+                        )
+                    except Exception as ex:
+                        out[i] = ex
+                    finally:
+                        self._release_frame(frame)  # cuanto antes, para otros lotes en paralelo
+            finally:
+                for frame in prepared:
+                    self._release_frame(frame)
+
+            scene_dirs.extend(o["scene_dir"] for o in out if isinstance(o, dict))
+            return out
+
+    def save_profile(self, profile_id: str, image_bytes: bytes, poly_points, entry_rois: dict = None) -> dict:
+        """
+        Guarda un perfil de cámara a partir de una imagen de referencia
+        (de ella se toma el tamaño de frame).
+        """
+        # En JPEG basta la cabecera para el tamaño
+        probe = ImageDecodeService.probe_jpeg_size(image_bytes)
+        h, w = probe if probe is not None else self._bytes_to_bgr(image_bytes).shape[:2]
+        p = self.profiles.save(profile_id, h, w, poly_points, entry_rois=entry_rois)
+        return {k: v for k, v in p.items() if k not in ("mask_crop", "sat", "_mtime")}
+
+    def render_overlay(self, scene_id: str, max_side: int = None) -> str:
+        """
+        Ruta del overlay de la escena (se pinta y cachea la primera vez).
+        max_side: lado mayor en píxeles (None => resolución completa).
+        """
+        return os.path.abspath(self.overlays.render(scene_id, max_side=max_side))
+
+    def render_heatmap(self, source_name: str, alpha: float = 0.5) -> np.ndarray:
+        """
+        Mapa de calor acumulado de la cámara pintado sobre su último frame,
+        con el segmento coloreado igual que el overlay normal.
+        """
+        if self.heatmaps is None:
+            raise ValueError("Mapas de calor desactivados.")
+        last = self._last_scene.get(source_name)
+        if last is None:
+            raise ValueError(f"Sin frames analizados para {source_name!r}.")
+
+        img_bgr = cv2.imread(last["original_path"])
+        if img_bgr is None:
+            raise ValueError("No se pudo abrir el último frame de la cámara.")
+        h, w = img_bgr.shape[:2]
+
+        road_mask = None
+        if last["poly_points"] and len(last["poly_points"]) >= 3:
+            road_mask = ROIMaskService.polygon_mask(h, w, last["poly_points"])
+        out = self.heatmaps.render(source_name, img_bgr, alpha=alpha, road_mask=road_mask)
+        if last["poly_points"]:
+            out = ROIMaskService.draw_polygon_edges(out, last["poly_points"], color_bgr=(0, 255, 0), thickness=3)
+        return out
+
+    def close(self):
+        """
+        Al apagar: vuelca los minutos en curso de las series y los metadatos
+        de los mapas de calor, y espera a las codificaciones pendientes.
+        """
+        if self.timeseries is not None:
+            self.timeseries.flush()
+        if self.heatmaps is not None:
+            self.heatmaps.flush()
+        self.encoder.close()
+
     def publish_to_bsv(self, scene_id: str, sha256_hex: str, metrics: dict) -> dict:
         wif = os.getenv("BSV_WIF", "").strip()
         if not wif:
@@ -0,0 +1,163 @@
+import os
+import time
+import logging
+import threading
+
+from Model.work_queue_service import WorkQueueService
+
+log = logging.getLogger(__name__)
+
+
+class BatchWorker:
+    """
+    Worker de la cola distribuida: reclama unidades, analiza cada imagen con
+    el AppController y confirma la unidad.
+
+    El controller debe escribir sus evidencias en queue.staging_dir(worker_id)
+    (ver make_controller en tools/backfill.py): nada llega al almacén central
+    hasta que la unidad se confirma y se fusiona (merge_into).
+    """
+
+    def __init__(
+        self,
+        controller,
+        queue: WorkQueueService,
+        worker_id: str = None,
+        checkpoint_every: int = 10,
+        merge_into: str = None,
+        conf: float = 0.25,
+        iou: float = 0.7,
+    ):
+        self.controller = controller
+        self.queue = queue
+        self.worker_id = worker_id or WorkQueueService.default_worker_id()
+        self.checkpoint_every = max(1, int(checkpoint_every))
+        self.merge_into = merge_into  # almacén central; None => merge aparte (tools/backfill.py merge)
+        self.conf = conf
+        self.iou = iou
+
+        self.stats = {"units": 0, "items": 0, "resumed": 0, "errors": 0, "lost_leases": 0, "lost_commits": 0,
+                      "unit_errors": 0}
+
+    # ---------------- latido de la lease ----------------
+
+    def _start_heartbeat(self, lease: dict):
+        lost = threading.Event()
+        stop = threading.Event()
+
+        def beat():
+            # Renovar a 1/3 del TTL deja margen para dos latidos fallidos
+            while not stop.wait(self.queue.lease_ttl_s / 3.0):
+                try:
+                    if not self.queue.heartbeat(lease):
+                        lost.set()
+                        return
+                except OSError:
+                    pass  # FS compartido con hipo: se reintenta en el siguiente latido
+
+        t = threading.Thread(target=beat, name=f"lease-{lease['unit_id']}", daemon=True)
+        t.start()
+        return stop, lost
+
+    # ---------------- proceso de una unidad ----------------
+
+    def _analyze_item(self, item: dict) -> dict:
+        with open(item["path"], "rb") as f:
+            image_bytes = f.read()
+        out = self.controller.analyze_image_bytes(
+            image_bytes,
+            source_name=item.get("source_name") or os.path.basename(os.path.dirname(item["path"])) or "backfill",
+            conf=item.get("conf", self.conf),
+            iou=item.get("iou", self.iou),
+            poly_points=item.get("poly_points"),
+            frame_ts=item.get("frame_ts"),
+            entry_rois=item.get("entry_rois"),
+            profile_id=item.get("profile_id"),
+        )
+        return {
+            "path": item["path"],
+            "scene": os.path.relpath(out["scene_dir"], self.queue.queue_dir),
+            "sha256_result_json": out["sha256_result_json"],
+            "traffic_state": out["metrics"].get("traffic_state"),
+        }
+
+    def process_unit(self, unit: dict) -> bool:
+        """
+        True si la unidad queda confirmada. Un fallo de infraestructura
+        (checkpoint, FS compartido...) suelta la lease y se relanza: la
+        unidad queda libre para otro intento (hasta max_attempts).
+        """
+        lease = unit["lease"]
+        stop, lost = self._start_heartbeat(lease)
+        try:
+            # Reanudar desde el checkpoint del intento anterior (si lo hay)
+            records = self.queue.load_checkpoint(unit["unit_id"])
+            self.stats["resumed"] += len(records)
+
+            pending = 0
+            for i, item in enumerate(unit["items"]):
+                if lost.is_set():
+                    self.stats["lost_leases"] += 1
+                    return False
+                if str(i) in records:
+                    continue
+                try:
+                    records[str(i)] = self._analyze_item(item)
+                except Exception as ex:
+                    # Un item roto no bloquea la unidad: queda registrado como error
+                    records[str(i)] = {"path": item["path"], "error": str(ex)}
+                    self.stats["errors"] += 1
+                self.stats["items"] += 1
+
+                pending += 1
+                if pending >= self.checkpoint_every:
+                    self.queue.checkpoint(lease, records)
+                    pending = 0
+
+            self.queue.checkpoint(lease, records)
+        except Exception as ex:
+            stop.set()
+            try:
+                self.queue.release(lease, error=str(ex))
+            except OSError:
+                pass  # sin soltar: la lease caducará sola
+            raise
+        finally:
+            stop.set()
+
+        if lost.is_set() or not self.queue.commit(lease, records):
+            # Otro worker confirmó la unidad: sus escenas son las que cuentan
+            self.stats["lost_commits"] += 1
+            return False
+
+        self.stats["units"] += 1
+        if self.merge_into:
+            try:
+                self.queue.merge(unit["unit_id"], self.merge_into)
+            except OSError:
+                # Ya confirmada: la fusión se puede repetir (tools/backfill.py merge)
+                log.exception("Unidad %s confirmada pero sin fusionar en %s", unit["unit_id"], self.merge_into)
+        return True
+
+    def run(self, max_units: int = None, wait_for_leases: bool = False, poll_s: float = 5.0) -> dict:
+        """
+        Procesa unidades hasta vaciar la cola (o max_units). Con
+        wait_for_leases, mientras otros workers tengan unidades se sigue
+        esperando por si alguna lease caduca (worker muerto).
+        """
+        done = 0
+        while max_units is None or done < max_units:
+            unit = self.queue.claim(self.worker_id)
+            if unit is None:
+                if not wait_for_leases or self.queue.status()["leased"] == 0:
+                    break
+                time.sleep(poll_s)
+                continue
+            try:
+                self.process_unit(unit)
+            except Exception:
+                # Una unidad que falla no para el worker (process_unit ya soltó la lease)
+                self.stats["unit_errors"] += 1
+                log.exception("Unidad %s abandonada por %s", unit["unit_id"], self.worker_id)
+            done += 1
+        return dict(self.stats)
@@ -0,0 +1,251 @@
+import os
+import time
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+async def folder_frames(folder: str, fps: float = 1.0, loop: bool = False):
+    """
+    Fuente de ejemplo: reproduce las imágenes de una carpeta a fps fijos,
+    produciendo (bytes, ts) con ts en epoch s: reloj de pared al inicio más
+    el tiempo monótono transcurrido (nunca retrocede, y la serie temporal
+    cae en sus minutos reales).
+    """
+    paths = sorted(
+        os.path.join(folder, f) for f in os.listdir(folder) if f.lower().endswith((".jpg", ".jpeg", ".png"))
+    )
+    t0 = time.monotonic()
+    wall0 = time.time()
+    i = 0
+    while paths:
+        for p in paths:
+            with open(p, "rb") as f:
+                data = f.read()
+            yield data, wall0 + (time.monotonic() - t0)
+            i += 1
+            # Ritmo fijo respecto al inicio (sin acumular deriva)
+            await asyncio.sleep(max(0.0, t0 + i / fps - time.monotonic()))
+        if not loop:
+            break
+
+
+class CameraSource:
+    """
+    Una cámara del scheduler.
+
+    frames: iterable asíncrono que produce bytes de imagen (o (bytes, ts))
+    priority: mayor => se atiende antes cuando hay que elegir
+    deadline_s: un frame más viejo que esto ya no sirve y se descarta
+    queue_size: frames pendientes máximos (al llenarse se tira el más viejo)
+    profile_id: perfil de cámara guardado (sustituye a poly_points)
+    """
+
+    def __init__(
+        self,
+        camera_id: str,
+        frames,
+        poly_points=None,
+        priority: int = 1,
+        deadline_s: float = 2.0,
+        queue_size: int = 2,
+        conf: float = 0.25,
+        iou: float = 0.7,
+        entry_rois: dict = None,
+        profile_id: str = None,
+    ):
+        self.camera_id = camera_id
+        self.frames = frames
+        self.poly_points = poly_points
+        self.priority = max(1, int(priority))
+        self.deadline_s = deadline_s
+        self.conf = conf
+        self.iou = iou
+        self.entry_rois = entry_rois
+        self.profile_id = profile_id
+
+        self.pending = deque(maxlen=max(1, int(queue_size)))
+
+        # Métricas
+        self.received = 0
+        self.analyzed = 0
+        self.dropped_overflow = 0
+        self.dropped_deadline = 0
+        self.errors = 0
+        self.last_error = None
+        self.last_lag_s = None
+        self.served = 0.0  # servicio acumulado ponderado (fair queuing)
+        self.busy = False  # máx. un frame en vuelo por cámara (orden para el tracker)
+        self._done_times = deque()
+        self.finished = False
+
+
+class CameraScheduler:
+    """
+    Multiplexa muchas cámaras sobre un único AppController (un solo modelo
+    en memoria). Cada vez que hay una réplica libre se elige la cámara con
+    menor servicio virtual (served / priority) entre las que tienen frames
+    vigentes => reparto justo ponderado por prioridad. Cuando no da abasto,
+    cada cámara descarta sus propios frames viejos (cola acotada + deadline)
+    en lugar de retrasarse todas.
+    """
+
+    def __init__(self, controller, on_result=None, fps_window_s: float = 10.0):
+        self.controller = controller
+        self.on_result = on_result  # callback(camera_id, result_dict)
+        self.fps_window_s = fps_window_s
+
+        self.cameras = {}
+        self.parallel = max(1, controller.pool.size)
+        self._executor = ThreadPoolExecutor(max_workers=self.parallel, thread_name_prefix="cam-sched")
+        self._wakeup = None
+        self._tasks = []
+
+    def add_camera(self, source: CameraSource):
+        if source.camera_id in self.cameras:
+            raise ValueError(f"Cámara duplicada: {source.camera_id}")
+        self.cameras[source.camera_id] = source
+        if self._wakeup is not None:
+            self._tasks.append(asyncio.create_task(self._ingest(source)))
+
+    # ---------------- ingesta ----------------
+
+    async def _ingest(self, cam: CameraSource):
+        try:
+            async for item in cam.frames:
+                if isinstance(item, tuple):
+                    image_bytes, ts = item
+                else:
+                    image_bytes, ts = item, None
+                now = time.monotonic()
+                if not cam.pending:
+                    self._sync_vtime(cam)
+                if len(cam.pending) == cam.pending.maxlen:
+                    cam.dropped_overflow += 1  # deque(maxlen) tira el más viejo
+                cam.pending.append((image_bytes, ts, now))
+                cam.received += 1
+                self._wakeup.set()
+        finally:
+            cam.finished = True
+            self._wakeup.set()
+
+    # ---------------- planificación ----------------
+
+    def _pick(self):
+        now = time.monotonic()
+        best = None
+        for cam in self.cameras.values():
+            # Descartar lo que ya ha vencido su deadline
+            while cam.pending and now - cam.pending[0][2] > cam.deadline_s:
+                cam.pending.popleft()
+                cam.dropped_deadline += 1
+            if not cam.pending or cam.busy:
+                continue
+
+            # Servicio virtual ponderado; desempate por deadline más próximo
+            vtime = cam.served / cam.priority
+            slack = cam.deadline_s - (now - cam.pending[0][2])
+            key = (vtime, slack)
+            if best is None or key < best[0]:
+                best = (key, cam)
+
+        if best is None:
+            return None, None
+
+        cam = best[1]
+        cam.busy = True
+        # FIFO dentro de la cámara (el tracking necesita los frames en orden)
+        return cam, cam.pending.popleft()
+
+    def _sync_vtime(self, cam: CameraSource):
+        # Al reactivarse, una cámara que estuvo parada no arrastra "crédito"
+        # acumulado que le permita acaparar el modelo
+        active = [c.served / c.priority for c in self.cameras.values() if c.pending and c is not cam]
+        if active:
+            cam.served = max(cam.served, min(active) * cam.priority)
+
+    async def _analyze(self, cam: CameraSource, frame, slots: asyncio.Semaphore):
+        image_bytes, ts, t_in = frame
+        loop = asyncio.get_running_loop()
+        t0 = time.monotonic()
+        try:
+            out = await loop.run_in_executor(
+                self._executor,
+                lambda: self.controller.analyze_image_bytes(
+                    image_bytes,
+                    source_name=cam.camera_id,
+                    conf=cam.conf,
+                    iou=cam.iou,
+                    poly_points=cam.poly_points,
+                    frame_ts=ts,
+                    entry_rois=cam.entry_rois,
+                    profile_id=cam.profile_id,
+                ),
+            )
+            done = time.monotonic()
+            cam.analyzed += 1
+            cam.last_lag_s = done - t_in
+            cam._done_times.append(done)
+            if self.on_result is not None:
+                self.on_result(cam.camera_id, out)
+        except Exception as ex:
+            cam.errors += 1
+            cam.last_error = str(ex)
+        finally:
+            cam.served += time.monotonic() - t0
+            cam.busy = False
+            slots.release()
+            self._wakeup.set()
+
+    async def run(self):
+        """
+        Corre hasta que todas las fuentes terminan y no quedan frames.
+        """
+        self._wakeup = asyncio.Event()
+        slots = asyncio.Semaphore(self.parallel)
+        self._tasks = [asyncio.create_task(self._ingest(c)) for c in self.cameras.values()]
+        inflight = set()
+
+        try:
+            while True:
+                await slots.acquire()
+                cam, frame = self._pick()
+                while cam is None:
+                    if all(c.finished and not c.pending and not c.busy for c in self.cameras.values()):
+                        slots.release()
+                        if inflight:
+                            await asyncio.gather(*inflight)
+                        return
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    cam, frame = self._pick()
+
+                t = asyncio.create_task(self._analyze(cam, frame, slots))
+                inflight.add(t)
+                t.add_done_callback(inflight.discard)
+        finally:
+            for t in self._tasks:
+                t.cancel()
+            self._executor.shutdown(wait=False)
+
+    # ---------------- métricas ----------------
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        out = {}
+        for cid, cam in self.cameras.items():
+            while cam._done_times and cam._done_times[0] < now - self.fps_window_s:
+                cam._done_times.popleft()
+            out[cid] = {
+                "priority": cam.priority,
+                "received": cam.received,
+                "analyzed": cam.analyzed,
+                "dropped_overflow": cam.dropped_overflow,
+                "dropped_deadline": cam.dropped_deadline,
+                "errors": cam.errors,
+                "last_error": cam.last_error,
+                "pending": len(cam.pending),
+                "lag_s": cam.last_lag_s,
+                "fps": len(cam._done_times) / self.fps_window_s,
+            }
+        return out
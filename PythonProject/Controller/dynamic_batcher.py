@@ -0,0 +1,188 @@
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class DynamicBatcher:
+    """
+    Agrupa peticiones concurrentes en un único forward de YOLO.
+
+    La primera petición que llega abre una ventana de max_latency_ms; todo lo
+    que entre en esa ventana (hasta max_batch_size) va en el mismo lote.
+    Dentro del lote se agrupa por (conf, iou) porque YOLO los aplica por llamada.
+
+    Los frames con frame_ts de una misma fuente se procesan en orden (el
+    tracker no admite tiempos hacia atrás), como el "busy" de CameraScheduler:
+    mientras la fuente tenga un lote en vuelo sus frames esperan aparcados, y
+    dentro de un lote todos van en el mismo grupo (conf, iou).
+    """
+
+    def __init__(self, controller, max_batch_size: int = 8, max_latency_ms: float = 20.0):
+        self.controller = controller
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_latency_s = max(0.0, float(max_latency_ms)) / 1000.0
+
+        self._queue = None
+        self._worker = None
+        # Un hilo por réplica del pool: cada lote ocupa una réplica en exclusiva
+        self.parallel = max(1, controller.pool.size)
+        self._executor = ThreadPoolExecutor(max_workers=self.parallel, thread_name_prefix="yolo-batch")
+        self._slots = None
+        self._inflight = set()
+        self._pending = deque()  # sacados de la cola, esperando a su fuente
+        self._busy = set()  # fuentes (con frame_ts) con un lote en vuelo
+
+        self.stats = {"batches": 0, "items": 0, "max_batch": 0, "errors": 0}
+
+    async def start(self):
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.parallel)
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        self._executor.shutdown(wait=True)
+
+    async def submit(
+        self,
+        image_bytes: bytes,
+        source_name: str,
+        conf: float = 0.25,
+        iou: float = 0.7,
+        poly_points=None,
+        frame_ts: float = None,
+        entry_rois: dict = None,
+        profile_id: str = None,
+    ) -> dict:
+        if self._worker is None:
+            raise RuntimeError("DynamicBatcher no iniciado (llama a start()).")
+
+        fut = asyncio.get_running_loop().create_future()
+        item = {
+            "image_bytes": image_bytes,
+            "source_name": source_name,
+            "poly_points": poly_points,
+            "frame_ts": frame_ts,
+            "entry_rois": entry_rois,
+            "profile_id": profile_id,
+            "key": (float(conf), float(iou)),
+            "future": fut,
+        }
+        await self._queue.put(item)
+        return await fut
+
+    def _place(self, it: dict, batch: list, keys: dict, parked: set):
+        src = it["source_name"] if it["frame_ts"] is not None else None
+        ok = len(batch) < self.max_batch_size
+        if ok and src is not None:
+            ok = src not in self._busy and src not in parked and keys.setdefault(src, it["key"]) == it["key"]
+        if ok:
+            batch.append(it)
+        else:
+            # Aparcado; lo que llegue después de esa fuente, detrás
+            self._pending.append(it)
+            if src is not None:
+                parked.add(src)
+
+    async def _collect(self) -> list:
+        batch, keys, parked = [], {}, set()
+        while True:
+            # Primero lo aparcado, en orden. Si nada puede salir, esperar a otra
+            # petición o a que termine un lote (_dispatch deja un None en la cola)
+            held, self._pending = self._pending, deque()
+            parked.clear()
+            for it in held:
+                self._place(it, batch, keys, parked)
+            if batch:
+                break
+            it = await self._queue.get()
+            if it is not None:
+                self._pending.append(it)
+
+        deadline = time.monotonic() + self.max_latency_s
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                it = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+            if it is not None:
+                self._place(it, batch, keys, parked)
+        return batch
+
+    async def _run(self):
+        while True:
+            # Esperar réplica libre ANTES de cerrar el lote: mientras todas
+            # están ocupadas la cola sigue creciendo y el siguiente lote sale más lleno.
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+
+            groups = {}
+            for it in batch:
+                groups.setdefault(it["key"], []).append(it)
+            sources = {it["source_name"] for it in batch if it["frame_ts"] is not None}
+            self._busy |= sources
+
+            task = asyncio.create_task(self._dispatch(list(groups.items()), sources))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, groups, sources: set):
+        loop = asyncio.get_running_loop()
+        try:
+            for (conf, iou), items in groups:
+                try:
+                    results = await loop.run_in_executor(
+                        self._executor, self.controller.analyze_batch, items, conf, iou
+                    )
+                except Exception as ex:
+                    results = [ex] * len(items)
+
+                self.stats["batches"] += 1
+                self.stats["items"] += len(items)
+                self.stats["max_batch"] = max(self.stats["max_batch"], len(items))
+
+                for it, r in zip(items, results):
+                    fut = it["future"]
+                    if fut.done():
+                        continue
+                    if isinstance(r, Exception):
+                        self.stats["errors"] += 1
+                        fut.set_exception(r)
+                    else:
+                        fut.set_result(r)
+        finally:
+            self._busy -= sources
+            if self._pending:
+                self._queue.put_nowait(None)
+            self._slots.release()
+
+    def snapshot(self) -> dict:
+        s = dict(self.stats)
+        s["avg_batch"] = (s["items"] / s["batches"]) if s["batches"] else 0.0
+        s["queued"] = self._queue.qsize() if self._queue is not None else 0
+        s["parked"] = len(self._pending)
+        s["pool"] = self.controller.pool.snapshot()
+        s["buffers"] = self.controller.buffers.snapshot()
+        s["encoder"] = self.controller.encoder.snapshot()
+        if self.controller.profiling is not None:
+            s["profiling"] = self.controller.profiling.snapshot()
+        if self.controller.change_gate is not None:
+            s["change_gate"] = self.controller.change_gate.snapshot()
+        return s
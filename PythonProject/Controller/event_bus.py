@@ -0,0 +1,71 @@
+import time
+import threading
+from collections import deque
+
+
+class Subscription:
+    """
+    Cola acotada de un suscriptor. Si no la vacía a tiempo se descartan los
+    eventos más viejos: quien publica nunca espera al que consume.
+    """
+
+    def __init__(self, bus, topics=None, maxsize: int = 1024):
+        self.bus = bus
+        self.topics = set(topics) if topics else None
+        self.queue = deque(maxlen=max(1, int(maxsize)))
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def _push(self, event: dict):
+        with self._lock:
+            if len(self.queue) == self.queue.maxlen:
+                self.dropped += 1
+            self.queue.append(event)
+
+    def drain(self) -> list:
+        """
+        Todos los eventos pendientes de una vez (para agregarlos juntos).
+        """
+        with self._lock:
+            events = list(self.queue)
+            self.queue.clear()
+        return events
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class EventBus:
+    """
+    Pub/sub en proceso para seguir el pipeline en vivo (dashboard, logs...).
+    publish() sin suscriptores no cuesta casi nada.
+
+    Evento: {"topic", "t" (epoch), "mono" (time.monotonic), "data"}.
+    """
+
+    def __init__(self):
+        self._subs = []
+        self._lock = threading.Lock()
+
+    @property
+    def has_subscribers(self) -> bool:
+        return bool(self._subs)
+
+    def subscribe(self, topics=None, maxsize: int = 1024) -> Subscription:
+        sub = Subscription(self, topics, maxsize)
+        with self._lock:
+            self._subs = self._subs + [sub]  # copia => publish itera sin lock
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            self._subs = [s for s in self._subs if s is not sub]
+
+    def publish(self, topic: str, data: dict):
+        subs = self._subs
+        if not subs:
+            return
+        event = {"topic": topic, "t": time.time(), "mono": time.monotonic(), "data": data}
+        for sub in subs:
+            if sub.topics is None or topic in sub.topics:
+                sub._push(event)
@@ -0,0 +1,76 @@
+import time
+from collections import deque
+
+
+class LiveStats:
+    """
+    Agrega los eventos "frame" del EventBus por cámara para el dashboard:
+    throughput, conteos por clase, traffic_state e historiales cortos
+    (ocupación por frame, FPS por refresco) para las sparklines.
+    """
+
+    def __init__(self, history: int = 120, fps_window_s: float = 10.0):
+        self.history = int(history)
+        self.fps_window_s = float(fps_window_s)
+        self.cameras = {}
+        self.frames = 0
+        self._done = deque()  # instantes (monotonic) de todos los frames en la ventana
+        self.fps_history = deque(maxlen=self.history)
+
+    def _camera(self, name: str) -> dict:
+        cam = self.cameras.get(name)
+        if cam is None:
+            cam = {
+                "frames": 0,
+                "skipped": 0,
+                "traffic_state": None,
+                "counts_by_class": {},
+                "occupancy": deque(maxlen=self.history),
+                "fps": deque(maxlen=self.history),
+                "_done": deque(),
+                "last": None,  # último frame: scene_id, rutas...
+            }
+            self.cameras[name] = cam
+        return cam
+
+    def update(self, events: list) -> set:
+        """
+        Aplica un lote de eventos; devuelve las cámaras que han cambiado.
+        """
+        changed = set()
+        for ev in events:
+            if ev["topic"] != "frame":
+                continue
+            d = ev["data"]
+            cam = self._camera(d["source_name"])
+            cam["frames"] += 1
+            cam["skipped"] += 1 if d.get("skipped_inference") else 0
+            cam["traffic_state"] = d.get("traffic_state_smoothed") or d.get("traffic_state")
+            cam["counts_by_class"] = d.get("counts_by_class") or {}
+            if d.get("road_occupancy") is not None:
+                cam["occupancy"].append(float(d["road_occupancy"]))
+            cam["_done"].append(ev["mono"])
+            cam["last"] = d
+            self._done.append(ev["mono"])
+            self.frames += 1
+            changed.add(d["source_name"])
+        return changed
+
+    def _fps(self, done: deque, now: float) -> float:
+        while done and done[0] < now - self.fps_window_s:
+            done.popleft()
+        return len(done) / self.fps_window_s
+
+    def sample(self, now: float = None) -> dict:
+        """
+        Una muestra por refresco del dashboard: FPS global y por cámara.
+        """
+        now = time.monotonic() if now is None else now
+        fps = self._fps(self._done, now)
+        self.fps_history.append(fps)
+        per_cam = {}
+        for name, cam in self.cameras.items():
+            cam_fps = self._fps(cam["_done"], now)
+            cam["fps"].append(cam_fps)
+            per_cam[name] = cam_fps
+        return {"fps": fps, "cameras": per_cam}
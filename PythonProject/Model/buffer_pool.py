@@ -0,0 +1,76 @@
+import threading
+from collections import defaultdict
+
+import numpy as np
+
+
+class BufferPool:
+    """
+    Arrays numpy reutilizables por (shape, dtype) para el bucle de frames:
+    máscaras, lienzos de mezcla, máscaras reescaladas... En régimen
+    estacionario (misma cámara => mismas formas) cada frame recupera los
+    buffers del anterior en vez de pedir memoria nueva.
+
+    acquire() NO limpia el contenido: quien lo pide lo sobrescribe entero.
+    max_bytes limita lo que se guarda libre (cámaras con muchas resoluciones);
+    lo que no cabe se suelta y lo recoge el GC.
+    """
+
+    def __init__(self, max_per_key: int = 4, max_bytes: int = 256 * 1024 * 1024):
+        self.max_per_key = int(max_per_key)
+        self.max_bytes = int(max_bytes)
+        self._free = defaultdict(list)
+        self._free_bytes = 0
+        self._lock = threading.Lock()
+
+        self._allocations = 0
+        self._reuses = 0
+        self._dropped = 0
+
+    @staticmethod
+    def _key(shape, dtype):
+        return tuple(int(s) for s in shape), np.dtype(dtype).str
+
+    def acquire(self, shape, dtype=np.uint8) -> np.ndarray:
+        key = self._key(shape, dtype)
+        with self._lock:
+            free = self._free.get(key)
+            if free:
+                arr = free.pop()
+                self._free_bytes -= arr.nbytes
+                self._reuses += 1
+                return arr
+            self._allocations += 1
+        return np.empty(key[0], dtype=key[1])
+
+    def release(self, arr: np.ndarray):
+        """
+        Devuelve un buffer obtenido con acquire (el array, no una vista suya).
+        """
+        if arr is None:
+            return
+        if arr.base is not None:
+            raise ValueError("Solo se pueden devolver buffers completos, no vistas.")
+        key = self._key(arr.shape, arr.dtype)
+        with self._lock:
+            free = self._free[key]
+            if len(free) >= self.max_per_key or self._free_bytes + arr.nbytes > self.max_bytes:
+                self._dropped += 1
+                return
+            free.append(arr)
+            self._free_bytes += arr.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._free.clear()
+            self._free_bytes = 0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "allocations": self._allocations,
+                "reuses": self._reuses,
+                "dropped": self._dropped,
+                "free_buffers": sum(len(v) for v in self._free.values()),
+                "free_bytes": self._free_bytes,
+            }
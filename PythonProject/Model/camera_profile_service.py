@@ -0,0 +1,224 @@
+import os
+import re
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+
+import cv2
+import numpy as np
+
+from Model.roi_mask_service import ROIMaskService
+
+_PROFILE_ID_RE = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+
+class CameraProfileService:
+    """
+    Perfiles de cámara en disco: polígono del segmento (+ ROIs de entrada),
+    tamaño de frame y artefactos precalculados:
+
+      profiles/<id>/profile.json   metadatos (frame_size, poly_points, crop_xyxy, road_area)
+      profiles/<id>/mask_crop.npy  máscara 0/255 recortada al bounding rect
+      profiles/<id>/sat.npy        tabla de áreas sumadas (integral) de mask>0
+      profiles/<id>/sizes/<h>x<w>/ lo mismo para otros tamaños de frame (caché derivada)
+
+    Los .npy se abren con mmap => se comparten entre análisis y procesos
+    sin recalcular polygon_mask ni sumas de área.
+    """
+
+    def __init__(self, base_dir: str = "profiles"):
+        self.base_dir = base_dir
+        os.makedirs(self.base_dir, exist_ok=True)
+        self._cache = {}  # profile_id => perfil base; (profile_id, h, w) => reescalado
+        self._lock = threading.Lock()
+        self._profile_locks = {}
+
+    def _profile_dir(self, profile_id: str) -> str:
+        if not profile_id or not _PROFILE_ID_RE.match(profile_id):
+            raise ValueError(f"profile_id inválido: {profile_id!r}")
+        return os.path.join(self.base_dir, profile_id)
+
+    def _lock_for(self, profile_id: str) -> threading.Lock:
+        with self._lock:
+            return self._profile_locks.setdefault(profile_id, threading.Lock())
+
+    @staticmethod
+    def _atomic_write(path: str, write):
+        # Temporal con nombre único en la misma carpeta: dos escritores a la
+        # vez no se pisan el temporal y os.replace sigue siendo atómico
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+    @classmethod
+    def _save_npy(cls, path: str, arr: np.ndarray):
+        cls._atomic_write(path, lambda f: np.save(f, arr))
+
+    @classmethod
+    def _save_json(cls, path: str, obj: dict):
+        data = json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+        cls._atomic_write(path, lambda f: f.write(data))
+
+    @staticmethod
+    def _crop_xyxy(points_xy, frame_h: int, frame_w: int):
+        # Igual que AppController: bounding_rect inclusivo => +1 en x2/y2
+        x1, y1, x2, y2 = ROIMaskService.bounding_rect(points_xy)
+        x1 = max(0, min(int(x1), frame_w - 1))
+        y1 = max(0, min(int(y1), frame_h - 1))
+        x2 = max(x1 + 1, min(int(x2) + 1, frame_w))
+        y2 = max(y1 + 1, min(int(y2) + 1, frame_h))
+        return [x1, y1, x2, y2]
+
+    @classmethod
+    def _artifacts(cls, poly_points, frame_h: int, frame_w: int):
+        crop_xyxy = cls._crop_xyxy(poly_points, frame_h, frame_w)
+        x1, y1, x2, y2 = crop_xyxy
+        # Máscara directamente en coords del crop (no hace falta la del frame completo)
+        shifted = [(x - x1, y - y1) for x, y in poly_points]
+        mask_crop = ROIMaskService.polygon_mask(y2 - y1, x2 - x1, shifted)
+        sat = cv2.integral((mask_crop > 0).astype(np.uint8))  # int32 (h+1, w+1)
+        return crop_xyxy, mask_crop, sat
+
+    def save(self, profile_id: str, frame_h: int, frame_w: int, poly_points, entry_rois: dict = None) -> dict:
+        """
+        Crea/reescribe el perfil y sus artefactos.
+        """
+        if not poly_points or len(poly_points) < 3:
+            raise ValueError("El perfil necesita un polígono de al menos 3 puntos.")
+
+        pdir = self._profile_dir(profile_id)
+        os.makedirs(pdir, exist_ok=True)
+
+        poly_points = [[int(x), int(y)] for x, y in poly_points]
+        crop_xyxy, mask_crop, sat = self._artifacts(poly_points, frame_h, frame_w)
+
+        with self._lock_for(profile_id):
+            self._save_npy(os.path.join(pdir, "mask_crop.npy"), mask_crop)
+            self._save_npy(os.path.join(pdir, "sat.npy"), sat)
+            self._save_json(os.path.join(pdir, "profile.json"), {
+                "profile_id": profile_id,
+                "frame_size": [int(frame_h), int(frame_w)],
+                "poly_points": poly_points,
+                "entry_rois": {k: [[int(x), int(y)] for x, y in v] for k, v in (entry_rois or {}).items()},
+                "crop_xyxy": crop_xyxy,
+                "road_area": int(sat[-1, -1]),
+            })
+            # Los reescalados del polígono anterior ya no sirven
+            shutil.rmtree(os.path.join(pdir, "sizes"), ignore_errors=True)
+            with self._lock:
+                for key in [k for k in self._cache if k == profile_id or (isinstance(k, tuple) and k[0] == profile_id)]:
+                    del self._cache[key]
+        return self.load(profile_id)
+
+    def load(self, profile_id: str, frame_h: int = None, frame_w: int = None) -> dict:
+        """
+        Devuelve el perfil con "mask_crop" y "sat" memory-mapped (solo lectura).
+        Si el frame tiene otro tamaño con la misma relación de aspecto, se
+        devuelve una versión reescalada (derivada siempre del polígono
+        guardado, que no se toca); con otra relación de aspecto, error.
+        """
+        pdir = self._profile_dir(profile_id)
+        meta_path = os.path.join(pdir, "profile.json")
+        if not os.path.exists(meta_path):
+            raise ValueError(f"No existe el perfil {profile_id!r}.")
+        mtime = os.path.getmtime(meta_path)
+
+        with self._lock:
+            cached = self._cache.get(profile_id)
+        if cached is None or cached["_mtime"] != mtime:
+            with open(meta_path, "rb") as f:
+                raw = f.read()
+            meta = json.loads(raw.decode("utf-8"))
+            meta["poly_points"] = [tuple(p) for p in meta["poly_points"]]
+            meta["entry_rois"] = {k: [tuple(p) for p in v] for k, v in meta.get("entry_rois", {}).items()}
+            meta["mask_crop"] = np.load(os.path.join(pdir, "mask_crop.npy"), mmap_mode="r")
+            meta["sat"] = np.load(os.path.join(pdir, "sat.npy"), mmap_mode="r")
+            meta["_mtime"] = mtime
+            meta["_digest"] = hashlib.sha256(raw).hexdigest()
+            with self._lock:
+                self._cache[profile_id] = meta
+            cached = meta
+
+        if frame_h is not None and frame_w is not None and tuple(cached["frame_size"]) != (frame_h, frame_w):
+            return self._rescaled(cached, int(frame_h), int(frame_w))
+        return cached
+
+    def _rescaled(self, profile: dict, frame_h: int, frame_w: int) -> dict:
+        """
+        Perfil para otro tamaño de frame. Sus artefactos se cachean aparte,
+        en profiles/<id>/sizes/<h>x<w>/, ligados al profile.json del que
+        salen (digest): el perfil guardado nunca se reescribe.
+        """
+        profile_id = profile["profile_id"]
+        key = (profile_id, frame_h, frame_w)
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached is not None and cached["_digest"] == profile["_digest"]:
+            return cached
+
+        old_h, old_w = profile["frame_size"]
+        sy, sx = frame_h / float(old_h), frame_w / float(old_w)
+        if abs(sx - sy) > 0.01 * max(sx, sy):
+            raise ValueError(
+                f"El perfil {profile_id!r} es para {old_w}x{old_h} y el frame es "
+                f"{frame_w}x{frame_h} (otra relación de aspecto): redefine el segmento."
+            )
+
+        def scale(pts):
+            return [(int(round(x * sx)), int(round(y * sy))) for x, y in pts]
+
+        sdir = os.path.join(self._profile_dir(profile_id), "sizes", f"{frame_h}x{frame_w}")
+        size_path = os.path.join(sdir, "size.json")
+        with self._lock_for(profile_id):
+            meta = None
+            if os.path.exists(size_path):
+                with open(size_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                if meta.get("source_digest") != profile["_digest"]:
+                    meta = None
+            if meta is None:
+                poly_points = scale(profile["poly_points"])
+                crop_xyxy, mask_crop, sat = self._artifacts(poly_points, frame_h, frame_w)
+                os.makedirs(sdir, exist_ok=True)
+                self._save_npy(os.path.join(sdir, "mask_crop.npy"), mask_crop)
+                self._save_npy(os.path.join(sdir, "sat.npy"), sat)
+                meta = {
+                    "source_digest": profile["_digest"],
+                    "frame_size": [frame_h, frame_w],
+                    "poly_points": [list(p) for p in poly_points],
+                    "entry_rois": {k: [list(p) for p in scale(v)] for k, v in profile["entry_rois"].items()},
+                    "crop_xyxy": crop_xyxy,
+                    "road_area": int(sat[-1, -1]),
+                }
+                self._save_json(size_path, meta)
+
+            scaled = {k: v for k, v in profile.items() if k not in ("mask_crop", "sat")}
+            scaled.update(
+                frame_size=meta["frame_size"],
+                poly_points=[tuple(p) for p in meta["poly_points"]],
+                entry_rois={k: [tuple(p) for p in v] for k, v in meta["entry_rois"].items()},
+                crop_xyxy=meta["crop_xyxy"],
+                road_area=meta["road_area"],
+                mask_crop=np.load(os.path.join(sdir, "mask_crop.npy"), mmap_mode="r"),
+                sat=np.load(os.path.join(sdir, "sat.npy"), mmap_mode="r"),
+            )
+        with self._lock:
+            self._cache[key] = scaled
+        return scaled
+
+    def list_profiles(self) -> list:
+        out = []
+        for name in sorted(os.listdir(self.base_dir)):
+            if os.path.exists(os.path.join(self.base_dir, name, "profile.json")):
+                out.append(name)
+        return out
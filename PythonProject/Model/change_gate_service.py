@@ -0,0 +1,102 @@
+import time
+import threading
+
+import cv2
+import numpy as np
+
+
+class ChangeGateService:
+    """
+    Puerta previa a YOLO para cámaras fijas: compara una versión reducida
+    (gris, enmascarada por la ROI) del crop con la del último frame
+    analizado. Si el cambio es menor que threshold se reutilizan sus
+    detecciones y métricas en lugar de llamar a predict.
+
+    threshold: diferencia media absoluta en niveles de gris (0-255)
+    refresh_every: fuerza un análisis real cada N frames saltados seguidos
+    max_age_s: ... o si la referencia tiene más de max_age_s segundos
+    """
+
+    def __init__(self, threshold: float = 3.0, side: int = 96, refresh_every: int = 30, max_age_s: float = 60.0):
+        self.threshold = threshold
+        self.side = side
+        self.refresh_every = refresh_every
+        self.max_age_s = max_age_s
+
+        self._lock = threading.Lock()
+        self._refs = {}
+        self._stats = {}
+
+    def signature(self, crop_bgr: np.ndarray, mask_crop: np.ndarray = None):
+        h, w = crop_bgr.shape[:2]
+        s = self.side / float(max(h, w))
+        size = (max(1, int(round(w * s))), max(1, int(round(h * s))))
+
+        small = cv2.resize(crop_bgr, size, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.float32)
+
+        m = None
+        if mask_crop is not None:
+            m = cv2.resize(mask_crop, size, interpolation=cv2.INTER_NEAREST) > 0
+            if not m.any():
+                m = None
+
+        # Quitamos la media (dentro de la ROI) para no disparar con cambios de exposición
+        vals = gray[m] if m is not None else gray
+        gray -= float(vals.mean()) if vals.size else 0.0
+        return gray, m
+
+    def check(self, key, crop_bgr: np.ndarray, mask_crop: np.ndarray = None, context=None) -> dict:
+        """
+        key: identifica la cámara (p.ej. source_name)
+        context: lo que debe coincidir para poder reutilizar (polígono, conf, iou...)
+        Devuelve {"skip": bool, "score": float|None, "ref": payload|None, "sig": firma}
+        """
+        sig = self.signature(crop_bgr, mask_crop)
+        now = time.monotonic()
+
+        with self._lock:
+            st = self._stats.setdefault(key, {"frames": 0, "skipped": 0})
+            st["frames"] += 1
+
+            ref = self._refs.get(key)
+            if ref is None or ref["context"] != context or ref["sig"][0].shape != sig[0].shape:
+                return {"skip": False, "score": None, "ref": None, "sig": sig, "reason": "sin_referencia"}
+
+            if ref["since"] >= self.refresh_every or (now - ref["t"]) > self.max_age_s:
+                return {"skip": False, "score": None, "ref": None, "sig": sig, "reason": "refresco"}
+
+            g, m = sig
+            diff = np.abs(g - ref["sig"][0])
+            if m is not None:
+                diff = diff[m]
+            score = float(diff.mean()) if diff.size else 0.0
+
+            if score < self.threshold:
+                ref["since"] += 1
+                st["skipped"] += 1
+                return {"skip": True, "score": score, "ref": ref["payload"], "sig": sig, "reason": "estatico"}
+
+            return {"skip": False, "score": score, "ref": None, "sig": sig, "reason": "cambio"}
+
+    def commit(self, key, sig, payload: dict, context=None):
+        """
+        Guarda el frame recién analizado como nueva referencia.
+        """
+        with self._lock:
+            self._refs[key] = {"sig": sig, "payload": payload, "context": context, "t": time.monotonic(), "since": 0}
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            per_key = {}
+            frames = skipped = 0
+            for k, st in self._stats.items():
+                per_key[str(k)] = {**st, "skip_rate": st["skipped"] / st["frames"] if st["frames"] else 0.0}
+                frames += st["frames"]
+                skipped += st["skipped"]
+            return {
+                "frames": frames,
+                "skipped": skipped,
+                "skip_rate": skipped / frames if frames else 0.0,
+                "per_source": per_key,
+            }
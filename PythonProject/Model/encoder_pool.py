@@ -0,0 +1,185 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+
+class EncoderPool:
+    """
+    Codificación JPEG/WebP en hilos de trabajo. cv2.imencode/imwrite sueltan el GIL,
+    así que varias imágenes se codifican de verdad en paralelo mientras el
+    hilo que llama sigue con lo suyo (métricas, result.json...).
+
+    Memoria acotada: submit() cuenta los bytes de las imágenes pendientes
+    (se referencian, no se copian) y espera si superan max_inflight_bytes.
+    Quien envía no debe modificar la imagen hasta que el futuro termine.
+    """
+
+    FORMATS = {"jpeg": ".jpg", "webp": ".webp"}
+    CONTENT_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp"}
+
+    def __init__(
+        self,
+        fmt: str = "jpeg",
+        quality: int = 90,
+        progressive: bool = False,
+        workers: int = None,
+        max_inflight_bytes: int = 256 * 2**20,
+    ):
+        """
+        fmt/quality/progressive: ajustes por defecto (cada submit puede cambiarlos).
+        quality: 1-100 (en WebP, > 100 => sin pérdidas).
+        workers: hilos de codificación (None => min(4, cores)).
+        """
+        self.fmt = self._check_fmt(fmt)
+        self.quality = int(quality)
+        self.progressive = bool(progressive)
+        self.workers = int(workers) if workers else min(4, os.cpu_count() or 1)
+        self.max_inflight_bytes = int(max_inflight_bytes)
+
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="encoder")
+        self._cond = threading.Condition()
+        self._inflight_bytes = 0
+        self._stats = {
+            "jobs": 0,
+            "waits": 0,  # submits que esperaron por el tope de memoria
+            "peak_inflight_bytes": 0,
+            "formats": {},
+        }
+
+    @classmethod
+    def _check_fmt(cls, fmt: str) -> str:
+        fmt = (fmt or "").lower()
+        if fmt == "jpg":
+            fmt = "jpeg"
+        if fmt not in cls.FORMATS:
+            raise ValueError(f"Formato de codificación inválido: {fmt!r} (jpeg | webp)")
+        return fmt
+
+    def ext(self, fmt: str = None) -> str:
+        return self.FORMATS[self._check_fmt(fmt or self.fmt)]
+
+    def content_type(self, fmt: str = None) -> str:
+        return self.CONTENT_TYPES[self._check_fmt(fmt or self.fmt)]
+
+    def _settings(self, fmt=None, quality=None, progressive=None):
+        fmt = self._check_fmt(fmt or self.fmt)
+        quality = self.quality if quality is None else int(quality)
+        progressive = self.progressive if progressive is None else bool(progressive)
+        if fmt == "jpeg":
+            params = [
+                cv2.IMWRITE_JPEG_QUALITY, max(1, min(100, quality)),
+                cv2.IMWRITE_JPEG_PROGRESSIVE, int(progressive),
+            ]
+        else:
+            params = [cv2.IMWRITE_WEBP_QUALITY, max(1, min(101, quality))]
+        return fmt, params
+
+    def _account(self, fmt: str, dt: float, bytes_in: int, bytes_out: int):
+        with self._cond:
+            st = self._stats["formats"].setdefault(fmt, {"images": 0, "encode_s": 0.0, "bytes_in": 0, "bytes_out": 0})
+            st["images"] += 1
+            st["encode_s"] += dt
+            st["bytes_in"] += bytes_in
+            st["bytes_out"] += bytes_out
+
+    def encode(self, img: np.ndarray, fmt: str = None, quality: int = None, progressive: bool = None) -> bytes:
+        """
+        Codifica en el hilo actual (lo que ejecutan los workers).
+        """
+        fmt, params = self._settings(fmt, quality, progressive)
+        t0 = time.perf_counter()
+        ok, buf = cv2.imencode(self.FORMATS[fmt], img, params)
+        dt = time.perf_counter() - t0
+        if not ok:
+            raise RuntimeError(f"No se pudo codificar la imagen en {fmt}.")
+        data = buf.tobytes()
+        self._account(fmt, dt, img.nbytes, len(data))
+        return data
+
+    def write(self, img: np.ndarray, path: str, fmt: str = None, quality: int = None,
+              progressive: bool = None) -> str:
+        """
+        Codifica directamente a fichero en el hilo actual (sin el JPEG entero
+        en memoria). Escritura atómica: nadie lee un fichero a medias.
+        """
+        fmt, params = self._settings(fmt, quality, progressive)
+        # imwrite elige el códec por la extensión del temporal
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp{self.FORMATS[fmt]}"
+        t0 = time.perf_counter()
+        ok = cv2.imwrite(tmp, img, params)
+        dt = time.perf_counter() - t0
+        if not ok:
+            raise RuntimeError(f"No se pudo guardar {os.path.basename(path)} en {fmt}.")
+        self._account(fmt, dt, img.nbytes, os.path.getsize(tmp))
+        os.replace(tmp, path)
+        return path
+
+    def _reserve(self, nbytes: int):
+        with self._cond:
+            # Una imagen mayor que el tope pasa sola (si no, no pasaría nunca)
+            if self._inflight_bytes and self._inflight_bytes + nbytes > self.max_inflight_bytes:
+                self._stats["waits"] += 1
+                while self._inflight_bytes and self._inflight_bytes + nbytes > self.max_inflight_bytes:
+                    self._cond.wait()
+            self._inflight_bytes += nbytes
+            self._stats["jobs"] += 1
+            self._stats["peak_inflight_bytes"] = max(self._stats["peak_inflight_bytes"], self._inflight_bytes)
+
+    def _unreserve(self, nbytes: int):
+        with self._cond:
+            self._inflight_bytes -= nbytes
+            self._cond.notify_all()
+
+    def _job(self, img, nbytes, path, settings):
+        try:
+            if path is None:
+                return self.encode(img, *settings)
+            return self.write(img, path, *settings)
+        finally:
+            self._unreserve(nbytes)
+
+    def submit(self, img: np.ndarray, path: str = None, fmt: str = None, quality: int = None,
+               progressive: bool = None):
+        """
+        Encola la codificación de img. Devuelve un Future con los bytes
+        codificados o, si se pasa path, con path una vez escrito.
+        Bloquea mientras las imágenes pendientes superen el tope de memoria:
+        desde un bucle asyncio, llamarlo con run_in_executor.
+        """
+        nbytes = int(img.nbytes)
+        self._reserve(nbytes)
+        try:
+            return self._executor.submit(self._job, img, nbytes, path, (fmt, quality, progressive))
+        except Exception:
+            self._unreserve(nbytes)
+            raise
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            formats = {}
+            for fmt, st in self._stats["formats"].items():
+                formats[fmt] = dict(
+                    st,
+                    encode_s=round(st["encode_s"], 4),
+                    mean_ms=round(1000 * st["encode_s"] / st["images"], 2) if st["images"] else None,
+                    mpix_per_s=round(st["bytes_in"] / 3 / 1e6 / st["encode_s"], 2) if st["encode_s"] else None,
+                )
+            return {
+                "workers": self.workers,
+                "fmt": self.fmt,
+                "quality": self.quality,
+                "progressive": self.progressive,
+                "inflight_bytes": self._inflight_bytes,
+                "max_inflight_bytes": self.max_inflight_bytes,
+                "jobs": self._stats["jobs"],
+                "waits": self._stats["waits"],
+                "peak_inflight_bytes": self._stats["peak_inflight_bytes"],
+                "formats": formats,
+            }
+
+    def close(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,229 @@
+import os
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+
+class HeatmapService:
+    """
+    Mapa de calor de ocupación por cámara: cada detección suma su huella
+    (bbox) en una rejilla float32 reducida (cell_px píxeles por celda).
+
+    La rejilla vive en un np.memmap en <base_dir>/<cámara>/<H>x<W>_c<celda>/grid.f32
+    => sobrevive a reinicios sin serializar nada, y cada resolución de la
+    cámara tiene la suya (render pinta la del tamaño del frame). Con half_life_s se aplica
+    decaimiento exponencial (ventana temporal "blanda"); sin él acumula.
+
+    La suma usa la imagen integral de las esquinas: cada caja añade +w en
+    (y1,x1), -w en (y1,x2), -w en (y2,x1), +w en (y2,x2) con np.add.at y
+    después un cumsum 2D => coste O(nº cajas + celdas), sin bucles por caja.
+
+    Como mucho max_open rejillas abiertas a la vez (LRU): la menos usada se
+    vuelca y se cierra; si vuelve a llegar se reabre desde disco. meta.json
+    se vuelca cada META_EVERY frames, al cerrar una rejilla y en flush()
+    (llamarlo al apagar: AppController.close).
+    """
+
+    META_EVERY = 100
+
+    def __init__(self, base_dir: str = "heatmaps", cell_px: int = 8, half_life_s: float = None,
+                 max_open: int = 64):
+        self.base_dir = base_dir
+        os.makedirs(self.base_dir, exist_ok=True)
+        self.cell_px = int(cell_px)
+        self.half_life_s = half_life_s
+        self.max_open = max(1, int(max_open))
+        self._maps = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _safe_name(camera: str) -> str:
+        return re.sub(r"[^A-Za-z0-9_.-]", "_", camera) or "_"
+
+    def _grid_dir(self, camera: str, image_h: int, image_w: int) -> str:
+        # Una rejilla por resolución (y tamaño de celda): un frame de otro
+        # tamaño abre la suya en vez de vaciar la de la cámara
+        return os.path.join(self.base_dir, self._safe_name(camera), f"{image_h}x{image_w}_c{self.cell_px}")
+
+    def _adopt_legacy(self, camera: str, image_h: int, image_w: int, gdir: str):
+        """
+        Rejillas de antes (<cámara>/grid.f32 sin carpeta por resolución): se
+        mueven a la suya si coinciden tamaño y celda.
+        """
+        cdir = os.path.join(self.base_dir, self._safe_name(camera))
+        meta_path = os.path.join(cdir, "meta.json")
+        grid_path = os.path.join(cdir, "grid.f32")
+        if not (os.path.exists(meta_path) and os.path.exists(grid_path)):
+            return
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if tuple(meta["image_size"]) != (image_h, image_w) or meta["cell_px"] != self.cell_px:
+            return
+        os.makedirs(gdir, exist_ok=True)
+        os.replace(grid_path, os.path.join(gdir, "grid.f32"))
+        os.replace(meta_path, os.path.join(gdir, "meta.json"))
+
+    def _open(self, camera: str, image_h: int, image_w: int) -> dict:
+        gh = (image_h + self.cell_px - 1) // self.cell_px
+        gw = (image_w + self.cell_px - 1) // self.cell_px
+        key = (camera, image_h, image_w)
+
+        with self._lock:
+            hm = self._maps.get(key)
+            if hm is not None:
+                self._maps.move_to_end(key)
+                return hm
+
+            gdir = self._grid_dir(camera, image_h, image_w)
+            if not os.path.isdir(gdir):
+                self._adopt_legacy(camera, image_h, image_w, gdir)
+            os.makedirs(gdir, exist_ok=True)
+            meta_path = os.path.join(gdir, "meta.json")
+            grid_path = os.path.join(gdir, "grid.f32")
+
+            if os.path.exists(meta_path):
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+            else:
+                meta = {"image_size": [image_h, image_w], "cell_px": self.cell_px, "grid_size": [gh, gw],
+                        "frames": 0, "last_t": None}
+            # w+ solo si no hay rejilla: nunca se vacía una existente
+            mode = "r+" if os.path.exists(grid_path) else "w+"
+            grid = np.memmap(grid_path, dtype=np.float32, mode=mode, shape=(gh, gw))
+
+            hm = {
+                "image_size": (image_h, image_w),
+                "grid": grid,
+                "meta": meta,
+                "meta_path": meta_path,
+                "lock": threading.Lock(),
+                "delta": np.zeros((gh + 1, gw + 1), dtype=np.float32),  # reutilizado
+                "closed": False,
+            }
+            self._maps[key] = hm
+            while len(self._maps) > self.max_open:
+                # Dentro de self._lock: si la cámara vuelve, se reabre ya volcada
+                self._close(self._maps.popitem(last=False)[1])
+            return hm
+
+    def _close(self, hm: dict):
+        with hm["lock"]:
+            if hm["closed"]:
+                return
+            hm["grid"].flush()
+            self._write_meta(hm)
+            hm["closed"] = True
+        # Sin más referencias, numpy libera el mapeo
+
+    def _acquire(self, camera: str, image_h: int, image_w: int) -> dict:
+        """
+        Rejilla abierta con su lock ya tomado (si otro hilo la ha cerrado
+        entretanto, se reabre).
+        """
+        while True:
+            hm = self._open(camera, image_h, image_w)
+            hm["lock"].acquire()
+            if not hm["closed"]:
+                return hm
+            hm["lock"].release()
+
+    def add(self, camera: str, detections: list, image_h: int, image_w: int, t: float = None, weight: float = 1.0):
+        """
+        Suma las huellas de las detecciones (formato AppController).
+        """
+        t = time.time() if t is None else float(t)
+        hm = self._acquire(camera, image_h, image_w)
+        try:
+            grid = hm["grid"]
+            gh, gw = grid.shape
+            meta = hm["meta"]
+            if self.half_life_s and meta["last_t"] is not None and t > meta["last_t"]:
+                grid *= np.float32(0.5 ** ((t - meta["last_t"]) / self.half_life_s))
+
+            if detections:
+                b = np.asarray([d["bbox_xyxy"] for d in detections], dtype=np.float32) / self.cell_px
+                x1 = np.clip(np.floor(b[:, 0]), 0, gw).astype(np.intp)
+                y1 = np.clip(np.floor(b[:, 1]), 0, gh).astype(np.intp)
+                x2 = np.clip(np.ceil(b[:, 2]), 0, gw).astype(np.intp)
+                y2 = np.clip(np.ceil(b[:, 3]), 0, gh).astype(np.intp)
+                ok = (x2 > x1) & (y2 > y1)
+                x1, y1, x2, y2 = x1[ok], y1[ok], x2[ok], y2[ok]
+
+                w = np.float32(weight)
+                delta = hm["delta"]
+                delta.fill(0)
+                np.add.at(delta, (y1, x1), w)
+                np.add.at(delta, (y1, x2), -w)
+                np.add.at(delta, (y2, x1), -w)
+                np.add.at(delta, (y2, x2), w)
+                grid += np.cumsum(np.cumsum(delta, axis=0), axis=1)[:gh, :gw]
+
+            meta["frames"] += 1
+            meta["last_t"] = t
+            # La rejilla ya está en el mmap; los metadatos se vuelcan de vez en cuando
+            if meta["frames"] % self.META_EVERY == 0 or meta["frames"] == 1:
+                self._write_meta(hm)
+        finally:
+            hm["lock"].release()
+
+    @staticmethod
+    def _write_meta(hm: dict):
+        tmp = hm["meta_path"] + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(hm["meta"], f)
+        os.replace(tmp, hm["meta_path"])
+
+    def flush(self):
+        """
+        Vuelca rejillas y metadatos a disco.
+        """
+        with self._lock:
+            maps = list(self._maps.values())
+        for hm in maps:
+            with hm["lock"]:
+                if hm["closed"]:
+                    continue
+                hm["grid"].flush()
+                self._write_meta(hm)
+
+    def grid(self, camera: str, image_h: int, image_w: int, t: float = None) -> np.ndarray:
+        """
+        Copia de la rejilla (con el decaimiento aplicado hasta t, sin modificarla).
+        """
+        hm = self._acquire(camera, image_h, image_w)
+        try:
+            g = np.array(hm["grid"], dtype=np.float32)
+            last_t = hm["meta"]["last_t"]
+        finally:
+            hm["lock"].release()
+        if self.half_life_s and t is not None and last_t is not None and t > last_t:
+            g *= np.float32(0.5 ** ((t - last_t) / self.half_life_s))
+        return g
+
+    def render(self, camera: str, img_bgr: np.ndarray, alpha: float = 0.5, road_mask=None) -> np.ndarray:
+        """
+        Overlay del mapa de calor sobre img_bgr, al estilo de
+        ROIMaskService.overlay_mask: solo se mezcla donde hay calor (y
+        dentro de road_mask si se pasa).
+        """
+        h, w = img_bgr.shape[:2]
+        g = self.grid(camera, h, w, t=time.time())
+        peak = float(g.max()) if g.size else 0.0
+        if peak <= 0:
+            return img_bgr.copy()
+
+        norm = (g * (255.0 / peak)).astype(np.uint8)
+        norm = cv2.resize(norm, (w, h), interpolation=cv2.INTER_LINEAR)
+        colored = cv2.applyColorMap(norm, cv2.COLORMAP_JET)
+
+        overlay = img_bgr.copy()
+        m = norm > 8
+        if road_mask is not None:
+            m &= road_mask > 0
+        overlay[m] = (overlay[m] * (1 - alpha) + colored[m] * alpha).astype(np.uint8)
+        return overlay
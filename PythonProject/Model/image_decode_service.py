@@ -0,0 +1,93 @@
+import struct
+
+import cv2
+import numpy as np
+
+# Escalas que libjpeg puede aplicar en la propia IDCT (sin decodificar a tamaño completo)
+_REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# Marcadores SOF (start of frame) con el tamaño de la imagen
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+class ImageDecodeService:
+    """
+    Capa de decodificación: tamaño de la imagen sin decodificarla y
+    decodificación reducida (1/2, 1/4, 1/8) de JPEG cuando el modelo va a
+    trabajar a menos resolución que la del crop.
+    """
+
+    @staticmethod
+    def is_jpeg(image_bytes: bytes) -> bool:
+        return len(image_bytes) > 3 and image_bytes[:3] == b"\xff\xd8\xff"
+
+    @staticmethod
+    def probe_jpeg_size(image_bytes: bytes):
+        """
+        (h, w) leyendo solo las cabeceras del JPEG; None si no se encuentra.
+        No tiene en cuenta la orientación EXIF (se corrige tras decodificar).
+        """
+        if not ImageDecodeService.is_jpeg(image_bytes):
+            return None
+        data = memoryview(image_bytes)
+        i, n = 2, len(image_bytes)
+        while i + 9 < n:
+            if data[i] != 0xFF:
+                return None
+            marker = data[i + 1]
+            if marker == 0xFF:  # relleno
+                i += 1
+                continue
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+                i += 2
+                continue
+            seg_len = struct.unpack(">H", data[i + 2:i + 4])[0]
+            if marker in _SOF_MARKERS:
+                h, w = struct.unpack(">HH", data[i + 5:i + 9])
+                return (int(h), int(w)) if h and w else None
+            if marker == 0xDA:  # empieza el scan sin SOF => no es un JPEG válido
+                return None
+            i += 2 + seg_len
+        return None
+
+    @staticmethod
+    def choose_scale(crop_h: int, crop_w: int, imgsz) -> int:
+        """
+        Mayor factor (1, 2, 4, 8) que deja el crop igual o por encima del
+        tamaño de inferencia: nunca se decodifica por debajo de lo que el
+        modelo va a usar.
+        """
+        target = max(imgsz) if isinstance(imgsz, (list, tuple)) else int(imgsz)
+        long_side = max(crop_h, crop_w)
+        scale = 1
+        for f in (2, 4, 8):
+            if long_side / f >= target:
+                scale = f
+        return scale
+
+    @staticmethod
+    def decode(image_bytes: bytes, scale: int = 1) -> np.ndarray:
+        arr = np.frombuffer(image_bytes, dtype=np.uint8)
+        img = cv2.imdecode(arr, _REDUCED_FLAGS.get(scale, cv2.IMREAD_COLOR))
+        if img is None:
+            raise ValueError("No se pudo decodificar la imagen.")
+        return img
+
+    @staticmethod
+    def full_size(decoded_shape, probe_hw, scale: int):
+        """
+        Tamaño real (h, w) del frame decodificado a 1/scale. Si la orientación
+        EXIF ha girado la imagen, la cabecera viene con h/w cambiados.
+        """
+        dh, dw = decoded_shape[:2]
+        if probe_hw is None:
+            return dh * scale, dw * scale
+        ph, pw = probe_hw
+        if (dh >= dw) != (ph >= pw) and ph != pw:
+            ph, pw = pw, ph
+        return ph, pw
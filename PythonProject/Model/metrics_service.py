@@ -19,9 +19,21 @@ def _clip_box_xyxy(b, w, h):
 
 class MetricsService:
     @staticmethod
-    def compute(detections: list, image_w: int, image_h: int, road_mask=None):
+    def compute(
+        detections: list,
+        image_w: int,
+        image_h: int,
+        road_mask=None,
+        mask_offset=(0, 0),
+        road_sat=None,
+        road_area=None,
+    ):
         """
-        road_mask: np.uint8 (H,W) con 0/255 (carretera definida por polígono)
+        road_mask: np.uint8 con 0/255 (carretera definida por polígono). Puede
+          ser la del frame completo o solo la del crop con su esquina en mask_offset=(x1, y1).
+        road_sat: tabla de áreas sumadas de road_mask>0 (cv2.integral) => cada
+          caja cuesta O(1) en vez de sumar píxeles.
+        road_area: píxeles de carretera precalculados (perfil de cámara).
         """
         # Global (por si quieres)
         counts_all = Counter([d["class_name"] for d in detections])
@@ -39,7 +51,10 @@ class MetricsService:
             }
 
         # Área de carretera (píxeles con mask>0)
-        road_area = int((road_mask > 0).sum())
+        if road_area is None:
+            road_area = int(road_sat[-1, -1]) if road_sat is not None else int((road_mask > 0).sum())
+        ox, oy = int(mask_offset[0]), int(mask_offset[1])
+        mh, mw = road_mask.shape[:2]
         if road_area <= 0:
             return {
                 "total_objects": 0,
@@ -53,8 +68,8 @@ class MetricsService:
         det_in = []
         for d in detections:
             cx, cy = _bbox_center_xyxy(d["bbox_xyxy"])
-            cx_i, cy_i = int(cx), int(cy)
-            if 0 <= cx_i < image_w and 0 <= cy_i < image_h and road_mask[cy_i, cx_i] > 0:
+            cx_i, cy_i = int(cx) - ox, int(cy) - oy
+            if 0 <= cx_i < mw and 0 <= cy_i < mh and road_mask[cy_i, cx_i] > 0:
                 det_in.append(d)
 
         counts_in = Counter([d["class_name"] for d in det_in])
@@ -63,9 +78,13 @@ class MetricsService:
         # Ocupación: cuántos píxeles de carretera quedan cubiertos por cajas (aprox real)
         covered = 0
         for d in det_in:
-            x1, y1, x2, y2 = _clip_box_xyxy(d["bbox_xyxy"], image_w, image_h)
+            b = d["bbox_xyxy"]
+            x1, y1, x2, y2 = _clip_box_xyxy([b[0] - ox, b[1] - oy, b[2] - ox, b[3] - oy], mw, mh)
             # contar píxeles de carretera dentro de la bbox
-            covered += int((road_mask[y1:y2, x1:x2] > 0).sum())
+            if road_sat is not None:
+                covered += int(road_sat[y2, x2] - road_sat[y1, x2] - road_sat[y2, x1] + road_sat[y1, x1])
+            else:
+                covered += int((road_mask[y1:y2, x1:x2] > 0).sum())
 
         road_occupancy = covered / float(road_area)
 
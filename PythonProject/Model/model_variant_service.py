@@ -0,0 +1,97 @@
+import os
+import re
+import json
+import time
+
+_VARIANT_RE = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+
+class ModelVariantService:
+    """
+    Registro de variantes de un modelo para CPU (FP16/INT8 con OpenVINO,
+    opcionalmente podadas), generadas con tools/quantize_model.py:
+
+      <variants_dir>/<stem del .pt>/<variante>/variant.json
+      <variants_dir>/<stem del .pt>/<variante>/<export de ultralytics>
+
+    variant.json guarda cómo se generó, sus métricas frente al FP32 y la
+    decisión de la puerta de precisión. Solo las aceptadas se pueden cargar.
+    """
+
+    # Cómo exportar cada precisión (kwargs de YOLO.export)
+    PRECISIONS = {
+        "fp32": {"format": "openvino"},
+        "fp16": {"format": "openvino", "half": True},
+        "int8": {"format": "openvino", "int8": True},
+    }
+
+    def __init__(self, variants_dir: str = None):
+        self.variants_dir = variants_dir or os.path.join("Yolo", "variants")
+
+    def variant_dir(self, model_path: str, name: str) -> str:
+        if not name or not _VARIANT_RE.match(name):
+            raise ValueError(f"Nombre de variante inválido: {name!r}")
+        stem = os.path.splitext(os.path.basename(model_path))[0]
+        return os.path.join(self.variants_dir, stem, name)
+
+    def save(self, model_path: str, name: str, info: dict) -> str:
+        vdir = self.variant_dir(model_path, name)
+        os.makedirs(vdir, exist_ok=True)
+        info = dict(info, name=name, source=os.path.basename(model_path),
+                    created_utc=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
+        path = os.path.join(vdir, "variant.json")
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(info, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+        return path
+
+    def load(self, model_path: str, name: str):
+        path = os.path.join(self.variant_dir(model_path, name), "variant.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            info = json.load(f)
+        # La ruta del export se guarda relativa a la carpeta de la variante
+        info["path"] = os.path.join(os.path.dirname(path), info["export"])
+        return info
+
+    def resolve(self, model_path: str, name: str) -> dict:
+        """
+        Variante lista para cargar; error si no existe o la puerta la rechazó.
+        """
+        info = self.load(model_path, name)
+        if info is None:
+            raise ValueError(
+                f"No existe la variante {name!r} de {os.path.basename(model_path)} "
+                f"(genérala con tools/quantize_model.py)."
+            )
+        if not info.get("gate", {}).get("accepted"):
+            reasons = "; ".join(info.get("gate", {}).get("reasons", [])) or "sin evaluar"
+            raise ValueError(f"La variante {name!r} no pasó la puerta de precisión: {reasons}")
+        if not os.path.exists(info["path"]):
+            raise ValueError(f"Falta el export de la variante {name!r}: {info['path']}")
+        return info
+
+    @staticmethod
+    def gate(baseline: dict, metrics: dict, max_map_drop: float = 0.01, max_count_error_increase: float = 0.02) -> dict:
+        """
+        Puerta de precisión frente al FP32 (baseline):
+          - mAP50-95 no puede caer más de max_map_drop (absoluto)
+          - el error relativo de conteo en held-out no puede subir más de
+            max_count_error_increase (absoluto)
+        """
+        reasons = []
+        map_drop = baseline["map50_95"] - metrics["map50_95"]
+        if map_drop > max_map_drop:
+            reasons.append(f"mAP50-95 cae {map_drop:.4f} (> {max_map_drop})")
+        count_inc = metrics["count_rel_error"] - baseline["count_rel_error"]
+        if count_inc > max_count_error_increase:
+            reasons.append(f"error de conteo sube {count_inc:.4f} (> {max_count_error_increase})")
+        return {
+            "accepted": not reasons,
+            "reasons": reasons,
+            "map_drop": round(map_drop, 5),
+            "count_error_increase": round(count_inc, 5),
+            "budget": {"max_map_drop": max_map_drop, "max_count_error_increase": max_count_error_increase},
+        }
@@ -0,0 +1,176 @@
+import os
+import re
+import json
+import math
+
+import cv2
+import numpy as np
+
+from Model.roi_mask_service import ROIMaskService
+from Model.image_decode_service import ImageDecodeService
+
+_SCENE_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class OverlayService:
+    """
+    Overlay de una escena: segmento coloreado + cajas cuyo centro cae en él.
+
+    Modo perezoso: la evidencia solo guarda original.jpg y result.json
+    (detecciones, polígono, crop); el overlay se pinta la primera vez que se
+    pide, al tamaño pedido, y se queda en la carpeta de la escena como caché
+    (overlay.jpg a tamaño completo, overlay_<lado>.jpg reducido; .webp si el
+    EncoderPool codifica en WebP).
+    """
+
+    MIN_SIDE = 64
+
+    def __init__(self, outputs_dir: str = "outputs", buffers=None, encoder=None):
+        self.outputs_dir = outputs_dir
+        self.buffers = buffers  # BufferPool opcional para máscara y lienzo
+        self.encoder = encoder  # EncoderPool opcional (formato/calidad del overlay)
+
+    @staticmethod
+    def cache_name(max_side: int = None, ext: str = ".jpg") -> str:
+        return f"overlay{ext}" if not max_side else f"overlay_{int(max_side)}{ext}"
+
+    @staticmethod
+    def original_path(scene_dir: str) -> str:
+        # original.jpg casi siempre; .webp si se recodificó una entrada no JPEG en WebP
+        for ext in (".jpg", ".webp"):
+            path = os.path.join(scene_dir, "original" + ext)
+            if os.path.exists(path):
+                return path
+        raise FileNotFoundError(f"La escena {os.path.basename(scene_dir)!r} no tiene imagen original.")
+
+    def _scene_dir(self, scene_id: str) -> str:
+        if not scene_id or not _SCENE_ID_RE.match(scene_id):
+            raise ValueError(f"scene_id inválido: {scene_id!r}")
+        scene_dir = os.path.join(self.outputs_dir, scene_id)
+        if not os.path.isdir(scene_dir):
+            raise ValueError(f"No existe la escena {scene_id!r}.")
+        return scene_dir
+
+    def _lease(self, shape, leased: list):
+        if self.buffers is None:
+            return np.empty(shape, dtype=np.uint8)
+        buf = self.buffers.acquire(shape, np.uint8)
+        leased.append(buf)
+        return buf
+
+    def draw(self, img_bgr: np.ndarray, detections: list, poly_points=None, crop_xyxy=None, road_mask=None,
+             scale: float = 1.0) -> np.ndarray:
+        """
+        Pinta EN img_bgr. Las coordenadas (polígono, crop, cajas) y road_mask
+        (máscara del crop) van a resolución completa; img_bgr puede ser una
+        versión reducida por scale (resolución completa / img_bgr).
+        """
+        leased = []
+        try:
+            if road_mask is not None and crop_xyxy is not None:
+                ih, iw = img_bgr.shape[:2]
+                x1, y1, x2, y2 = crop_xyxy
+                rx1, ry1 = int(x1 // scale), int(y1 // scale)
+                rx2, ry2 = min(iw, int(math.ceil(x2 / scale))), min(ih, int(math.ceil(y2 / scale)))
+                region = img_bgr[ry1:ry2, rx1:rx2]
+                rh, rw = region.shape[:2]
+                if rh > 0 and rw > 0:
+                    mask_r = road_mask
+                    if mask_r.shape[:2] != (rh, rw):
+                        mask_r = self._lease((rh, rw), leased)
+                        cv2.resize(np.asarray(road_mask), (rw, rh), dst=mask_r, interpolation=cv2.INTER_NEAREST)
+                    scratch = self._lease((rh, rw, 3), leased)
+                    ROIMaskService.overlay_mask_inplace(
+                        region, mask_r, alpha=0.35, color_bgr=(0, 0, 255), scratch=scratch
+                    )
+                edges = [(x / scale, y / scale) for x, y in poly_points or []]
+                ROIMaskService.draw_polygon_edges(
+                    img_bgr, edges, color_bgr=(0, 255, 0), thickness=max(1, int(round(3 / scale)))
+                )
+
+            # Cajas SOLO si el centro cae dentro de la máscara (si existe)
+            for d in detections:
+                bx1, by1, bx2, by2 = [int(v) for v in d["bbox_xyxy"]]
+                cx = int((bx1 + bx2) / 2)
+                cy = int((by1 + by2) / 2)
+
+                if road_mask is not None:
+                    mx, my = cx - crop_xyxy[0], cy - crop_xyxy[1]
+                    if not (0 <= mx < road_mask.shape[1] and 0 <= my < road_mask.shape[0] and road_mask[my, mx] > 0):
+                        continue
+
+                bx1, by1, bx2, by2 = [int(v / scale) for v in (bx1, by1, bx2, by2)]
+                cv2.rectangle(img_bgr, (bx1, by1), (bx2, by2), (255, 255, 0), 2)
+                cv2.putText(
+                    img_bgr,
+                    f"{d['class_name']} {d['conf']:.2f}",
+                    (bx1, max(0, by1 - 6)),
+                    cv2.FONT_HERSHEY_SIMPLEX,
+                    0.7,
+                    (255, 255, 0),
+                    2,
+                )
+            return img_bgr
+        finally:
+            if self.buffers is not None:
+                for buf in leased:
+                    self.buffers.release(buf)
+
+    def render(self, scene_id: str, max_side: int = None) -> str:
+        """
+        Ruta del overlay de la escena con el lado mayor <= max_side (None =>
+        resolución completa). Se pinta a partir de la imagen original +
+        result.json solo si no está ya en caché.
+        """
+        scene_dir = self._scene_dir(scene_id)
+        if max_side is not None:
+            max_side = max(self.MIN_SIDE, int(max_side))
+
+        with open(os.path.join(scene_dir, "result.json"), "r", encoding="utf-8") as f:
+            result = json.load(f)
+        h, w = int(result["image"]["height"]), int(result["image"]["width"])
+        if max_side is not None and max_side >= max(h, w):
+            max_side = None
+
+        ext = self.encoder.ext() if self.encoder is not None else ".jpg"
+        out_path = os.path.join(scene_dir, self.cache_name(max_side, ext))
+        if os.path.exists(out_path):
+            return out_path
+
+        with open(self.original_path(scene_dir), "rb") as f:
+            image_bytes = f.read()
+
+        # Decodificar ya reducido si el JPEG lo permite y terminar con resize exacto
+        factor = ImageDecodeService.choose_scale(h, w, max_side) if max_side else 1
+        img = ImageDecodeService.decode(image_bytes, factor)
+        if max_side and max(img.shape[:2]) > max_side:
+            r = max_side / float(max(img.shape[:2]))
+            size = (max(1, int(round(img.shape[1] * r))), max(1, int(round(img.shape[0] * r))))
+            img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+        scale = w / float(img.shape[1])
+
+        poly_points = result.get("poly_points")
+        crop_xyxy = result.get("crop_xyxy")
+        leased = []
+        try:
+            road_mask = None
+            if poly_points and len(poly_points) >= 3 and crop_xyxy:
+                x1, y1, x2, y2 = crop_xyxy
+                road_mask = ROIMaskService.polygon_mask_into(
+                    self._lease((y2 - y1, x2 - x1), leased), poly_points, offset=(-x1, -y1)
+                )
+            self.draw(img, result.get("detections", []), poly_points, crop_xyxy, road_mask, scale=scale)
+        finally:
+            if self.buffers is not None:
+                for buf in leased:
+                    self.buffers.release(buf)
+
+        if self.encoder is not None:
+            return self.encoder.submit(img, out_path).result()
+
+        # Escritura atómica: dos peticiones simultáneas no dejan un JPEG a medias
+        tmp = out_path + f".{os.getpid()}.tmp.jpg"
+        if not cv2.imwrite(tmp, img):
+            raise RuntimeError("No se pudo guardar el overlay.")
+        os.replace(tmp, out_path)
+        return out_path
@@ -0,0 +1,259 @@
+import os
+import sys
+import json
+import time
+import random
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource  # no existe en Windows
+except ImportError:
+    resource = None
+
+
+class ProfilingService:
+    """
+    Perfilado opcional de peticiones concretas: perfil de CPU (cProfile),
+    pico de memoria Python (tracemalloc) y RSS del proceso. Se guarda junto
+    a la evidencia de la escena, en <escena>/perf/, FUERA de result.json
+    (no cambia su hash):
+
+      perf/cpu.prof   pstats (snakeviz, python -m pstats...)
+      perf/perf.json  latencia, motivo, memoria, top funciones y top
+                      sitios de reserva
+
+    (perf y no profile: "perfil" ya son los perfiles de cámara)
+
+    Qué peticiones se guardan:
+      - sample_rate: fracción de peticiones muestreadas al azar
+      - slow_ms: cualquier petición que tarde más
+
+    Coste de slow_ms: no se sabe si una petición será lenta hasta que
+    acaba, así que con slow_ms se perfila TODA petición que encuentre el
+    perfilador libre. cProfile ralentiza el código Python (el de numpy,
+    cv2 y torch apenas) y tracemalloc, si está activo, cada reserva.
+
+    Solo una captura a la vez (tracemalloc.reset_peak es global al
+    proceso): con varias peticiones en paralelo, las que llegan con otra
+    captura en marcha van sin perfilar (stats["busy"]). Bajo carga se
+    pierden justo las peticiones lentas que se solapan: para perfilar
+    carga, mejor un sample_rate bajo (molesta y se salta poco) que slow_ms.
+
+    tracemalloc solo está activo durante la captura (si no lo había
+    arrancado ya otro, p.ej. PYTHONTRACEMALLOC).
+    """
+
+    ENV_VAR = "ROUNDABOUT_PROFILE"
+    DIR_NAME = "perf"
+
+    def __init__(self, sample_rate: float = 0.0, slow_ms: float = None, tracemalloc_frames: int = 0,
+                 top_n: int = 30):
+        """
+        tracemalloc_frames: profundidad de pila de tracemalloc (0 => sin
+          sitios de reserva ni pico Python, solo RSS).
+        """
+        self.sample_rate = max(0.0, min(1.0, float(sample_rate)))
+        self.slow_ms = float(slow_ms) if slow_ms is not None else None
+        self.tracemalloc_frames = int(tracemalloc_frames)
+        self.top_n = int(top_n)
+        if self.sample_rate <= 0 and self.slow_ms is None:
+            raise ValueError("ProfilingService sin sample_rate ni slow_ms no capturaría nada.")
+
+        self._busy = threading.Lock()
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "profiled": 0, "saved": 0, "busy": 0, "errors": 0}
+
+    @classmethod
+    def from_env(cls, environ=None):
+        """
+        ROUNDABOUT_PROFILE="sample=0.05,slow_ms=2000,tracemalloc=10,top=30"
+        Devuelve None si la variable no está (perfilado desactivado).
+        """
+        raw = (environ if environ is not None else os.environ).get(cls.ENV_VAR, "").strip()
+        if not raw:
+            return None
+        opts = {}
+        for part in raw.split(","):
+            key, _, value = part.partition("=")
+            opts[key.strip()] = value.strip()
+        known = {"sample", "slow_ms", "tracemalloc", "top"}
+        if set(opts) - known:
+            raise ValueError(f"{cls.ENV_VAR}: opciones desconocidas {sorted(set(opts) - known)} (válidas: {sorted(known)})")
+        return cls(
+            sample_rate=float(opts.get("sample", 0) or 0),
+            slow_ms=float(opts["slow_ms"]) if opts.get("slow_ms") else None,
+            tracemalloc_frames=int(opts.get("tracemalloc", 0) or 0),
+            top_n=int(opts.get("top", 30) or 30),
+        )
+
+    @staticmethod
+    def _rss():
+        # (RSS actual, pico de RSS del proceso) en bytes; None si no se sabe
+        now = peak = None
+        try:
+            with open("/proc/self/statm", "r") as f:
+                now = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            pass
+        if resource is not None:
+            # Linux da KB; macOS, bytes
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+        return now, peak
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    @contextmanager
+    def capture(self, kind: str):
+        """
+        Perfila el bloque. Produce una lista donde quien llama añade las
+        carpetas de escena generadas; al salir se guarda la captura en la
+        primera (si procede) y se referencia desde las demás.
+        """
+        self._count("requests")
+        scene_dirs = []
+        sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        if not sampled and self.slow_ms is None:
+            yield scene_dirs
+            return
+        if not self._busy.acquire(blocking=False):
+            self._count("busy")
+            yield scene_dirs
+            return
+
+        profiler = cProfile.Profile()
+        cap = {"kind": kind, "sampled": sampled, "t0": time.perf_counter(), "alloc_top": None, "profiler": profiler}
+        started_tracing = False
+        try:
+            if self.tracemalloc_frames > 0:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start(self.tracemalloc_frames)
+                    started_tracing = True
+                tracemalloc.reset_peak()
+                cap["traced_base"] = tracemalloc.get_traced_memory()[0]
+            cap["rss_before"] = self._rss()
+            self._local.capture = cap
+            try:
+                profiler.enable()
+            except ValueError:  # otro perfilador activo (p.ej. un depurador)
+                profiler = None
+            if profiler is None:
+                self._count("busy")
+                yield scene_dirs
+                return
+            try:
+                yield scene_dirs
+            finally:
+                profiler.disable()
+                cap["latency_ms"] = 1000 * (time.perf_counter() - cap["t0"])
+                self._count("profiled")
+                slow = self.slow_ms is not None and cap["latency_ms"] >= self.slow_ms
+                if scene_dirs and (sampled or slow):
+                    try:
+                        self._save(cap, profiler, scene_dirs)
+                    except OSError:
+                        # El análisis ya está guardado: un fallo del perfil no lo tumba
+                        self._count("errors")
+        finally:
+            if started_tracing:
+                # Entre capturas, sin el coste de tracemalloc en cada reserva
+                tracemalloc.stop()
+            self._local.capture = None
+            self._busy.release()
+
+    def _elapsed_ms(self, cap: dict) -> float:
+        return 1000 * (time.perf_counter() - cap["t0"])
+
+    def checkpoint(self, label: str):
+        """
+        Llamar con los datos del frame aún vivos (antes de liberarlos): si
+        esta captura ya va a guardarse, foto de tracemalloc con los sitios
+        de reserva. Sin captura activa no hace nada.
+        """
+        cap = getattr(self._local, "capture", None)
+        if cap is None or cap["alloc_top"] is not None or not tracemalloc.is_tracing():
+            return
+        if not (cap["sampled"] or (self.slow_ms is not None and self._elapsed_ms(cap) >= self.slow_ms)):
+            return
+        # La foto no debe salir en el perfil de CPU: se pausa y se anota aparte
+        t0 = time.perf_counter()
+        cap["profiler"].disable()
+        try:
+            snap = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+            ])
+            cap["alloc_label"] = label
+            cap["alloc_top"] = [
+                {
+                    "site": f"{st.traceback[0].filename}:{st.traceback[0].lineno}",
+                    "size_kb": round(st.size / 1024, 1),
+                    "count": st.count,
+                }
+                for st in snap.statistics("lineno")[: self.top_n]
+            ]
+        finally:
+            cap["profiler"].enable()
+            cap["snapshot_ms"] = 1000 * (time.perf_counter() - t0)
+
+    def _top_functions(self, profiler) -> list:
+        stats = pstats.Stats(profiler)
+        rows = []
+        for (filename, lineno, func), (cc, nc, tt, ct, _callers) in stats.stats.items():
+            rows.append({
+                "function": f"{filename}:{lineno}({func})",
+                "calls": nc,
+                "tottime_ms": round(1000 * tt, 3),
+                "cumtime_ms": round(1000 * ct, 3),
+            })
+        rows.sort(key=lambda r: r["tottime_ms"], reverse=True)
+        return rows[: self.top_n]
+
+    def _save(self, cap: dict, profiler, scene_dirs: list):
+        rss_before, peak_before = cap["rss_before"]
+        rss_after, peak_after = self._rss()
+        info = {
+            "kind": cap["kind"],
+            "reason": "sample" if cap["sampled"] else "slow",
+            "latency_ms": round(cap["latency_ms"], 2),
+            "slow_ms": self.slow_ms,
+            "scenes": [os.path.basename(os.path.normpath(d)) for d in scene_dirs],
+            "memory": {
+                "rss_mb": round(rss_after / 2**20, 1) if rss_after else None,
+                "rss_delta_mb": round((rss_after - rss_before) / 2**20, 1) if rss_after and rss_before else None,
+                "rss_peak_mb": round(peak_after / 2**20, 1) if peak_after else None,
+                # >0 => esta petición ha subido el máximo histórico del proceso
+                "rss_peak_growth_mb": round((peak_after - peak_before) / 2**20, 1) if peak_after else None,
+            },
+            "top_functions": self._top_functions(profiler),
+        }
+        if "traced_base" in cap:
+            _, peak = tracemalloc.get_traced_memory()
+            info["memory"]["py_peak_alloc_mb"] = round((peak - cap["traced_base"]) / 2**20, 2)
+            info["alloc_top"] = cap["alloc_top"]
+            info["alloc_snapshot_at"] = cap.get("alloc_label")
+            # Ya incluido en latency_ms (pero no en el perfil de CPU)
+            info["alloc_snapshot_ms"] = round(cap.get("snapshot_ms", 0.0), 2)
+
+        # Captura completa en la primera escena; el resto solo la referencia
+        first = os.path.join(scene_dirs[0], self.DIR_NAME)
+        os.makedirs(first, exist_ok=True)
+        profiler.dump_stats(os.path.join(first, "cpu.prof"))
+        for i, scene_dir in enumerate(scene_dirs):
+            pdir = os.path.join(scene_dir, self.DIR_NAME)
+            os.makedirs(pdir, exist_ok=True)
+            data = info if i == 0 else {"kind": info["kind"], "shared_with": info["scenes"][0]}
+            with open(os.path.join(pdir, "perf.json"), "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+        self._count("saved")
+
+    def snapshot(self) -> dict:
+        with self._stats_lock:
+            return dict(self.stats, sample_rate=self.sample_rate, slow_ms=self.slow_ms,
+                        tracemalloc=self.tracemalloc_frames > 0)
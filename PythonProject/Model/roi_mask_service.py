@@ -28,6 +28,54 @@ class ROIMaskService:
         overlay[m] = (overlay[m] * (1 - alpha) + colored[m] * alpha).astype(np.uint8)
         return overlay
 
+    @staticmethod
+    def polygon_mask_into(out: np.ndarray, points_xy, offset=(0, 0)):
+        """
+        Como polygon_mask pero sobre un buffer ya reservado (BufferPool).
+        offset se suma a los puntos: (-x1, -y1) => máscara en coords del crop.
+        """
+        out.fill(0)
+        if points_xy and len(points_xy) >= 3:
+            pts = np.array(points_xy, dtype=np.int32).reshape((-1, 1, 2))
+            cv2.fillPoly(out, [pts], 255, offset=(int(offset[0]), int(offset[1])))
+        return out
+
+    @staticmethod
+    def overlay_mask_inplace(
+        img_bgr: np.ndarray,
+        mask_0_255: np.ndarray,
+        alpha: float = 0.35,
+        color_bgr=(0, 0, 255),
+        offset=(0, 0),
+        scratch: np.ndarray = None,
+    ):
+        """
+        Igual que overlay_mask pero escribiendo en img_bgr y solo dentro del
+        rectángulo de la máscara (el bounding rect del polígono), cuya esquina
+        está en offset=(x, y). scratch: buffer uint8 (mh, mw, 3) reutilizable;
+        sin él se reserva uno del tamaño del rectángulo.
+        """
+        x, y = int(offset[0]), int(offset[1])
+        ih, iw = img_bgr.shape[:2]
+        mh, mw = mask_0_255.shape[:2]
+        # Recorte por si el rectángulo se sale de la imagen
+        x0, y0 = max(0, x), max(0, y)
+        x1, y1 = min(iw, x + mw), min(ih, y + mh)
+        if x1 <= x0 or y1 <= y0:
+            return img_bgr
+
+        region = img_bgr[y0:y1, x0:x1]
+        mask = mask_0_255[y0 - y:y1 - y, x0 - x:x1 - x]
+        if scratch is None:
+            scratch = np.empty_like(region)
+        else:
+            scratch = scratch[: y1 - y0, : x1 - x0]
+
+        scratch[:] = color_bgr
+        cv2.addWeighted(region, 1 - alpha, scratch, alpha, 0, dst=scratch)
+        cv2.copyTo(scratch, mask, region)
+        return img_bgr
+
     @staticmethod
     def draw_polygon_edges(img_bgr: np.ndarray, points_xy, color_bgr=(0, 255, 0), thickness=3):
         if points_xy and len(points_xy) >= 2:
@@ -0,0 +1,365 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import numpy as np
+
+STATES = ("FLUIDO", "DENSO", "ATASCO")
+DEFAULT_CLASSES = ("bus", "car", "cycle", "truck")
+
+
+def minute_dtype(n_classes: int) -> np.dtype:
+    """
+    Fila persistida por minuto y cámara (binario de tamaño fijo => un día
+    son 1440 filas que se leen con un solo np.fromfile).
+    """
+    return np.dtype([
+        ("t", "<i8"),  # inicio del minuto (epoch s)
+        ("n", "<i4"),  # nº de frames agregados
+        ("occ_sum", "<f4"),
+        ("occ_n", "<i4"),  # frames con ocupación (hay máscara)
+        ("occ_max", "<f4"),
+        ("total_sum", "<f4"),
+        ("counts_sum", "<f4", (n_classes,)),
+        ("state", "i1"),  # estado suavizado al cierre del minuto (-1 = sin dato)
+    ])
+
+
+class _Ring:
+    """
+    Buffer circular de tamaño fijo sobre un array estructurado de NumPy.
+    """
+
+    def __init__(self, dtype, capacity: int):
+        self.buf = np.zeros(capacity, dtype=dtype)
+        self.capacity = capacity
+        self.size = 0
+        self.head = 0  # siguiente posición a escribir
+
+    def append(self, row):
+        self.buf[self.head] = row
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def ordered(self):
+        # Vista cronológica (copia solo si el buffer ha dado la vuelta)
+        if self.size < self.capacity:
+            return self.buf[: self.size]
+        return np.concatenate([self.buf[self.head:], self.buf[: self.head]])
+
+
+class _CameraSeries:
+    def __init__(self, n_classes: int, raw_capacity: int, minute_capacity: int):
+        self.lock = threading.Lock()
+        self.raw = _Ring(
+            np.dtype([("t", "<f8"), ("occ", "<f4"), ("total", "<f4"), ("counts", "<f4", (n_classes,))]),
+            raw_capacity,
+        )
+        self.minutes = _Ring(minute_dtype(n_classes), minute_capacity)
+        self.cur = None  # minuto en curso (np.void)
+        self.state = None  # índice en STATES
+        self.closed = False  # desalojada del servicio (ver TimeSeriesService._get)
+
+
+class TimeSeriesService:
+    """
+    Serie temporal por cámara de counts_by_class y road_occupancy.
+
+    - Anillo de muestras crudas (rollup de 1 min) y anillo de minutos
+      (rollups de 5 min y 1 h) en memoria, ambos de tamaño fijo.
+    - Estado de tráfico suavizado con histéresis sobre la ocupación media del
+      último minuto (no salta FLUIDO/DENSO/ATASCO frame a frame).
+    - Los minutos cerrados se añaden a <base_dir>/<cámara>/<YYYYMMDD>.bin
+      para consultas históricas sin abrir los result.json de cada escena.
+    - Memoria acotada: como mucho max_cameras series en memoria (LRU; la
+      desalojada persiste su minuto en curso y, si vuelve, empieza con los
+      anillos vacíos; el histórico sigue en disco) y max_cached_days
+      ficheros de día en la caché de query().
+    """
+
+    THRESHOLDS = (0.20, 0.45)  # mismos cortes que MetricsService
+    WINDOWS = {"1m": 60, "5m": 300, "1h": 3600}
+
+    def __init__(
+        self,
+        base_dir: str = "timeseries",
+        classes=DEFAULT_CLASSES,
+        hysteresis: float = 0.03,
+        raw_capacity: int = 4096,
+        minute_capacity: int = 1440,
+        max_cameras: int = 256,
+        max_cached_days: int = 64,
+    ):
+        self.base_dir = base_dir
+        os.makedirs(self.base_dir, exist_ok=True)
+        self.classes = tuple(classes)
+        self.class_idx = {c: i for i, c in enumerate(self.classes)}
+        self.hysteresis = hysteresis
+        self.raw_capacity = raw_capacity
+        self.minute_capacity = minute_capacity
+        self.dtype = minute_dtype(len(self.classes))
+
+        self.max_cameras = max(1, int(max_cameras))
+        self.max_cached_days = max(1, int(max_cached_days))
+
+        self._series = OrderedDict()
+        self._lock = threading.Lock()
+        self._day_cache = OrderedDict()
+        self._day_lock = threading.Lock()
+
+    # ---------------- escritura ----------------
+
+    @staticmethod
+    def _safe_name(camera: str) -> str:
+        return re.sub(r"[^A-Za-z0-9_.-]", "_", camera) or "_"
+
+    def _get(self, camera: str) -> _CameraSeries:
+        with self._lock:
+            s = self._series.get(camera)
+            if s is None:
+                s = _CameraSeries(len(self.classes), self.raw_capacity, self.minute_capacity)
+                self._series[camera] = s
+                while len(self._series) > self.max_cameras:
+                    # Dentro de self._lock: si la cámara vuelve, su minuto ya está en disco
+                    old_camera, old = self._series.popitem(last=False)
+                    with old.lock:
+                        if old.cur is not None:
+                            self._close_minute(old_camera, old)
+                        old.closed = True
+            else:
+                self._series.move_to_end(camera)
+            return s
+
+    def _acquire(self, camera: str) -> _CameraSeries:
+        """
+        Serie de la cámara con su lock ya tomado (si otro hilo la ha
+        desalojado entretanto, se crea de nuevo).
+        """
+        while True:
+            s = self._get(camera)
+            s.lock.acquire()
+            if not s.closed:
+                return s
+            s.lock.release()
+
+    def add(self, camera: str, metrics: dict, t: float = None) -> dict:
+        """
+        Registra una muestra (métricas de un frame). Devuelve el estado
+        suavizado y los rollups actuales.
+        """
+        t = datetime.now(timezone.utc).timestamp() if t is None else float(t)
+        counts = np.zeros(len(self.classes), dtype=np.float32)
+        for name, n in (metrics.get("counts_by_class") or {}).items():
+            i = self.class_idx.get(name)
+            if i is not None:
+                counts[i] = n
+        occ = metrics.get("road_occupancy")
+        occ = np.nan if occ is None else float(occ)
+        total = float(metrics.get("total_objects") or 0)
+
+        s = self._acquire(camera)
+        try:
+            minute = int(t // 60) * 60
+            if s.cur is not None and int(s.cur["t"]) != minute:
+                self._close_minute(camera, s)
+            if s.cur is None:
+                s.cur = np.zeros((), dtype=self.dtype)
+                s.cur["t"] = minute
+                s.cur["state"] = -1
+
+            s.raw.append((t, occ, total, counts))
+            c = s.cur
+            c["n"] += 1
+            c["total_sum"] += total
+            c["counts_sum"] += counts
+            if not np.isnan(occ):
+                c["occ_sum"] += occ
+                c["occ_n"] += 1
+                c["occ_max"] = max(float(c["occ_max"]), occ)
+
+            rollups = self._rollups(s, t)
+            self._update_state(s, rollups["1m"]["road_occupancy"])
+            c["state"] = -1 if s.state is None else s.state
+            return {"traffic_state_smoothed": self.state_name(s.state), "rollups": rollups}
+        finally:
+            s.lock.release()
+
+    def _close_minute(self, camera: str, s: _CameraSeries):
+        row = s.cur.copy()
+        s.minutes.append(row)
+        s.cur = None
+
+        day = datetime.fromtimestamp(int(row["t"]), tz=timezone.utc).strftime("%Y%m%d")
+        cdir = os.path.join(self.base_dir, self._safe_name(camera))
+        os.makedirs(cdir, exist_ok=True)
+        path = os.path.join(cdir, f"{day}.bin")
+        with open(path, "ab") as f:
+            f.write(row.tobytes())
+        with self._day_lock:
+            self._day_cache.pop(path, None)
+
+    def flush(self):
+        """
+        Cierra y persiste los minutos en curso (al apagar).
+        """
+        with self._lock:
+            items = list(self._series.items())
+        for camera, s in items:
+            with s.lock:
+                if s.cur is not None and not s.closed:
+                    self._close_minute(camera, s)
+
+    # ---------------- estado suavizado ----------------
+
+    def _update_state(self, s: _CameraSeries, occ):
+        if occ is None:
+            return
+        lo, hi = self.THRESHOLDS
+        h = self.hysteresis
+        raw = 0 if occ < lo else (1 if occ < hi else 2)
+        if s.state is None:
+            s.state = raw
+            return
+        # Subir exige pasar el corte + h; bajar exige quedar por debajo del corte - h
+        if s.state == 0 and occ >= lo + h:
+            s.state = 1 if occ < hi + h else 2
+        elif s.state == 1:
+            if occ >= hi + h:
+                s.state = 2
+            elif occ < lo - h:
+                s.state = 0
+        elif s.state == 2 and occ < hi - h:
+            s.state = 1 if occ >= lo - h else 0
+
+    @staticmethod
+    def state_name(idx):
+        return None if idx is None or idx < 0 else STATES[idx]
+
+    # ---------------- rollups ----------------
+
+    def _summary(self, n, occ_sum, occ_n, occ_max, total_sum, counts_sum) -> dict:
+        n, occ_n = int(n), int(occ_n)
+        return {
+            "frames": int(n),
+            "road_occupancy": (float(occ_sum) / occ_n) if occ_n else None,
+            "road_occupancy_max": float(occ_max) if occ_n else None,
+            "total_objects": (float(total_sum) / n) if n else None,
+            "counts_by_class": {c: float(v) / n for c, v in zip(self.classes, counts_sum)} if n else {},
+        }
+
+    def _rollups(self, s: _CameraSeries, now: float) -> dict:
+        out = {}
+
+        # 1 min: muestras crudas
+        raw = s.raw.ordered()
+        i0 = np.searchsorted(raw["t"], now - self.WINDOWS["1m"], side="right")
+        r = raw[i0:]
+        occ = r["occ"][~np.isnan(r["occ"])]
+        out["1m"] = self._summary(
+            len(r),
+            occ.sum(),
+            len(occ),
+            occ.max() if len(occ) else 0.0,
+            r["total"].sum(),
+            r["counts"].sum(axis=0) if len(r) else np.zeros(len(self.classes)),
+        )
+
+        # 5 min / 1 h: minutos cerrados + minuto en curso
+        mins = s.minutes.ordered()
+        for key in ("5m", "1h"):
+            j0 = np.searchsorted(mins["t"], now - self.WINDOWS[key], side="right")
+            m = mins[j0:]
+            c = s.cur
+            out[key] = self._summary(
+                m["n"].sum() + c["n"],
+                m["occ_sum"].sum() + c["occ_sum"],
+                m["occ_n"].sum() + c["occ_n"],
+                max(float(m["occ_max"].max()) if len(m) else 0.0, float(c["occ_max"])),
+                m["total_sum"].sum() + c["total_sum"],
+                m["counts_sum"].sum(axis=0) + c["counts_sum"],
+            )
+        return out
+
+    def rollups(self, camera: str, now: float = None) -> dict:
+        now = datetime.now(timezone.utc).timestamp() if now is None else now
+        with self._lock:
+            s = self._series.get(camera)  # consultar no crea (ni desaloja) series
+        if s is None:
+            return {"traffic_state_smoothed": None, "rollups": None}
+        with s.lock:
+            if s.cur is None or s.closed:
+                return {"traffic_state_smoothed": self.state_name(s.state), "rollups": None}
+            return {"traffic_state_smoothed": self.state_name(s.state), "rollups": self._rollups(s, now)}
+
+    # ---------------- histórico ----------------
+
+    def _load_day(self, path: str) -> np.ndarray:
+        if not os.path.exists(path):
+            return np.zeros(0, dtype=self.dtype)
+        size = os.path.getsize(path)
+        with self._day_lock:
+            cached = self._day_cache.get(path)
+            if cached is not None and cached[0] == size:
+                self._day_cache.move_to_end(path)
+                return cached[1]
+        arr = np.fromfile(path, dtype=self.dtype, count=size // self.dtype.itemsize)
+        with self._day_lock:
+            self._day_cache[path] = (size, arr)
+            self._day_cache.move_to_end(path)
+            while len(self._day_cache) > self.max_cached_days:
+                self._day_cache.popitem(last=False)
+        return arr
+
+    def query(self, camera: str, t_from: float, t_to: float, resolution: str = "1m") -> dict:
+        """
+        Histórico agregado a 1m / 5m / 1h entre t_from y t_to (epoch s).
+        Devuelve columnas (listas) listas para pintar.
+        """
+        step = {"1m": 60, "5m": 300, "1h": 3600}.get(resolution)
+        if step is None:
+            raise ValueError(f"Resolución no soportada: {resolution}")
+
+        cdir = os.path.join(self.base_dir, self._safe_name(camera))
+        days = []
+        d = int(t_from // 86400) * 86400
+        while d <= t_to:
+            day = datetime.fromtimestamp(d, tz=timezone.utc).strftime("%Y%m%d")
+            days.append(self._load_day(os.path.join(cdir, f"{day}.bin")))
+            d += 86400
+        rows = np.concatenate(days) if days else np.zeros(0, dtype=self.dtype)
+        rows = rows[(rows["t"] >= t_from) & (rows["t"] < t_to)]
+
+        if len(rows) == 0:
+            return {"t": [], "road_occupancy": [], "road_occupancy_max": [], "total_objects": [],
+                    "counts_by_class": {c: [] for c in self.classes}, "traffic_state": []}
+
+        bucket = (rows["t"] // step) * step
+        keys, inv = np.unique(bucket, return_inverse=True)
+        nb = len(keys)
+
+        def bsum(v):
+            return np.bincount(inv, weights=v, minlength=nb)
+
+        n = bsum(rows["n"].astype(np.float64))
+        occ_n = bsum(rows["occ_n"].astype(np.float64))
+        occ = np.where(occ_n > 0, bsum(rows["occ_sum"]) / np.maximum(occ_n, 1), np.nan)
+        occ_max = np.full(nb, -np.inf)
+        np.maximum.at(occ_max, inv, np.where(rows["occ_n"] > 0, rows["occ_max"], -np.inf))
+        total = bsum(rows["total_sum"]) / np.maximum(n, 1)
+        counts = {c: (bsum(rows["counts_sum"][:, i]) / np.maximum(n, 1)).tolist() for i, c in enumerate(self.classes)}
+
+        # Estado del bucket = el del último minuto del bucket (ya suavizado)
+        last = np.zeros(nb, dtype=np.int64)
+        np.maximum.at(last, inv, np.arange(len(rows)))  # filas en orden cronológico
+        states = [self.state_name(int(v)) for v in rows["state"][last]]
+
+        return {
+            "t": keys.tolist(),
+            "road_occupancy": [None if np.isnan(v) else float(v) for v in occ],
+            "road_occupancy_max": [None if np.isinf(v) else float(v) for v in occ_max],
+            "total_objects": total.tolist(),
+            "counts_by_class": counts,
+            "traffic_state": states,
+        }
@@ -0,0 +1,391 @@
+import threading
+from collections import deque
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+
+def _xyxy_to_cxcywh(b):
+    w = b[:, 2] - b[:, 0]
+    h = b[:, 3] - b[:, 1]
+    return np.stack([b[:, 0] + w / 2.0, b[:, 1] + h / 2.0, w, h], axis=1)
+
+
+def _cxcywh_to_xyxy(s):
+    hw = s[:, 2] / 2.0
+    hh = s[:, 3] / 2.0
+    return np.stack([s[:, 0] - hw, s[:, 1] - hh, s[:, 0] + hw, s[:, 1] + hh], axis=1)
+
+
+def _iou_pairs(a, b):
+    """
+    IoU elemento a elemento entre a[i] y b[i] (ambos (K,4) xyxy).
+    """
+    ix1 = np.maximum(a[:, 0], b[:, 0])
+    iy1 = np.maximum(a[:, 1], b[:, 1])
+    ix2 = np.minimum(a[:, 2], b[:, 2])
+    iy2 = np.minimum(a[:, 3], b[:, 3])
+    inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a + area_b - inter, 1e-9)
+
+
+def _candidate_pairs(tr, de):
+    """
+    Pares (track, det) cuyas cajas se solapan en x, sin construir la matriz N*M:
+    tracks ordenados por x1 + searchsorted => coste ~ (N + M) log N + nº pares.
+    """
+    if len(tr) == 0 or len(de) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    order = np.argsort(tr[:, 0], kind="stable")
+    x1s = tr[order, 0]
+    max_w = float((tr[:, 2] - tr[:, 0]).max())
+
+    lo = np.searchsorted(x1s, de[:, 0] - max_w, side="left")
+    hi = np.searchsorted(x1s, de[:, 2], side="left")
+    n = np.maximum(hi - lo, 0)
+    total = int(n.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    det_idx = np.repeat(np.arange(len(de)), n)
+    # posición dentro de cada rango [lo, hi)
+    offs = np.arange(total) - np.repeat(np.cumsum(n) - n, n)
+    trk_idx = order[np.repeat(lo, n) + offs]
+    return trk_idx, det_idx
+
+
+class _KalmanBoxes:
+    """
+    Kalman de velocidad constante sobre (cx, cy, w, h), vectorizado para
+    todos los tracks. Cada coordenada es un bloque 2x2 (posición, velocidad)
+    independiente; se guardan solo sus 3 términos (pp, pv, vv).
+    """
+
+    # Desviaciones relativas al alto de la caja (por segundo de dt)
+    STD_POS = 1.0 / 20
+    STD_VEL = 1.0 / 4
+
+    @classmethod
+    def init(cls, z):
+        n = len(z)
+        x = np.zeros((n, 4, 2), dtype=np.float64)
+        x[:, :, 0] = z
+        scale = np.maximum(z[:, 3:4], 1.0)  # ruido proporcional al alto de la caja
+        P = np.zeros((n, 4, 3), dtype=np.float64)
+        P[:, :, 0] = (2 * cls.STD_POS * scale) ** 2
+        P[:, :, 2] = (4 * cls.STD_VEL * scale) ** 2
+        return x, P
+
+    @classmethod
+    def predict(cls, x, P, dt=1.0):
+        if len(x) == 0:
+            return x, P
+        scale = np.maximum(x[:, 3:4, 0], 1.0)
+        q_p = dt * (cls.STD_POS * scale) ** 2
+        q_v = dt * (cls.STD_VEL * scale) ** 2
+        x = x.copy()
+        x[:, :, 0] += dt * x[:, :, 1]
+        pp, pv, vv = P[:, :, 0], P[:, :, 1], P[:, :, 2]
+        P = np.stack([pp + 2 * dt * pv + dt * dt * vv + q_p, pv + dt * vv, vv + q_v], axis=2)
+        return x, P
+
+    @classmethod
+    def update(cls, x, P, z):
+        scale = np.maximum(z[:, 3:4], 1.0)
+        r = (cls.STD_POS * scale) ** 2
+        pp, pv, vv = P[:, :, 0], P[:, :, 1], P[:, :, 2]
+        s = pp + r
+        k_p = pp / s
+        k_v = pv / s
+        y = z - x[:, :, 0]
+        x = x.copy()
+        x[:, :, 0] += k_p * y
+        x[:, :, 1] += k_v * y
+        P = np.stack([(1 - k_p) * pp, (1 - k_p) * pv, vv - k_v * pv], axis=2)
+        return x, P
+
+
+class TrackingService:
+    """
+    Tracker incremental estilo ByteTrack (IoU + Kalman) para secuencias de
+    frames de una misma cámara. Asigna IDs persistentes y emite eventos de
+    entrada/salida y tiempo de permanencia por ROI.
+
+    rois: dict nombre -> máscara uint8 (H,W) 0/255 (ROIMaskService.polygon_mask)
+    frame_size: (H, W) de los frames para los que se crearon las máscaras
+    """
+
+    def __init__(
+        self,
+        rois: dict = None,
+        high_conf: float = 0.5,
+        low_conf: float = 0.1,
+        match_iou: float = 0.2,
+        max_age_s: float = 2.0,
+        min_hits: int = 2,
+        flow_window_s: float = 60.0,
+        dense_limit: int = 4096,
+        frame_size: tuple = None,
+    ):
+        self.rois = dict(rois or {})
+        self.frame_size = frame_size
+        self.roi_names = list(self.rois.keys())
+        self.high_conf = high_conf
+        self.low_conf = low_conf
+        self.match_iou = match_iou
+        self.max_age_s = max_age_s
+        self.min_hits = min_hits
+        self.flow_window_s = flow_window_s
+        self.dense_limit = dense_limit
+
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self._last_t = None
+
+        # Estado de tracks en arrays (columnas paralelas)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.x = np.zeros((0, 4, 2))
+        self.P = np.zeros((0, 4, 3))
+        self.hits = np.empty(0, dtype=np.int64)
+        self.last_seen = np.empty(0, dtype=np.float64)
+        self.cls = []
+        self.inside = np.zeros((0, len(self.roi_names)), dtype=bool)
+        self.enter_t = np.full((0, len(self.roi_names)), np.nan)
+        # Visto alguna vez fuera de cada ROI: sin eso, estar dentro no es "entrar"
+        self.seen_out = np.zeros((0, len(self.roi_names)), dtype=bool)
+
+        self.totals = {n: {"entries": 0, "exits": 0, "dwell_s_sum": 0.0} for n in self.roi_names}
+        self._entry_times = {n: deque() for n in self.roi_names}
+
+    # ---------------- asociación ----------------
+
+    def _match(self, trk_boxes, det_boxes):
+        """
+        Devuelve (pares [(ti, di)], tracks_sin_match, dets_sin_match).
+        Escenas pequeñas: matriz densa + una sola asignación húngara.
+        Escenas grandes: solo pares candidatos y asignación por componente
+        conexa (los coches de lados opuestos de la rotonda no compiten).
+        """
+        nt, nd = len(trk_boxes), len(det_boxes)
+        if nt == 0 or nd == 0:
+            return [], np.arange(nt), np.arange(nd)
+
+        if nt * nd <= self.dense_limit:
+            ti = np.repeat(np.arange(nt), nd)
+            di = np.tile(np.arange(nd), nt)
+        else:
+            ti, di = _candidate_pairs(trk_boxes, det_boxes)
+
+        iou = _iou_pairs(trk_boxes[ti], det_boxes[di]) if len(ti) else np.empty(0)
+        keep = iou >= self.match_iou
+        ti, di, iou = ti[keep], di[keep], iou[keep]
+
+        pairs = []
+        if len(ti):
+            if nt * nd <= self.dense_limit:
+                cost = np.full((nt, nd), 1e6)
+                cost[ti, di] = 1.0 - iou
+                r, c = linear_sum_assignment(cost)
+                ok = cost[r, c] < 1e6
+                pairs = list(zip(r[ok].tolist(), c[ok].tolist()))
+            else:
+                g = coo_matrix((np.ones(len(ti)), (ti, nt + di)), shape=(nt + nd, nt + nd))
+                _, labels = connected_components(g, directed=False)
+                comp = labels[ti]
+                order = np.argsort(comp, kind="stable")
+                ti, di, iou, comp = ti[order], di[order], iou[order], comp[order]
+                bounds = np.flatnonzero(np.diff(comp)) + 1
+                for s, e in zip(np.r_[0, bounds], np.r_[bounds, len(comp)]):
+                    if e - s == 1:
+                        pairs.append((int(ti[s]), int(di[s])))
+                        continue
+                    ut, inv_t = np.unique(ti[s:e], return_inverse=True)
+                    ud, inv_d = np.unique(di[s:e], return_inverse=True)
+                    cost = np.full((len(ut), len(ud)), 1e6)
+                    cost[inv_t, inv_d] = 1.0 - iou[s:e]
+                    r, c = linear_sum_assignment(cost)
+                    ok = cost[r, c] < 1e6
+                    pairs.extend(zip(ut[r[ok]].tolist(), ud[c[ok]].tolist()))
+
+        mt = np.zeros(nt, dtype=bool)
+        md = np.zeros(nd, dtype=bool)
+        for a, b in pairs:
+            mt[a] = True
+            md[b] = True
+        return pairs, np.flatnonzero(~mt), np.flatnonzero(~md)
+
+    # ---------------- ciclo por frame ----------------
+
+    def update(self, detections: list, t: float) -> dict:
+        """
+        detections: formato de AppController ({"bbox_xyxy","conf","class_name"})
+        t: instante del frame en segundos (monótono por cámara)
+        """
+        with self._lock:
+            return self._update(detections, float(t))
+
+    def _update(self, detections, t):
+        dt = 0.0 if self._last_t is None else min(max(t - self._last_t, 0.0), self.max_age_s)
+        self._last_t = t
+
+        if detections:
+            boxes = np.asarray([d["bbox_xyxy"] for d in detections], dtype=np.float64)
+            confs = np.asarray([d["conf"] for d in detections], dtype=np.float64)
+        else:
+            boxes = np.zeros((0, 4))
+            confs = np.zeros(0)
+        names = [d.get("class_name", "") for d in detections]
+
+        # dt en segundos: la velocidad es px/s y no depende del FPS (ni de frames saltados)
+        self.x, self.P = _KalmanBoxes.predict(self.x, self.P, dt=dt)
+        trk_boxes = _cxcywh_to_xyxy(self.x[:, :, 0])
+
+        high = np.flatnonzero(confs >= self.high_conf)
+        low = np.flatnonzero((confs >= self.low_conf) & (confs < self.high_conf))
+
+        # 1ª pasada: detecciones de alta confianza contra todos los tracks
+        pairs1, un_t, un_hd = self._match(trk_boxes, boxes[high])
+        matched = [(ti, high[di]) for ti, di in pairs1]
+
+        # 2ª pasada (ByteTrack): tracks sin match contra detecciones de baja confianza
+        pairs2, _, _ = self._match(trk_boxes[un_t], boxes[low])
+        matched += [(un_t[ti], low[di]) for ti, di in pairs2]
+
+        if matched:
+            ti = np.asarray([m[0] for m in matched], dtype=np.int64)
+            di = np.asarray([m[1] for m in matched], dtype=np.int64)
+            z = _xyxy_to_cxcywh(boxes[di])
+            self.x[ti], self.P[ti] = _KalmanBoxes.update(self.x[ti], self.P[ti], z)
+            self.hits[ti] += 1
+            self.last_seen[ti] = t
+            for a, b in zip(ti.tolist(), di.tolist()):
+                self.cls[a] = names[b]
+
+        # Nuevos tracks: solo detecciones de alta confianza sin asignar
+        new_d = high[un_hd]
+        if len(new_d):
+            x0, P0 = _KalmanBoxes.init(_xyxy_to_cxcywh(boxes[new_d]))
+            k = len(new_d)
+            self.ids = np.r_[self.ids, np.arange(self._next_id, self._next_id + k)]
+            self._next_id += k
+            self.x = np.concatenate([self.x, x0])
+            self.P = np.concatenate([self.P, P0])
+            self.hits = np.r_[self.hits, np.ones(k, dtype=np.int64)]
+            self.last_seen = np.r_[self.last_seen, np.full(k, t)]
+            self.cls.extend(names[i] for i in new_d.tolist())
+            self.inside = np.concatenate([self.inside, np.zeros((k, len(self.roi_names)), dtype=bool)])
+            self.enter_t = np.concatenate([self.enter_t, np.full((k, len(self.roi_names)), np.nan)])
+            self.seen_out = np.concatenate([self.seen_out, np.zeros((k, len(self.roi_names)), dtype=bool)])
+
+        events = self._roi_events(t)
+
+        # Purga de tracks perdidos (cuentan como salida de las ROIs en las que estaban)
+        dead = (t - self.last_seen) > self.max_age_s
+        if dead.any():
+            events += self._close(np.flatnonzero(dead))
+            alive = ~dead
+            self.ids = self.ids[alive]
+            self.x = self.x[alive]
+            self.P = self.P[alive]
+            self.hits = self.hits[alive]
+            self.last_seen = self.last_seen[alive]
+            self.cls = [c for c, a in zip(self.cls, alive.tolist()) if a]
+            self.inside = self.inside[alive]
+            self.enter_t = self.enter_t[alive]
+            self.seen_out = self.seen_out[alive]
+
+        return {"tracks": self._active_tracks(t), "events": events}
+
+    def _roi_events(self, t):
+        if not self.roi_names or len(self.ids) == 0:
+            return []
+
+        seen = self.last_seen == t
+        # Eventos solo de tracks confirmados y vistos en este frame
+        live = (self.hits >= self.min_hits) & seen
+        c = self.x[:, :2, 0]
+        pos = np.zeros_like(self.inside)
+        for j, name in enumerate(self.roi_names):
+            m = self.rois[name]
+            h, w = m.shape[:2]
+            cx = np.clip(c[:, 0].astype(np.int64), 0, w - 1)
+            cy = np.clip(c[:, 1].astype(np.int64), 0, h - 1)
+            pos[:, j] = m[cy, cx] > 0
+        # Fuera cuenta aunque el track aún no esté confirmado
+        self.seen_out |= seen[:, None] & ~pos
+
+        # Un track que ya estaba dentro al aparecer (aparcado, parado en la
+        # ROI) no entra hasta que salga y vuelva. Los no vistos en este
+        # frame mantienen el estado anterior.
+        now = self.inside.copy()
+        now[live] = pos[live] & (self.inside[live] | self.seen_out[live])
+
+        events = []
+        ent_t, ent_r = np.nonzero(now & ~self.inside)
+        for i, j in zip(ent_t.tolist(), ent_r.tolist()):
+            name = self.roi_names[j]
+            self.enter_t[i, j] = t
+            self.totals[name]["entries"] += 1
+            self._entry_times[name].append(t)
+            events.append({"event": "enter", "track_id": int(self.ids[i]), "roi": name, "t": t, "class_name": self.cls[i]})
+
+        ex_t, ex_r = np.nonzero(~now & self.inside)
+        events += self._emit_exits(ex_t, ex_r, np.full(len(ex_t), t))
+
+        self.inside = now
+        return events
+
+    def _emit_exits(self, rows, cols, ts):
+        events = []
+        for i, j, t in zip(rows.tolist(), cols.tolist(), ts.tolist()):
+            name = self.roi_names[j]
+            dwell = float(t - self.enter_t[i, j]) if not np.isnan(self.enter_t[i, j]) else None
+            self.totals[name]["exits"] += 1
+            if dwell is not None:
+                self.totals[name]["dwell_s_sum"] += dwell
+            self.enter_t[i, j] = np.nan
+            events.append({"event": "exit", "track_id": int(self.ids[i]), "roi": name, "t": t, "dwell_s": dwell, "class_name": self.cls[i]})
+        return events
+
+    def _close(self, rows):
+        # La salida se fecha en el último instante en que se vio el track
+        if not self.roi_names:
+            return []
+        r, c = np.nonzero(self.inside[rows])
+        events = self._emit_exits(rows[r], c, self.last_seen[rows[r]])
+        self.inside[rows] = False
+        return events
+
+    def _active_tracks(self, t):
+        ok = (self.hits >= self.min_hits) & (self.last_seen == t)
+        boxes = _cxcywh_to_xyxy(self.x[ok, :, 0])
+        return [
+            {"track_id": int(tid), "class_name": self.cls[i], "bbox_xyxy": [float(v) for v in b]}
+            for tid, i, b in zip(self.ids[ok].tolist(), np.flatnonzero(ok).tolist(), boxes)
+        ]
+
+    def flow(self, t: float = None) -> dict:
+        """
+        Flujo por ROI: vehículos/minuto en la ventana flow_window_s, totales
+        de entradas/salidas y permanencia media.
+        """
+        with self._lock:
+            t = self._last_t if t is None else t
+            out = {}
+            for name in self.roi_names:
+                q = self._entry_times[name]
+                while q and t is not None and q[0] < t - self.flow_window_s:
+                    q.popleft()
+                tot = self.totals[name]
+                out[name] = {
+                    "vehicles_per_min": len(q) * 60.0 / self.flow_window_s,
+                    "entries": tot["entries"],
+                    "exits": tot["exits"],
+                    "avg_dwell_s": (tot["dwell_s_sum"] / tot["exits"]) if tot["exits"] else None,
+                }
+            return out
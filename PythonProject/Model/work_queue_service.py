@@ -0,0 +1,502 @@
+import os
+import json
+import time
+import uuid
+import errno
+import shutil
+import socket
+import hashlib
+
+
+class WorkQueueService:
+    """
+    Cola de trabajo sobre un sistema de ficheros compartido (NFS, SMB...)
+    para procesar archivos enteros de imágenes con varios workers en varias
+    máquinas. Todo el estado son ficheros en queue_dir:
+
+      queue.json                 metadatos (manifest, nº de unidades)
+      units/<unit>.json          items de la unidad (rutas + parámetros)
+      leases/<unit>.lease        lease vigente: worker, token, expires_at
+      attempts/<unit>.log        una línea por cada vez que se reclama
+      progress/<unit>.<n>.json   checkpoint del intento n (items ya hechos)
+      done/<unit>.json           resultado confirmado (lo escribe UN solo worker)
+      merged/<unit>.json         escenas ya movidas al almacén central
+      failed/<unit>.json         agotó max_attempts
+      staging/<worker>/          outputs_dir de cada worker (evidencias sin confirmar)
+
+    La exclusión mutua se basa en O_CREAT|O_EXCL y os.rename, que son
+    atómicos también en NFSv3+. Las leases caducan por reloj de pared: los
+    nodos deben tener la hora sincronizada (NTP) con holgura muy inferior a
+    lease_ttl_s.
+    """
+
+    DIRS = ("units", "leases", "attempts", "progress", "done", "merged", "failed", "staging")
+
+    def __init__(self, queue_dir: str, lease_ttl_s: float = 300.0, max_attempts: int = 5):
+        self.queue_dir = queue_dir
+        self.lease_ttl_s = float(lease_ttl_s)
+        self.max_attempts = int(max_attempts)
+        for d in self.DIRS:
+            os.makedirs(os.path.join(self.queue_dir, d), exist_ok=True)
+
+    def _path(self, kind: str, name: str) -> str:
+        return os.path.join(self.queue_dir, kind, name)
+
+    @staticmethod
+    def _write_json_atomic(path: str, obj: dict):
+        tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(obj, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _create_exclusive(path: str, obj: dict) -> bool:
+        """
+        Crea path solo si no existe (True si lo hemos creado nosotros).
+        """
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(obj, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        return True
+
+    @staticmethod
+    def _read_json(path: str):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            # ValueError: fichero a medio escribir por otro nodo => como si no estuviera
+            return None
+
+    @staticmethod
+    def default_worker_id() -> str:
+        return f"{socket.gethostname()}-{os.getpid()}"
+
+    def staging_dir(self, worker_id: str) -> str:
+        # outputs_dir del AppController de ese worker
+        path = self._path("staging", worker_id)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    # ---------------- manifest ----------------
+
+    @staticmethod
+    def read_manifest(manifest_path: str) -> list:
+        """
+        JSONL con un objeto por imagen ({"path", "source_name", "poly_points",
+        "profile_id", "frame_ts"}; solo "path" es obligatorio) o texto plano
+        con una ruta por línea.
+        """
+        items = []
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            for n, line in enumerate(f, 1):
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                if line.startswith("{"):
+                    item = json.loads(line)
+                    if "path" not in item:
+                        raise ValueError(f"Línea {n} del manifest sin 'path'.")
+                else:
+                    item = {"path": line}
+                items.append(item)
+        return items
+
+    def shard(self, manifest_path: str, unit_size: int = 100) -> dict:
+        """
+        Parte el manifest en unidades de unit_size imágenes. Es idempotente:
+        con el mismo manifest no hace nada; con otro distinto, error (la cola
+        ya tiene progreso de otro trabajo).
+        """
+        with open(manifest_path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+
+        meta_path = os.path.join(self.queue_dir, "queue.json")
+        meta = self._read_json(meta_path)
+        if meta is not None:
+            if meta["manifest_sha256"] != digest:
+                raise ValueError("La cola ya existe con otro manifest: usa otro queue_dir.")
+            return meta
+
+        items = self.read_manifest(manifest_path)
+        unit_size = max(1, int(unit_size))
+        units = []
+        for k in range(0, len(items), unit_size):
+            unit_id = f"u{k // unit_size:06d}"
+            self._write_json_atomic(
+                self._path("units", unit_id + ".json"),
+                {"unit_id": unit_id, "offset": k, "items": items[k:k + unit_size]},
+            )
+            units.append(unit_id)
+
+        meta = {
+            "manifest": os.path.abspath(manifest_path),
+            "manifest_sha256": digest,
+            "unit_size": unit_size,
+            "units": len(units),
+            "items": len(items),
+            "created_utc": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }
+        # queue.json al final: si el shard se corta a medias, se repite entero
+        self._write_json_atomic(meta_path, meta)
+        return meta
+
+    def unit_ids(self) -> list:
+        return sorted(f[:-5] for f in os.listdir(os.path.join(self.queue_dir, "units")) if f.endswith(".json"))
+
+    # ---------------- leases ----------------
+
+    def _attempts(self, unit_id: str) -> int:
+        try:
+            with open(self._path("attempts", unit_id + ".log"), "r", encoding="utf-8") as f:
+                # Las líneas de error (release) no cuentan como intento
+                return sum(1 for line in f if line.strip() and '"error"' not in line)
+        except FileNotFoundError:
+            return 0
+
+    def _finished(self, unit_id: str) -> bool:
+        return os.path.exists(self._path("done", unit_id + ".json")) or os.path.exists(
+            self._path("failed", unit_id + ".json")
+        )
+
+    def _break_expired(self, unit_id: str) -> bool:
+        """
+        Si la lease de la unidad ha caducado, la retira. Solo un nodo gana el
+        rename, así que dos workers no pueden "robar" la misma lease.
+        """
+        lease_path = self._path("leases", unit_id + ".lease")
+        lease = self._read_json(lease_path)
+        if lease is None:
+            # Sin contenido legible: lease recién creada o corrupta; se juzga por mtime
+            try:
+                expired = time.time() - os.path.getmtime(lease_path) > self.lease_ttl_s
+            except FileNotFoundError:
+                return True
+        else:
+            expired = time.time() > lease["expires_at"]
+        if not expired:
+            return False
+
+        stale = f"{lease_path}.stale-{uuid.uuid4().hex[:8]}"
+        try:
+            os.rename(lease_path, stale)
+        except FileNotFoundError:
+            return True  # otro nodo ya la retiró
+        taken = self._read_json(stale)
+        if lease is not None and taken is not None and taken["token"] != lease["token"]:
+            # Entre la lectura y el rename otro nodo retiró la caducada y creó
+            # una nueva: se devuelve (link no pisa si ya hay otra)
+            try:
+                os.link(stale, lease_path)
+            except OSError:
+                pass
+            os.remove(stale)
+            return False
+        os.remove(stale)
+        return True
+
+    def claim(self, worker_id: str):
+        """
+        Reclama la primera unidad libre (o con lease caducada). Devuelve la
+        unidad con su lease, o None si no queda nada que hacer ahora.
+        """
+        for unit_id in self.unit_ids():
+            if self._finished(unit_id):
+                continue
+            lease_path = self._path("leases", unit_id + ".lease")
+            if os.path.exists(lease_path) and not self._break_expired(unit_id):
+                continue
+
+            attempt = self._attempts(unit_id) + 1
+            if attempt > self.max_attempts:
+                self._create_exclusive(
+                    self._path("failed", unit_id + ".json"),
+                    {"unit_id": unit_id, "attempts": attempt - 1, "reason": "max_attempts"},
+                )
+                continue
+
+            lease = {
+                "unit_id": unit_id,
+                "worker": worker_id,
+                "token": uuid.uuid4().hex,
+                "attempt": attempt,
+                "expires_at": time.time() + self.lease_ttl_s,
+            }
+            if not self._create_exclusive(lease_path, lease):
+                continue  # otro worker se adelantó
+            with open(self._path("attempts", unit_id + ".log"), "a", encoding="utf-8") as f:
+                f.write(json.dumps({"worker": worker_id, "attempt": attempt, "t": time.time()}) + "\n")
+
+            # Puede haberse confirmado entre la comprobación y la lease
+            if self._finished(unit_id):
+                self._drop_lease(lease)
+                continue
+
+            unit = self._read_json(self._path("units", unit_id + ".json"))
+            unit["lease"] = lease
+            return unit
+        return None
+
+    def owns(self, lease: dict) -> bool:
+        cur = self._read_json(self._path("leases", lease["unit_id"] + ".lease"))
+        return cur is not None and cur["token"] == lease["token"]
+
+    def _grab_lease(self, lease: dict):
+        """
+        Aparta el fichero de la lease con un rename (solo un nodo lo gana) y
+        comprueba que es la nuestra. Devuelve la ruta apartada, o None si
+        ya no es nuestra (la de otro se deja en su sitio).
+        """
+        lease_path = self._path("leases", lease["unit_id"] + ".lease")
+        grabbed = f"{lease_path}.grab-{uuid.uuid4().hex[:8]}"
+        try:
+            os.rename(lease_path, grabbed)
+        except FileNotFoundError:
+            return None
+        cur = self._read_json(grabbed)
+        if cur is not None and cur["token"] == lease["token"]:
+            return grabbed
+        try:
+            os.link(grabbed, lease_path)  # no pisa si entretanto hay otra
+        except OSError:
+            pass
+        os.remove(grabbed)
+        return None
+
+    def heartbeat(self, lease: dict) -> bool:
+        """
+        Renueva la lease. False => la hemos perdido (caducó y otro la tiene):
+        el worker debe abandonar la unidad.
+
+        Nunca pisa la lease de otro: la nueva se escribe en un temporal, la
+        actual se aparta con rename comprobando que es nuestra y el temporal
+        se enlaza con os.link (falla si otro nodo ya ha creado una). En ese
+        instante sin lease otro puede reclamar la unidad: entonces perdemos
+        nosotros, nunca los dos a la vez.
+        """
+        lease_path = self._path("leases", lease["unit_id"] + ".lease")
+        renewed = dict(lease, expires_at=time.time() + self.lease_ttl_s)
+        tmp = f"{lease_path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(renewed, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            grabbed = self._grab_lease(lease)
+            if grabbed is None:
+                return False
+            try:
+                os.link(tmp, lease_path)
+            except FileExistsError:
+                return False  # otro la reclamó mientras estaba apartada
+            except OSError:
+                # FS con hipo: se devuelve la lease tal cual y reintenta el siguiente latido
+                try:
+                    os.link(grabbed, lease_path)
+                except OSError:
+                    pass
+                raise
+            finally:
+                os.remove(grabbed)
+        finally:
+            os.remove(tmp)
+        lease["expires_at"] = renewed["expires_at"]
+        return self.owns(lease)
+
+    def _drop_lease(self, lease: dict):
+        grabbed = self._grab_lease(lease)
+        if grabbed is not None:
+            os.remove(grabbed)
+
+    def release(self, lease: dict, error: str = None):
+        """
+        Suelta la unidad sin confirmarla (error del worker): queda libre para
+        otro intento inmediatamente, sin esperar a que caduque.
+        """
+        if error is not None:
+            with open(self._path("attempts", lease["unit_id"] + ".log"), "a", encoding="utf-8") as f:
+                f.write(json.dumps({"worker": lease["worker"], "attempt": lease["attempt"], "error": error}) + "\n")
+        self._drop_lease(lease)
+
+    # ---------------- checkpoints ----------------
+
+    def checkpoint(self, lease: dict, records: dict):
+        """
+        records: {índice de item (str): registro} de lo ya procesado.
+        Un fichero por intento => un worker zombi no pisa el del nuevo.
+        """
+        name = f"{lease['unit_id']}.{lease['attempt']}.json"
+        self._write_json_atomic(
+            self._path("progress", name),
+            {"unit_id": lease["unit_id"], "attempt": lease["attempt"], "worker": lease["worker"], "items": records},
+        )
+
+    def load_checkpoint(self, unit_id: str) -> dict:
+        """
+        Registros del intento anterior más avanzado, para reanudar en vez de
+        reprocesar. Solo se adoptan items correctos cuya escena sigue en staging.
+        """
+        best = {}
+        prefix = unit_id + "."
+        for name in os.listdir(os.path.join(self.queue_dir, "progress")):
+            if not (name.startswith(prefix) and name.endswith(".json")):
+                continue
+            cp = self._read_json(self._path("progress", name))
+            if cp is None:
+                continue
+            ok = {
+                k: r for k, r in cp["items"].items()
+                if r.get("scene") and os.path.isdir(os.path.join(self.queue_dir, r["scene"]))
+            }
+            if len(ok) > len(best):
+                best = ok
+        return best
+
+    # ---------------- confirmación y fusión ----------------
+
+    def commit(self, lease: dict, records: dict) -> bool:
+        """
+        Confirma la unidad. O_EXCL sobre done/<unit>.json => como mucho UN
+        worker confirma cada unidad aunque dos la hayan procesado (lease
+        caducada + worker lento). False => otro confirmó antes.
+        """
+        done = {
+            "unit_id": lease["unit_id"],
+            "worker": lease["worker"],
+            "attempt": lease["attempt"],
+            "committed_utc": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "items": records,
+        }
+        ok = self._create_exclusive(self._path("done", lease["unit_id"] + ".json"), done)
+        self._drop_lease(lease)
+        return ok
+
+    @staticmethod
+    def _scene_sha256(scene_dir: str):
+        # Mismo hash que EvidenceService: el de los bytes de result.json
+        try:
+            with open(os.path.join(scene_dir, "result.json"), "rb") as f:
+                return hashlib.sha256(f.read()).hexdigest()
+        except FileNotFoundError:
+            return None
+
+    @classmethod
+    def _check_merged(cls, dst: str, sha256: str):
+        """
+        dst ya existe: solo vale como "ya fusionada" si es la misma escena.
+        Los scene_id (segundos + 24 bits aleatorios) de muchos workers
+        pueden chocar; otra escena con el mismo nombre es un error, no se pisa
+        ni se da por fusionada.
+        """
+        found = cls._scene_sha256(dst)
+        if sha256 is None or found != sha256:
+            raise FileExistsError(
+                f"Colisión de escena {os.path.basename(dst)} en {os.path.dirname(dst)}: "
+                f"sha256 {found} != {sha256} (la de la unidad sigue en staging)"
+            )
+
+    @classmethod
+    def _move_dir(cls, src: str, dst: str, sha256: str):
+        # Idempotente: si dst ya es esta escena (mismo sha256), ya se fusionó
+        if os.path.exists(dst):
+            cls._check_merged(dst, sha256)
+            shutil.rmtree(src, ignore_errors=True)  # restos de un copytree cortado
+            return
+        try:
+            os.rename(src, dst)
+        except OSError as ex:
+            if ex.errno in (errno.EEXIST, errno.ENOTEMPTY):
+                # Otro nodo creó dst entre la comprobación y el rename
+                cls._check_merged(dst, sha256)
+                shutil.rmtree(src, ignore_errors=True)
+                return
+            if ex.errno != errno.EXDEV:
+                raise
+            # Staging y almacén central en distinto FS: copiar a temporal y renombrar
+            tmp = f"{dst}.{uuid.uuid4().hex[:8]}.tmp"
+            shutil.copytree(src, tmp)
+            try:
+                os.rename(tmp, dst)
+            except OSError as ex2:
+                shutil.rmtree(tmp, ignore_errors=True)
+                if ex2.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                    raise
+                cls._check_merged(dst, sha256)
+            shutil.rmtree(src, ignore_errors=True)
+
+    def merge(self, unit_id: str, outputs_dir: str) -> dict:
+        """
+        Mueve las escenas de una unidad confirmada al almacén central de
+        evidencias. Se puede repetir tras un corte: lo ya movido (mismo
+        sha256) se salta y merged/<unit>.json se escribe al final => cada
+        escena entra una vez. Si en el almacén hay OTRA escena con el mismo
+        nombre, FileExistsError y la unidad queda sin fusionar.
+        """
+        merged_path = self._path("merged", unit_id + ".json")
+        prev = self._read_json(merged_path)
+        if prev is not None:
+            return prev
+        done = self._read_json(self._path("done", unit_id + ".json"))
+        if done is None:
+            raise ValueError(f"La unidad {unit_id} no está confirmada.")
+
+        os.makedirs(outputs_dir, exist_ok=True)
+        scenes = []
+        for rec in done["items"].values():
+            if not rec.get("scene"):
+                continue
+            src = os.path.join(self.queue_dir, rec["scene"])
+            dst = os.path.join(outputs_dir, os.path.basename(rec["scene"]))
+            if os.path.isdir(src) or os.path.exists(dst):
+                self._move_dir(src, dst, rec.get("sha256_result_json"))
+                scenes.append(os.path.basename(dst))
+
+        out = {
+            "unit_id": unit_id,
+            "outputs_dir": os.path.abspath(outputs_dir),
+            "scenes": scenes,
+            "errors": sum(1 for r in done["items"].values() if r.get("error")),
+        }
+        self._create_exclusive(merged_path, out)
+        return out
+
+    def merge_all(self, outputs_dir: str) -> int:
+        n = 0
+        for name in sorted(os.listdir(os.path.join(self.queue_dir, "done"))):
+            unit_id = name[:-5]
+            if name.endswith(".json") and not os.path.exists(self._path("merged", name)):
+                self.merge(unit_id, outputs_dir)
+                n += 1
+        return n
+
+    def status(self) -> dict:
+        units = self.unit_ids()
+
+        def count(kind):
+            return sum(1 for u in units if os.path.exists(self._path(kind, u + ".json")))
+
+        now = time.time()
+        leased = 0
+        for u in units:
+            lease = self._read_json(self._path("leases", u + ".lease"))
+            if lease is not None and lease["expires_at"] > now:
+                leased += 1
+
+        done, failed = count("done"), count("failed")
+        meta = self._read_json(os.path.join(self.queue_dir, "queue.json")) or {}
+        return {
+            "units": len(units),
+            "items": meta.get("items"),
+            "done": done,
+            "merged": count("merged"),
+            "failed": failed,
+            "leased": leased,
+            "pending": len(units) - done - failed - leased,
+        }
@@ -0,0 +1,139 @@
+import os
+import queue
+import threading
+from contextlib import contextmanager
+
+from Model.yolo_service import YoloService, ImgszPolicy
+
+
+def _available_memory_bytes():
+    # Linux/macOS; en Windows devolvemos None y se decide solo por CPU
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+class YoloPool:
+    """
+    Pool de réplicas de YoloService. Cada réplica solo la usa un hilo a la vez
+    (checkout/checkin), porque el modelo de ultralytics no es seguro para
+    predict concurrente.
+    """
+
+    # Estimación de memoria por réplica: pesos + activaciones a imgsz=1024
+    BYTES_PER_REPLICA_FACTOR = 8
+    MIN_BYTES_PER_REPLICA = 512 * 1024 * 1024
+
+    def __init__(
+        self,
+        model_path: str,
+        size: int = None,
+        intra_op_threads: int = None,
+        checkout_timeout: float = 30.0,
+        imgsz_policy: ImgszPolicy = None,
+        variant: str = None,
+    ):
+        self.model_path = model_path
+        self.size = int(size) if size else self.default_size(model_path)
+        self.checkout_timeout = checkout_timeout
+
+        cores = os.cpu_count() or 1
+        self.intra_op_threads = int(intra_op_threads) if intra_op_threads else max(1, cores // self.size)
+        self._set_intra_op_threads(self.intra_op_threads)
+
+        self._free = queue.LifoQueue()
+        for _ in range(self.size):
+            self._free.put(YoloService(model_path, imgsz_policy=imgsz_policy, variant=variant))
+        # Todas las réplicas comparten política/stride: una sirve de referencia
+        self._reference = self._free.queue[0]
+
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._waits = 0
+        self._timeouts = 0
+
+    @classmethod
+    def default_size(cls, model_path: str) -> int:
+        """
+        Nº de réplicas = min(por CPU, por memoria libre). Con pocos cores
+        compensa 1 réplica con todos los hilos; a partir de 8 cores, 1 réplica
+        por cada 4 cores suele escalar mejor que hilos intra-op.
+        """
+        cores = os.cpu_count() or 1
+        by_cpu = max(1, cores // 4)
+
+        try:
+            weights = os.path.getsize(model_path)
+        except OSError:
+            weights = 0
+        per_replica = max(cls.MIN_BYTES_PER_REPLICA, weights * cls.BYTES_PER_REPLICA_FACTOR)
+
+        avail = _available_memory_bytes()
+        by_mem = max(1, int(avail * 0.7) // per_replica) if avail else by_cpu
+
+        return max(1, min(by_cpu, by_mem))
+
+    @staticmethod
+    def _set_intra_op_threads(n: int):
+        # torch.set_num_threads es global al proceso: se reparte entre réplicas
+        # para que size * n ~= cores y no haya sobre-suscripción.
+        try:
+            import torch
+            torch.set_num_threads(n)
+        except ImportError:
+            pass
+
+    def checkout(self, timeout: float = None) -> YoloService:
+        timeout = self.checkout_timeout if timeout is None else timeout
+        try:
+            svc = self._free.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                self._waits += 1
+            try:
+                svc = self._free.get(timeout=timeout)
+            except queue.Empty:
+                with self._lock:
+                    self._timeouts += 1
+                raise TimeoutError(f"No hay réplica YOLO libre tras {timeout:.1f}s (pool={self.size}).")
+
+        with self._lock:
+            self._in_use += 1
+        return svc
+
+    def checkin(self, svc: YoloService):
+        with self._lock:
+            self._in_use -= 1
+        self._free.put(svc)
+
+    @contextmanager
+    def replica(self, timeout: float = None):
+        svc = self.checkout(timeout)
+        try:
+            yield svc
+        finally:
+            self.checkin(svc)
+
+    @property
+    def variant(self):
+        # Nombre de la variante cargada (None => el .pt original)
+        info = self._reference.variant
+        return info["name"] if info else None
+
+    def choose_imgsz(self, crop_h: int, crop_w: int):
+        """
+        imgsz que usará una réplica para ese crop, sin hacer checkout
+        (solo lee la política, no toca el modelo).
+        """
+        return self._reference.choose_imgsz(crop_h, crop_w)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "size": self.size,
+                "intra_op_threads": self.intra_op_threads,
+                "in_use": self._in_use,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+            }
@@ -1,11 +1,161 @@
-from ultralytics import YOLO
+import os
+import math
+
 import numpy as np
 
+from Model.model_variant_service import ModelVariantService
+
+
+class ImgszPolicy:
+    """
+    Elige el tamaño de inferencia a partir del tamaño del crop.
+
+    mode="fixed": siempre el imgsz del entrenamiento (comportamiento original).
+    mode="adaptive": escala el crop para que los objetos queden al tamaño que
+      vio el modelo al entrenar (train_obj_px) si se conoce el tamaño real en
+      la cámara (target_obj_px); si no, resolución nativa del crop. Se acota a
+      [min_size, max_size] y se redondea al stride del modelo.
+    rect=True: letterbox rectangular (h, w) en vez de cuadrado.
+    """
+
+    def __init__(
+        self,
+        mode: str = "adaptive",
+        min_size: int = 320,
+        max_size: int = 1280,
+        target_obj_px: float = None,
+        train_obj_px: float = None,
+        rect: bool = False,
+    ):
+        if mode not in ("fixed", "adaptive"):
+            raise ValueError(f"mode de imgsz desconocido: {mode}")
+        self.mode = mode
+        self.min_size = int(min_size)
+        self.max_size = int(max_size)
+        self.target_obj_px = target_obj_px
+        self.train_obj_px = train_obj_px
+        self.rect = rect
+
+    @staticmethod
+    def _round_up(v: float, stride: int) -> int:
+        return int(math.ceil(v / stride) * stride)
+
+    def choose(self, crop_h: int, crop_w: int, base_imgsz: int, stride: int = 32):
+        """
+        Devuelve int (cuadrado) o [h, w] (rect), múltiplos de stride.
+        """
+        if self.mode == "fixed":
+            return self._round_up(base_imgsz, stride)
+
+        scale = 1.0
+        if self.target_obj_px and self.train_obj_px:
+            scale = float(self.train_obj_px) / float(self.target_obj_px)
+
+        long_side = max(crop_h, crop_w) * scale
+        long_side = min(max(long_side, self.min_size), self.max_size)
+        size = self._round_up(long_side, stride)
+
+        if not self.rect:
+            return size
+
+        r = size / float(max(crop_h, crop_w))
+        return [self._round_up(crop_h * r, stride), self._round_up(crop_w * r, stride)]
+
+
 class YoloService:
-    def __init__(self, model_path: str):
-        self.model = YOLO(model_path)
+    def __init__(self, model_path: str, imgsz_policy: ImgszPolicy = None, variant: str = None,
+                 variants_dir: str = None):
+        """
+        variant: nombre de una variante cuantizada/podada de model_path
+        (p.ej. "int8"), registrada y aceptada por tools/quantize_model.py.
+        Se usa igual que el .pt: mismas llamadas, mismos Results.
+        """
+        self.variant = None
+        self.fixed_imgsz = None  # export con forma estática => imgsz obligado
+        self.max_batch = None  # ... y tamaño de lote obligado (None => sin límite)
+        if variant:
+            self.variant = ModelVariantService(variants_dir).resolve(model_path, variant)
+            model_path = self.variant["path"]
+        self.model_path = model_path
+
+        # ultralytics solo al cargar un modelo: ImgszPolicy y el resto del
+        # pipeline (y sus tests) se importan sin él
+        from ultralytics import YOLO
+
+        if model_path.endswith(".pt"):
+            self.model = YOLO(model_path)
+        else:
+            self.model = YOLO(model_path, task="detect")
+        self.imgsz_policy = imgsz_policy or ImgszPolicy()
+
+        # imgsz de entrenamiento y stride (de los args guardados en el .pt)
+        inner = getattr(self.model, "model", None)
+        args = getattr(inner, "args", None) or {}
+        base = args.get("imgsz", 640) if isinstance(args, dict) else getattr(args, "imgsz", 640)
+        self.base_imgsz = int(max(base) if isinstance(base, (list, tuple)) else base)
+        try:
+            self.stride = int(max(inner.stride))
+        except (AttributeError, TypeError, ValueError):
+            self.stride = 32
+
+        # Exports (OpenVINO/ONNX): no llevan args; imgsz/stride salen de sus metadatos
+        if self.variant is not None or not model_path.endswith(".pt"):
+            meta = self.variant or self._export_metadata(model_path)
+            if meta.get("imgsz"):
+                imgsz = meta["imgsz"]
+                self.base_imgsz = int(max(imgsz) if isinstance(imgsz, (list, tuple)) else imgsz)
+            self.stride = int(meta.get("stride", self.stride))
+            if not meta.get("dynamic", False):
+                self.fixed_imgsz = self.base_imgsz
+                # variant.json de antes sin "batch": quantize_model exportaba con lote 1
+                self.max_batch = int(meta.get("batch") or 1)
 
-    def predict(self, img_bgr: np.ndarray, conf: float = 0.25, iou: float = 0.7):
+    @staticmethod
+    def _export_metadata(model_path: str) -> dict:
+        # ultralytics deja metadata.yaml dentro de la carpeta del export
+        path = os.path.join(model_path, "metadata.yaml") if os.path.isdir(model_path) else None
+        if not path or not os.path.exists(path):
+            return {}
+        import yaml
+
+        with open(path, "r", encoding="utf-8") as f:
+            meta = yaml.safe_load(f) or {}
+        if "args" in meta and isinstance(meta["args"], dict):
+            meta.setdefault("dynamic", meta["args"].get("dynamic", False))
+        return meta
+
+    def choose_imgsz(self, crop_h: int, crop_w: int):
+        if self.fixed_imgsz is not None:
+            return self.fixed_imgsz
+        return self.imgsz_policy.choose(crop_h, crop_w, self.base_imgsz, self.stride)
+
+    def predict(self, img_bgr: np.ndarray, conf: float = 0.25, iou: float = 0.7, imgsz=None):
         # Devuelve el objeto Results de ultralytics
-        results = self.model.predict(img_bgr, conf=conf, iou=iou, verbose=False)
+        if imgsz is None:
+            imgsz = self.choose_imgsz(*img_bgr.shape[:2])
+        results = self.model.predict(img_bgr, conf=conf, iou=iou, imgsz=imgsz, verbose=False)
         return results[0]  # una imagen => un Results
+
+    def predict_batch(self, imgs_bgr: list, conf: float = 0.25, iou: float = 0.7, imgsz=None):
+        """
+        Un único forward con varias imágenes (pueden tener tamaños distintos,
+        ultralytics hace letterbox de cada una al mismo imgsz).
+        Con un export estático, tantos forwards como hagan falta de max_batch
+        imágenes (el de lote 1 no acepta más).
+        Devuelve una lista de Results en el mismo orden.
+        """
+        if not imgs_bgr:
+            return []
+        if imgsz is None:
+            imgsz = self.choose_imgsz(*self.batch_shape(imgs_bgr))
+        step = self.max_batch or len(imgs_bgr)
+        results = []
+        for i in range(0, len(imgs_bgr), step):
+            results.extend(self.model.predict(list(imgs_bgr[i:i + step]), conf=conf, iou=iou, imgsz=imgsz,
+                                              verbose=False))
+        return results
+
+    @staticmethod
+    def batch_shape(imgs_bgr: list):
+        # El lote comparte imgsz: se elige para el crop más grande
+        return max(i.shape[0] for i in imgs_bgr), max(i.shape[1] for i in imgs_bgr)
@@ -0,0 +1,282 @@
+import os
+import time
+import base64
+import threading
+
+import flet as ft
+import cv2
+import numpy as np
+import tkinter as tk
+from tkinter import filedialog
+
+from Controller.live_stats import LiveStats
+from Model.image_decode_service import ImageDecodeService
+
+STATE_COLORS = {"FLUIDO": "green", "DENSO": "orange", "ATASCO": "red"}
+
+
+def pick_folder_dialog():
+    root = tk.Tk()
+    root.withdraw()
+    root.attributes("-topmost", True)
+    path = filedialog.askdirectory(title="Selecciona una carpeta de imágenes")
+    root.destroy()
+    return path if path else None
+
+
+def png_data_uri(img_bgr) -> str:
+    ok, buf = cv2.imencode(".png", img_bgr)
+    if not ok:
+        return ""
+    return "data:image/png;base64," + base64.b64encode(buf.tobytes()).decode()
+
+
+def sparkline(values, width: int = 220, height: int = 40, color_bgr=(255, 200, 0), vmax: float = None):
+    """
+    Sparkline como imagen pequeña (más barata de refrescar que un chart de Flet).
+    """
+    img = np.full((height, width, 3), 30, dtype=np.uint8)
+    vals = np.asarray(list(values), dtype=np.float32)
+    if vals.size >= 2:
+        top = vmax if vmax else max(float(vals.max()), 1e-6)
+        xs = np.linspace(0, width - 1, vals.size)
+        ys = (height - 3) - np.clip(vals / top, 0, 1) * (height - 6)
+        pts = np.stack([xs, ys], axis=1).astype(np.int32).reshape((-1, 1, 2))
+        cv2.polylines(img, [pts], False, color_bgr, 1, lineType=cv2.LINE_AA)
+    return png_data_uri(img)
+
+
+def thumbnail(path: str, max_side: int = 160, encoder=None):
+    """
+    Miniatura diezmada: JPEG decodificado ya a 1/2-1/8 y luego reducido.
+    encoder: EncoderPool donde codificarla (si no, en este hilo).
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    probe = ImageDecodeService.probe_jpeg_size(data)
+    factor = ImageDecodeService.choose_scale(probe[0], probe[1], max_side) if probe else 1
+    img = ImageDecodeService.decode(data, factor)
+    r = max_side / float(max(img.shape[:2]))
+    if r < 1:
+        img = cv2.resize(img, (max(1, int(img.shape[1] * r)), max(1, int(img.shape[0] * r))),
+                         interpolation=cv2.INTER_AREA)
+    if encoder is not None:
+        data = encoder.submit(img, fmt="jpeg", quality=70, progressive=False).result()
+        return "data:image/jpeg;base64," + base64.b64encode(data).decode()
+    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 70])
+    return "data:image/jpeg;base64," + base64.b64encode(buf.tobytes()).decode() if ok else ""
+
+
+class DashboardView:
+    """
+    Vista en vivo de un lote/stream: se suscribe al EventBus del controller
+    y refresca a refresh_hz fijos, agregando todos los eventos llegados
+    entre refrescos => la UI nunca frena al pipeline (a lo sumo se pierden
+    eventos viejos de la cola del suscriptor).
+
+    Miniaturas: como mucho una por cámara cada thumb_every_s, a thumb_px.
+    La imagen a resolución completa solo se pide al pulsar la miniatura.
+    """
+
+    def __init__(self, page: ft.Page, controller, refresh_hz: float = 4.0, thumb_px: int = 160,
+                 thumb_every_s: float = 2.0, batch_params=None):
+        """
+        batch_params: función sin argumentos que devuelve los kwargs del
+        análisis (conf, iou, poly_points, profile_id) al lanzar un lote.
+        """
+        if controller.events is None:
+            raise ValueError("El controller no tiene EventBus (AppController(events=EventBus())).")
+        self.page = page
+        self.controller = controller
+        self.refresh_s = 1.0 / max(0.2, float(refresh_hz))
+        self.thumb_px = int(thumb_px)
+        self.thumb_every_s = float(thumb_every_s)
+
+        self.stats = LiveStats()
+        self._sub = None
+        self._stop = threading.Event()
+        self._ticker = None
+        self._batch = None
+        self._cards = {}
+
+        self.header = ft.Text("Sin datos", size=18, weight="bold")
+        self.fps_spark = ft.Image(src=sparkline([]), width=220, height=40)
+        self.status = ft.Text("")
+        self.cards = ft.Column()
+        self.detail_title = ft.Text("")
+        self.detail_img = ft.Image(src="", width=900, visible=False)
+
+        self.root = ft.Column([
+            ft.Row([
+                ft.ElevatedButton("📂 Analizar carpeta", on_click=self._on_pick_folder),
+                ft.ElevatedButton("⏹ Parar", on_click=lambda _: self.stop_batch()),
+            ]),
+            ft.Row([self.header, self.fps_spark]),
+            self.status,
+            self.cards,
+            self.detail_title,
+            self.detail_img,
+        ])
+        self.batch_params = batch_params or (lambda: {})
+
+    # ---------------- ciclo de vida ----------------
+
+    def start(self):
+        if self._ticker is not None:
+            return
+        self._sub = self.controller.events.subscribe(topics=["frame"], maxsize=4096)
+        # Un Event por hilo: un refresco viejo que aún no ha despertado no
+        # sigue vivo si se vuelve a mostrar enseguida
+        self._stop = threading.Event()
+        self._ticker = threading.Thread(target=self._tick_loop, args=(self._stop,), name="dashboard", daemon=True)
+        self._ticker.start()
+
+    def stop(self):
+        """
+        Deja de refrescar y se da de baja del EventBus (sin suscriptores el
+        controller no publica). Un lote en marcha sigue: para eso stop_batch().
+        """
+        self._stop.set()
+        if self._sub is not None:
+            self._sub.close()
+            self._sub = None
+        self._ticker = None
+
+    # ---------------- refresco ----------------
+
+    def _tick_loop(self, stop: threading.Event):
+        while not stop.wait(self.refresh_s):
+            try:
+                self._refresh()
+            except Exception as ex:  # un fallo de pintado no debe matar el refresco
+                self.status.value = f"❌ Dashboard: {ex}"
+
+    def _refresh(self):
+        sub = self._sub
+        if sub is None:
+            return
+        changed = self.stats.update(sub.drain())
+        sample = self.stats.sample()
+        now = time.monotonic()
+
+        for name in sorted(self.stats.cameras):
+            cam = self.stats.cameras[name]
+            card = self._cards.get(name) or self._new_card(name)
+            fps = sample["cameras"][name]
+            # Solo se repintan las tarjetas con frames nuevos; una cámara parada
+            # solo mientras su fps cae a 0 (fps_window_s), y solo el fps
+            if name not in changed and fps == card["fps_drawn"]:
+                continue
+            card["numbers"].value = f"{fps:.2f} fps · {cam['frames']} frames · {cam['skipped']} reutilizados"
+            card["fps"].src = sparkline(cam["fps"])
+            card["fps_drawn"] = fps
+
+            if name in changed:
+                state = cam["traffic_state"] or "-"
+                card["state"].value = state
+                card["state"].color = STATE_COLORS.get(state)
+                card["counts"].value = "  ".join(f"{k}: {v}" for k, v in sorted(cam["counts_by_class"].items())) or "-"
+                card["occ"].src = sparkline(cam["occupancy"], color_bgr=(0, 0, 255), vmax=1.0)
+
+            # Miniatura diezmada: solo si hay frame nuevo y ha pasado thumb_every_s
+            last = cam["last"]
+            if last["scene_id"] != card["thumb_scene"] and now - card["thumb_t"] >= self.thumb_every_s:
+                card["thumb"].src = thumbnail(last["original_path"], self.thumb_px, self.controller.encoder)
+                card["thumb_scene"] = last["scene_id"]
+                card["thumb_t"] = now
+
+        self.header.value = f"{sample['fps']:.2f} fps · {self.stats.frames} frames · {len(self.stats.cameras)} cámaras"
+        self.fps_spark.src = sparkline(self.stats.fps_history)
+        if sub.dropped:
+            self.status.value = f"⚠️ {sub.dropped} eventos descartados (refresco más lento que el pipeline)"
+        self.page.update()  # un solo update por refresco
+
+    def _new_card(self, name: str) -> dict:
+        card = {
+            "thumb": ft.Image(src=sparkline([], width=self.thumb_px, height=self.thumb_px * 9 // 16),
+                              width=self.thumb_px),
+            "state": ft.Text("-", size=16, weight="bold"),
+            "numbers": ft.Text(""),
+            "counts": ft.Text(""),
+            "occ": ft.Image(src=sparkline([]), width=220, height=40),
+            "fps": ft.Image(src=sparkline([]), width=220, height=40),
+            "thumb_t": -1e9,
+            "thumb_scene": None,
+            "fps_drawn": None,
+        }
+        self.cards.controls.append(
+            ft.Row([
+                ft.Container(content=card["thumb"], on_click=lambda _, n=name: self._show_full(n)),
+                ft.Column([
+                    ft.Row([ft.Text(name, weight="bold"), card["state"]]),
+                    card["numbers"],
+                    card["counts"],
+                    ft.Row([ft.Text("ocupación"), card["occ"], ft.Text("fps"), card["fps"]]),
+                ]),
+            ])
+        )
+        self._cards[name] = card
+        return card
+
+    def _show_full(self, name: str):
+        # Resolución completa solo bajo demanda (overlay perezoso de la escena)
+        scene_id = self._cards[name]["thumb_scene"]
+        if not scene_id:
+            return
+        try:
+            path = self.controller.render_overlay(scene_id)
+        except (ValueError, FileNotFoundError) as ex:
+            self.status.value = f"❌ {ex}"
+            self.page.update()
+            return
+        with open(path, "rb") as f:
+            self.detail_img.src = (
+                f"data:{self.controller.encoder.content_type()};base64," + base64.b64encode(f.read()).decode()
+            )
+        self.detail_img.visible = True
+        self.detail_title.value = f"{name} · {scene_id}"
+        self.page.update()
+
+    # ---------------- lote de ejemplo ----------------
+
+    def _on_pick_folder(self, _):
+        folder = pick_folder_dialog()
+        if folder:
+            self.run_folder(folder)
+
+    def run_folder(self, folder: str):
+        """
+        Analiza todas las imágenes de la carpeta en un hilo (cámara = nombre
+        de la carpeta). Los resultados llegan al dashboard por el EventBus.
+        """
+        if self._batch is not None and self._batch.is_alive():
+            self.status.value = "Ya hay un lote en marcha"
+            self.page.update()
+            return
+        paths = sorted(
+            os.path.join(folder, f) for f in os.listdir(folder) if f.lower().endswith((".jpg", ".jpeg", ".png"))
+        )
+        params = dict(self.batch_params())
+        source_name = os.path.basename(os.path.normpath(folder)) or "carpeta"
+        self._batch_stop = threading.Event()
+
+        def work():
+            errors = 0
+            for p in paths:
+                if self._batch_stop.is_set():
+                    break
+                try:
+                    with open(p, "rb") as f:
+                        self.controller.analyze_image_bytes(f.read(), source_name=source_name, **params)
+                except Exception:
+                    errors += 1
+            self.status.value = f"✅ Lote terminado ({len(paths)} imágenes, {errors} errores)"
+
+        self.status.value = f"Analizando {len(paths)} imágenes de {source_name}..."
+        self.page.update()
+        self._batch = threading.Thread(target=work, name="dashboard-batch", daemon=True)
+        self._batch.start()
+
+    def stop_batch(self):
+        if self._batch is not None and self._batch.is_alive():
+            self._batch_stop.set()
@@ -0,0 +1,190 @@
+import time
+import asyncio
+import json
+
+from aiohttp import web
+
+from Controller.dynamic_batcher import DynamicBatcher
+
+
+def _parse_poly(raw):
+    """
+    poly_points llega como JSON: [[x,y],[x,y],...]
+    """
+    if not raw:
+        return None
+    pts = json.loads(raw) if isinstance(raw, str) else raw
+    return [tuple(map(int, xy)) for xy in pts]
+
+
+def _parse_rois(raw):
+    """
+    entry_rois llega como JSON: {"norte": [[x,y],...], "sur": [[x,y],...]}
+    """
+    if not raw:
+        return None
+    return {name: _parse_poly(pts) for name, pts in json.loads(raw).items()}
+
+
+def create_app(controller, max_batch_size: int = 8, max_latency_ms: float = 20.0) -> web.Application:
+    """
+    Servicio HTTP local:
+      POST /analyze  (body = bytes de la imagen; query: source_name, conf, iou, poly_points,
+                      frame_ts (epoch s: activa tracking y fecha la serie), entry_rois (JSON {nombre: [[x,y],...]}),
+                      profile_id (perfil de cámara en lugar de poly_points))
+      POST /profiles/{profile_id}  (body = imagen de referencia; query: poly_points, entry_rois)
+      POST /publish  (JSON: scene_id, sha256_hex, metrics)
+      GET  /timeseries/{camera}          (rollups 1m/5m/1h en vivo)
+      GET  /timeseries/{camera}/history  (query: from, to (epoch s), resolution=1m|5m|1h)
+      GET  /heatmap/{camera}             (JPEG del mapa de calor sobre el último frame)
+      GET  /health   y  GET /stats
+    """
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    batcher = DynamicBatcher(controller, max_batch_size=max_batch_size, max_latency_ms=max_latency_ms)
+    app["controller"] = controller
+    app["batcher"] = batcher
+
+    async def on_startup(_app):
+        await batcher.start()
+
+    async def on_cleanup(_app):
+        await batcher.stop()
+        controller.close()
+
+    async def analyze(request: web.Request):
+        q = request.query
+        image_bytes = await request.read()
+        if not image_bytes:
+            return web.json_response({"ok": False, "error": "Body vacío (se esperan bytes de imagen)."}, status=400)
+
+        try:
+            conf = float(q.get("conf", 0.25))
+            iou = float(q.get("iou", 0.7))
+            poly_points = _parse_poly(q.get("poly_points"))
+            frame_ts = float(q["frame_ts"]) if q.get("frame_ts") else None
+            entry_rois = _parse_rois(q.get("entry_rois"))
+        except (ValueError, TypeError, AttributeError) as ex:
+            return web.json_response({"ok": False, "error": f"Parámetros inválidos: {ex}"}, status=400)
+
+        try:
+            out = await batcher.submit(
+                image_bytes,
+                source_name=q.get("source_name", "http"),
+                conf=conf,
+                iou=iou,
+                poly_points=poly_points,
+                frame_ts=frame_ts,
+                entry_rois=entry_rois,
+                profile_id=q.get("profile_id") or None,
+            )
+        except ValueError as ex:
+            return web.json_response({"ok": False, "error": str(ex)}, status=422)
+        except Exception as ex:
+            return web.json_response({"ok": False, "error": str(ex)}, status=500)
+
+        return web.json_response({"ok": True, **out})
+
+    async def publish(request: web.Request):
+        try:
+            body = await request.json()
+            scene_id = body["scene_id"]
+            sha256_hex = body["sha256_hex"]
+            metrics = body.get("metrics") or {}
+        except (ValueError, KeyError) as ex:
+            return web.json_response({"ok": False, "error": f"JSON inválido: {ex}"}, status=400)
+
+        # publish_to_bsv hace red (bloqueante) => fuera del event loop
+        loop = asyncio.get_running_loop()
+        out = await loop.run_in_executor(None, controller.publish_to_bsv, scene_id, sha256_hex, metrics)
+        return web.json_response(out, status=200 if out.get("ok") else 502)
+
+    async def save_profile(request: web.Request):
+        q = request.query
+        image_bytes = await request.read()
+        try:
+            poly_points = _parse_poly(q.get("poly_points"))
+            entry_rois = _parse_rois(q.get("entry_rois"))
+        except (ValueError, TypeError, AttributeError) as ex:
+            return web.json_response({"ok": False, "error": f"Parámetros inválidos: {ex}"}, status=400)
+
+        loop = asyncio.get_running_loop()
+        try:
+            out = await loop.run_in_executor(
+                None, controller.save_profile, request.match_info["profile_id"], image_bytes, poly_points, entry_rois
+            )
+        except ValueError as ex:
+            return web.json_response({"ok": False, "error": str(ex)}, status=422)
+        return web.json_response({"ok": True, **out})
+
+    async def list_profiles(_request):
+        return web.json_response({"profiles": controller.profiles.list_profiles()})
+
+    async def timeseries_live(request: web.Request):
+        if controller.timeseries is None:
+            return web.json_response({"ok": False, "error": "Serie temporal desactivada."}, status=404)
+        return web.json_response(controller.timeseries.rollups(request.match_info["camera"]))
+
+    async def timeseries_history(request: web.Request):
+        if controller.timeseries is None:
+            return web.json_response({"ok": False, "error": "Serie temporal desactivada."}, status=404)
+        q = request.query
+        try:
+            now = time.time()
+            t_to = float(q.get("to", now))
+            t_from = float(q.get("from", t_to - 86400))
+            out = controller.timeseries.query(request.match_info["camera"], t_from, t_to, q.get("resolution", "1m"))
+        except ValueError as ex:
+            return web.json_response({"ok": False, "error": str(ex)}, status=400)
+        return web.json_response(out)
+
+    async def heatmap(request: web.Request):
+        loop = asyncio.get_running_loop()
+        try:
+            img = await loop.run_in_executor(None, controller.render_heatmap, request.match_info["camera"])
+        except ValueError as ex:
+            return web.json_response({"ok": False, "error": str(ex)}, status=404)
+        try:
+            # En el EncoderPool, y el submit fuera del bucle: con el tope de
+            # memoria lleno espera (Condition.wait) y pararía todo aiohttp
+            job = await loop.run_in_executor(None, controller.encoder.submit, img)
+            body = await asyncio.wrap_future(job)
+        except RuntimeError:
+            return web.json_response({"ok": False, "error": "No se pudo codificar el heatmap."}, status=500)
+        return web.Response(body=body, content_type=controller.encoder.content_type())
+
+    async def overlay(request: web.Request):
+        # Se pinta la primera vez que se pide (y a ese tamaño); después sale de caché
+        try:
+            max_side = int(request.query["max_side"]) if request.query.get("max_side") else None
+        except ValueError as ex:
+            return web.json_response({"ok": False, "error": f"Parámetros inválidos: {ex}"}, status=400)
+        loop = asyncio.get_running_loop()
+        try:
+            path = await loop.run_in_executor(
+                None, controller.render_overlay, request.match_info["scene_id"], max_side
+            )
+        except (ValueError, FileNotFoundError) as ex:
+            return web.json_response({"ok": False, "error": str(ex)}, status=404)
+        return web.FileResponse(path, headers={"Content-Type": controller.encoder.content_type()})
+
+    async def health(_request):
+        return web.json_response({"ok": True})
+
+    async def stats(_request):
+        return web.json_response(batcher.snapshot())
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    app.add_routes([
+        web.post("/analyze", analyze),
+        web.post("/publish", publish),
+        web.get("/overlay/{scene_id}", overlay),
+        web.get("/profiles", list_profiles),
+        web.post("/profiles/{profile_id}", save_profile),
+        web.get("/timeseries/{camera}", timeseries_live),
+        web.get("/timeseries/{camera}/history", timeseries_history),
+        web.get("/heatmap/{camera}", heatmap),
+        web.get("/health", health),
+        web.get("/stats", stats),
+    ])
+    return app
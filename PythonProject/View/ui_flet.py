@@ -1,6 +1,7 @@
 import os
 import sys
 import json
+import atexit
 import base64
 import subprocess
 
@@ -11,6 +12,8 @@ import tkinter as tk
 from tkinter import filedialog
 
 from Controller.app_controller import AppController
+from Controller.event_bus import EventBus
+from View.dashboard_flet import DashboardView
 
 MODEL_PATH = os.path.join("Yolo", "best_roundabout.pt")
 ROI_PICKER_PATH = os.path.join("View", "roi_picker.py")
@@ -35,12 +38,21 @@ def load_bgr(path):
     return img
 
 
-def img_to_data_uri(img_bgr):
-    ok, buf = cv2.imencode(".jpg", img_bgr)
-    if not ok:
+def img_to_data_uri(img_bgr, encoder):
+    # Se codifica en el EncoderPool del controller (hilos + tope de memoria)
+    try:
+        data = encoder.submit(img_bgr).result()
+    except RuntimeError:
         return ""
-    b64 = base64.b64encode(buf.tobytes()).decode()
-    return f"data:image/jpeg;base64,{b64}"
+    b64 = base64.b64encode(data).decode()
+    return f"data:{encoder.content_type()};base64,{b64}"
+
+
+def file_to_data_uri(path, encoder):
+    # Overlays ya codificados en disco: se envían tal cual, sin recodificar
+    with open(path, "rb") as f:
+        b64 = base64.b64encode(f.read()).decode()
+    return f"data:{encoder.content_type()};base64,{b64}"
 
 
 def draw_polygon_overlay(img_bgr: np.ndarray, points_xy):
@@ -91,10 +103,14 @@ def main(page: ft.Page):
     page.padding = 20
     page.scroll = ft.ScrollMode.AUTO
 
-    controller = AppController(MODEL_PATH, outputs_dir="outputs")
+    # Cada imagen suelta llega con su nombre de fichero como source_name: sin
+    # series (la UI no las muestra; serían una por fichero)
+    controller = AppController(MODEL_PATH, outputs_dir="outputs", events=EventBus())
+    atexit.register(controller.close)
 
     selected_path = None
     poly_points = None
+    profile_id = None  # perfil de cámara activo (sustituye a poly_points)
 
     status = ft.Text("")
     traffic_text = ft.Text("Estado tráfico: -", size=22, weight="bold")
@@ -104,11 +120,13 @@ def main(page: ft.Page):
 
     metrics_box = ft.Column()
 
+    profile_field = ft.TextField(label="Perfil de cámara", width=260)
+
     conf_slider = ft.Slider(min=0.05, max=0.95, value=0.25)
     iou_slider = ft.Slider(min=0.05, max=0.95, value=0.70)
 
     def on_pick(_):
-        nonlocal selected_path, poly_points
+        nonlocal selected_path, poly_points, profile_id
         p = pick_file_dialog()
         if not p:
             status.value = "Selección cancelada"
@@ -117,15 +135,16 @@ def main(page: ft.Page):
 
         selected_path = p
         poly_points = None
+        profile_id = None
 
         img = load_bgr(p)
-        overlay_img.src = img_to_data_uri(img)
+        overlay_img.src = img_to_data_uri(img, controller.encoder)
 
         status.value = f"Imagen cargada: {os.path.basename(p)}"
         page.update()
 
     def on_define_poly(_):
-        nonlocal poly_points
+        nonlocal poly_points, profile_id
         if not selected_path:
             status.value = "Primero selecciona una imagen"
             page.update()
@@ -142,10 +161,11 @@ def main(page: ft.Page):
         pts = run_roi_picker(selected_path)
         if pts and len(pts) >= 3:
             poly_points = pts
+            profile_id = None
 
             img = load_bgr(selected_path)
             preview = draw_polygon_overlay(img, poly_points)
-            overlay_img.src = img_to_data_uri(preview)
+            overlay_img.src = img_to_data_uri(preview, controller.encoder)
 
             status.value = f"✅ Segmento definido ({len(poly_points)} puntos)"
         else:
@@ -154,6 +174,40 @@ def main(page: ft.Page):
 
         page.update()
 
+    def on_save_profile(_):
+        name = (profile_field.value or "").strip()
+        if not selected_path or not poly_points:
+            status.value = "Selecciona una imagen y define el segmento antes de guardar el perfil"
+            page.update()
+            return
+
+        with open(selected_path, "rb") as f:
+            img_bytes = f.read()
+        try:
+            controller.save_profile(name, img_bytes, poly_points)
+            status.value = f"💾 Perfil guardado: {name}"
+        except ValueError as ex:
+            status.value = f"❌ {ex}"
+        page.update()
+
+    def on_load_profile(_):
+        nonlocal poly_points, profile_id
+        name = (profile_field.value or "").strip()
+        try:
+            prof = controller.profiles.load(name)
+        except ValueError as ex:
+            status.value = f"❌ {ex}"
+            page.update()
+            return
+
+        profile_id = name
+        poly_points = list(prof["poly_points"])
+        if selected_path:
+            preview = draw_polygon_overlay(load_bgr(selected_path), poly_points)
+            overlay_img.src = img_to_data_uri(preview, controller.encoder)
+        status.value = f"✅ Perfil cargado: {name} ({len(poly_points)} puntos)"
+        page.update()
+
     def on_analyze(_):
         nonlocal poly_points
         if not selected_path:
@@ -172,11 +226,12 @@ def main(page: ft.Page):
             source_name=os.path.basename(selected_path),
             conf=float(conf_slider.value),
             iou=float(iou_slider.value),
-            poly_points=poly_points,
+            poly_points=None if profile_id else poly_points,
+            profile_id=profile_id,
         )
 
-        overlay = load_bgr(out["overlay_path"])
-        overlay_img.src = img_to_data_uri(overlay)
+        overlay_path = out["overlay_path"] or controller.render_overlay(out["scene_id"], max_side=900)
+        overlay_img.src = file_to_data_uri(overlay_path, controller.encoder)
 
         m = out["metrics"]
         traffic_text.value = f"Estado tráfico: {m.get('traffic_state', '-')}"
@@ -188,13 +243,29 @@ def main(page: ft.Page):
         status.value = "✅ Análisis completado"
         page.update()
 
-    page.add(
-        ft.Text("🚦 Roundabout Analyzer", size=28, weight="bold"),
+    def dashboard_params():
+        return {
+            "conf": float(conf_slider.value),
+            "iou": float(iou_slider.value),
+            "poly_points": None if profile_id else poly_points,
+            "profile_id": profile_id,
+        }
+
+    # Vista en vivo para lotes/streams (se alimenta del EventBus del controller)
+    dashboard = DashboardView(page, controller, batch_params=dashboard_params)
+    dashboard.root.visible = False
+
+    single_view = ft.Column([
         ft.Row([
             ft.ElevatedButton("📂 Imagen", on_click=on_pick),
             ft.ElevatedButton("🟥 Definir segmento", on_click=on_define_poly),
             ft.ElevatedButton("🔍 Analizar", on_click=on_analyze),
         ]),
+        ft.Row([
+            profile_field,
+            ft.ElevatedButton("💾 Guardar perfil", on_click=on_save_profile),
+            ft.ElevatedButton("📁 Cargar perfil", on_click=on_load_profile),
+        ]),
         ft.Text("Confianza"),
         conf_slider,
         ft.Text("IoU"),
@@ -203,6 +274,25 @@ def main(page: ft.Page):
         traffic_text,
         overlay_img,
         metrics_box,
+    ])
+
+    def show(view):
+        single_view.visible = view == "single"
+        dashboard.root.visible = view == "dashboard"
+        if view == "dashboard":
+            dashboard.start()
+        else:
+            dashboard.stop()
+        page.update()
+
+    page.add(
+        ft.Text("🚦 Roundabout Analyzer", size=28, weight="bold"),
+        ft.Row([
+            ft.TextButton("🖼️ Imagen", on_click=lambda _: show("single")),
+            ft.TextButton("📊 Dashboard", on_click=lambda _: show("dashboard")),
+        ]),
+        single_view,
+        dashboard.root,
     )
 
 
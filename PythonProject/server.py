@@ -0,0 +1,74 @@
+import os
+import argparse
+
+from aiohttp import web
+
+from Controller.app_controller import AppController
+from Model.change_gate_service import ChangeGateService
+from Model.encoder_pool import EncoderPool
+from Model.profiling_service import ProfilingService
+from Model.yolo_service import ImgszPolicy
+from View.http_api import create_app
+
+MODEL_PATH = os.path.join("Yolo", "best_roundabout.pt")
+
+
+if __name__ == "__main__":
+    # Usage: python server.py [--port 8080] [--max-batch 8] [--max-latency-ms 20]
+    ap = argparse.ArgumentParser(description="Servicio HTTP del Roundabout Analyzer")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8080)
+    ap.add_argument("--model", default=MODEL_PATH)
+    ap.add_argument("--model-variant", default=None, help="variante cuantizada aceptada (int8, fp16...)")
+    ap.add_argument("--outputs", default="outputs")
+    ap.add_argument("--profiles", default="profiles")
+    ap.add_argument("--pool-size", type=int, default=None, help="réplicas del modelo (por defecto según cores/memoria)")
+    ap.add_argument("--timeseries", default=None, metavar="DIR", help="activa las series por cámara (GET /timeseries)")
+    ap.add_argument("--heatmaps", default=None, metavar="DIR", help="activa los mapas de calor por cámara (GET /heatmap)")
+    ap.add_argument("--heatmap-half-life", type=float, default=None, help="decaimiento exponencial en s (sin él, acumulado)")
+    ap.add_argument("--gate-threshold", type=float, default=None, help="activa la puerta de cambios (diff media en gris)")
+    ap.add_argument("--gate-refresh", type=int, default=30, help="análisis forzado cada N frames saltados")
+    ap.add_argument("--imgsz-mode", choices=["adaptive", "fixed"], default="adaptive")
+    ap.add_argument("--imgsz-rect", action="store_true", help="letterbox rectangular")
+    ap.add_argument("--reduced-decode", action="store_true", help="decodifica JPEG a 1/2-1/8 si el modelo no necesita más")
+    ap.add_argument("--overlay", choices=["lazy", "eager"], default="lazy", help="lazy: overlay al pedirlo (GET /overlay)")
+    ap.add_argument("--encode-format", choices=["jpeg", "webp"], default="jpeg", help="formato de overlays/originales recodificados")
+    ap.add_argument("--encode-quality", type=int, default=90)
+    ap.add_argument("--encode-progressive", action="store_true", help="JPEG progresivo")
+    ap.add_argument("--encode-workers", type=int, default=None, help="hilos de codificación (por defecto min(4, cores))")
+    ap.add_argument("--encode-max-inflight-mb", type=int, default=256, help="tope de memoria de imágenes pendientes de codificar")
+    ap.add_argument("--profile", default=None, metavar="SPEC",
+                    help='perfilado por escena, p.ej. "sample=0.01,slow_ms=2000,tracemalloc=10" (como ROUNDABOUT_PROFILE); '
+                         'con slow_ms se perfila toda petición (overhead) y, una captura a la vez, bajo carga se saltan')
+    ap.add_argument("--max-batch", type=int, default=8)
+    ap.add_argument("--max-latency-ms", type=float, default=20.0)
+    args = ap.parse_args()
+
+    gate = None
+    if args.gate_threshold is not None:
+        gate = ChangeGateService(threshold=args.gate_threshold, refresh_every=args.gate_refresh)
+
+    controller = AppController(
+        args.model,
+        outputs_dir=args.outputs,
+        profiles_dir=args.profiles,
+        timeseries_dir=args.timeseries,
+        heatmaps_dir=args.heatmaps,
+        heatmap_half_life_s=args.heatmap_half_life,
+        pool_size=args.pool_size,
+        change_gate=gate,
+        imgsz_policy=ImgszPolicy(mode=args.imgsz_mode, rect=args.imgsz_rect),
+        reduced_decode=args.reduced_decode,
+        overlay_mode=args.overlay,
+        model_variant=args.model_variant,
+        encoder=EncoderPool(
+            fmt=args.encode_format,
+            quality=args.encode_quality,
+            progressive=args.encode_progressive,
+            workers=args.encode_workers,
+            max_inflight_bytes=args.encode_max_inflight_mb * 2**20,
+        ),
+        profiling=ProfilingService.from_env({ProfilingService.ENV_VAR: args.profile}) if args.profile else None,
+    )
+    app = create_app(controller, max_batch_size=args.max_batch, max_latency_ms=args.max_latency_ms)
+    web.run_app(app, host=args.host, port=args.port)
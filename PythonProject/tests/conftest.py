@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Mismo patrón que tools/: la raíz del proyecto en el path (Model/, Controller/...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,115 @@
+import contextlib
+import tracemalloc
+
+import cv2
+import numpy as np
+import pytest
+
+import Controller.app_controller as app_controller
+from Controller.app_controller import AppController
+
+
+class StubPool:
+    """
+    Sustituye a YoloPool: el bucle de frames probado (decodificación,
+    máscara, overlay, evidencia) no hace inferencia, así que no hacen
+    falta ni ultralytics ni los pesos.
+    """
+
+    variant = None
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def choose_imgsz(self, crop_h, crop_w):
+        return 1024
+
+    def snapshot(self):
+        return {}
+
+
+@pytest.fixture
+def controller(tmp_path, monkeypatch):
+    monkeypatch.setattr(app_controller, "YoloPool", StubPool)
+    return AppController(
+        "sin_pesos.pt",
+        outputs_dir=str(tmp_path / "outputs"),
+        profiles_dir=str(tmp_path / "profiles"),
+        timeseries_dir=None,
+        heatmaps_dir=None,
+        overlay_mode="eager",  # el overlay es justo lo que usa los buffers
+    )
+
+
+def frame_loop(controller, image_bytes, poly_points, n):
+    peaks = []
+    for _ in range(n):
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        frame = controller._prepare_frame(image_bytes, poly_points)
+        try:
+            controller._finalize_frame(frame, [], "check", 0.25, 0.7)
+        finally:
+            controller._release_frame(frame)
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - base)
+    return peaks
+
+
+@pytest.mark.parametrize("h, w", [(1080, 1920)])
+def test_steady_state_reuses_buffers(controller, h, w):
+    img = np.random.default_rng(0).integers(0, 255, (h, w, 3), dtype=np.uint8)
+    image_bytes = cv2.imencode(".jpg", img)[1].tobytes()
+    poly = [(w // 10, h // 5), (w - w // 10, h // 6), (w - w // 8, h - h // 10), (w // 8, h - h // 8)]
+
+    tracemalloc.start()
+    try:
+        frame_loop(controller, image_bytes, poly, 3)  # calentamiento
+        before = controller.buffers.snapshot()
+        peaks = frame_loop(controller, image_bytes, poly, 10)
+        after = controller.buffers.snapshot()
+    finally:
+        tracemalloc.stop()
+
+    # Ni un buffer nuevo del pool tras el calentamiento...
+    assert after["allocations"] == before["allocations"]
+    assert after["reuses"] > before["reuses"]
+    # ...y por frame solo queda la imagen decodificada (cv2.imdecode no admite dst)
+    assert max(peaks) < 1.25 * h * w * 3
+
+
+class FailingReplica:
+    def choose_imgsz(self, crop_h, crop_w):
+        return 1024
+
+    def predict_batch(self, crops, **kwargs):
+        raise RuntimeError("forward roto")
+
+
+def outstanding(controller):
+    # Todo buffer creado está libre en el pool o descartado por el tope
+    snap = controller.buffers.snapshot()
+    return snap["allocations"] - snap["free_buffers"] - snap["dropped"]
+
+
+def test_analyze_batch_returns_buffers_when_predict_or_gate_fails(controller, monkeypatch):
+    h, w = 240, 320
+    image_bytes = cv2.imencode(".jpg", np.zeros((h, w, 3), dtype=np.uint8))[1].tobytes()
+    poly = [(10, 10), (300, 20), (290, 220), (20, 200)]
+    items = [{"image_bytes": image_bytes, "source_name": f"cam{i}", "poly_points": poly} for i in range(3)]
+
+    monkeypatch.setattr(controller.pool, "replica", lambda: contextlib.nullcontext(FailingReplica()), raising=False)
+    with pytest.raises(RuntimeError):
+        controller.analyze_batch(items)
+    assert controller.buffers.snapshot()["allocations"] > 0
+    assert outstanding(controller) == 0
+
+    def gate(frame, source_name, conf, iou):
+        if source_name == "cam1":
+            raise RuntimeError("puerta rota")
+        return None
+
+    monkeypatch.setattr(controller, "_gate_frame", gate)
+    with pytest.raises(RuntimeError):
+        controller.analyze_batch(items)
+    assert outstanding(controller) == 0
@@ -0,0 +1,56 @@
+import asyncio
+import random
+import time
+import types
+
+from Controller.dynamic_batcher import DynamicBatcher
+
+
+class StubController:
+    """
+    analyze_batch con latencia variable (como réplicas con lotes de distinto
+    tamaño): sin orden por fuente, los lotes en paralelo terminan cruzados.
+    """
+
+    def __init__(self, replicas: int):
+        self.pool = types.SimpleNamespace(size=replicas)
+        self.seen = {}
+        self.rng = random.Random(0)
+
+    def analyze_batch(self, items, conf, iou):
+        time.sleep(self.rng.uniform(0.001, 0.02))
+        for it in items:
+            self.seen.setdefault(it["source_name"], []).append(it["frame_ts"])
+        return [{"frame_ts": it["frame_ts"]} for it in items]
+
+
+def test_same_source_frames_run_in_order_across_replicas():
+    controller = StubController(replicas=4)
+
+    async def main():
+        batcher = DynamicBatcher(controller, max_batch_size=3, max_latency_ms=2)
+        await batcher.start()
+
+        async def camera(name):
+            tasks = []
+            for f in range(30):
+                # frames sin esperar al anterior; conf cambia a mitad (otro grupo)
+                tasks.append(asyncio.create_task(
+                    batcher.submit(b"jpeg", name, conf=0.25 if f % 7 else 0.5, frame_ts=f * 0.1)))
+                await asyncio.sleep(0.001)
+            return await asyncio.gather(*tasks)
+
+        out = await asyncio.gather(*(camera(f"cam{i}") for i in range(3)),
+                                   *(batcher.submit(b"jpeg", "http") for _ in range(5)))
+        parked = len(batcher._pending)
+        await batcher.stop()
+        return out, parked
+
+    out, parked = asyncio.run(main())
+
+    for i in range(3):
+        ts = controller.seen[f"cam{i}"]
+        assert ts == sorted(ts) and len(ts) == 30
+        assert [r["frame_ts"] for r in out[i]] == ts
+    assert len(controller.seen["http"]) == 5
+    assert parked == 0
@@ -0,0 +1,41 @@
+import numpy as np
+
+from Model.roi_mask_service import ROIMaskService
+from Model.tracking_service import TrackingService
+
+H, W = 1000, 2000
+
+
+def make_tracker():
+    roi = ROIMaskService.polygon_mask(H, W, [(500, 0), (1500, 0), (1500, H), (500, H)])
+    return TrackingService(rois={"e": roi})
+
+
+def car(x, y):
+    return {"bbox_xyxy": [x, y, x + 40, y + 20], "conf": 0.9, "class_name": "car"}
+
+
+def test_stationary_tracks_inside_roi_do_not_enter():
+    tr = make_tracker()
+    p = np.c_[np.random.default_rng(0).uniform(0, W - 50, 50), np.random.default_rng(1).uniform(0, H - 30, 50)]
+    for f in range(30):
+        tr.update([car(x, y) for x, y in p], f * 0.1)
+    assert tr.totals["e"]["entries"] == 0
+    assert tr.totals["e"]["exits"] == 0
+
+
+def test_drive_through_counts_one_entry_and_exit():
+    tr = make_tracker()
+    for f in range(200):
+        tr.update([car(100 + 10 * f, 500)], f * 0.1)
+    assert tr.totals["e"]["entries"] == 1
+    assert tr.totals["e"]["exits"] == 1
+
+
+def test_track_born_inside_enters_after_leaving():
+    tr = make_tracker()
+    xs = list(range(1000, 1700, 10)) + list(range(1700, 1200, -10))
+    for f, x in enumerate(xs):
+        tr.update([car(x, 500)], f * 0.1)
+    assert tr.totals["e"]["entries"] == 1
+    assert tr.totals["e"]["exits"] == 0
@@ -0,0 +1,95 @@
+import os
+import json
+import hashlib
+
+import pytest
+
+from Controller.batch_worker import BatchWorker
+from Model.work_queue_service import WorkQueueService
+
+
+class StubController:
+    """
+    Solo crea la carpeta de escena en staging (como haría EvidenceService).
+    """
+
+    def __init__(self, queue: WorkQueueService, worker_id: str):
+        self.staging = queue.staging_dir(worker_id)
+        self.n = 0
+
+    def analyze_image_bytes(self, image_bytes, **kwargs):
+        self.n += 1
+        scene_dir = os.path.join(self.staging, f"scene{self.n:04d}")
+        os.makedirs(scene_dir)
+        payload = json.dumps({"n": self.n}).encode("utf-8")
+        with open(os.path.join(scene_dir, "result.json"), "wb") as f:
+            f.write(payload)
+        return {"scene_dir": scene_dir, "sha256_result_json": hashlib.sha256(payload).hexdigest(), "metrics": {}}
+
+
+def make_queue(tmp_path, n_items=6, unit_size=2):
+    paths = []
+    for i in range(n_items):
+        p = tmp_path / f"img{i}.jpg"
+        p.write_bytes(b"jpeg")
+        paths.append(str(p))
+    manifest = tmp_path / "manifest.txt"
+    manifest.write_text("\n".join(paths))
+    queue = WorkQueueService(str(tmp_path / "queue"), lease_ttl_s=30, max_attempts=3)
+    queue.shard(str(manifest), unit_size=unit_size)
+    return queue
+
+
+def test_heartbeat_never_overwrites_another_lease(tmp_path):
+    queue = make_queue(tmp_path)
+    lease = queue.claim("a")["lease"]
+    assert queue.heartbeat(lease)
+    assert queue.owns(lease)
+
+    # La lease caducó y otro worker la reclamó
+    lease_path = queue._path("leases", lease["unit_id"] + ".lease")
+    queue._write_json_atomic(lease_path, dict(lease, worker="b", token="b-token"))
+
+    assert not queue.heartbeat(lease)
+    queue.release(lease)
+    with open(lease_path, "r", encoding="utf-8") as f:
+        assert json.load(f)["token"] == "b-token"
+    assert os.listdir(os.path.dirname(lease_path)) == [os.path.basename(lease_path)]
+
+
+def test_worker_survives_unit_infrastructure_error(tmp_path, monkeypatch):
+    queue = make_queue(tmp_path)
+    checkpoint = queue.checkpoint
+    failed = []
+
+    def flaky_checkpoint(lease, records):
+        if lease["unit_id"] == "u000000" and not failed:
+            failed.append(lease["attempt"])
+            raise OSError("ESTALE")
+        return checkpoint(lease, records)
+
+    monkeypatch.setattr(queue, "checkpoint", flaky_checkpoint)
+    worker = BatchWorker(StubController(queue, "w"), queue, worker_id="w", checkpoint_every=1)
+    stats = worker.run()
+
+    assert stats["unit_errors"] == 1
+    assert queue.status()["done"] == 3
+
+
+def test_merge_is_idempotent_but_refuses_scene_collisions(tmp_path):
+    queue = make_queue(tmp_path)
+    BatchWorker(StubController(queue, "w"), queue, worker_id="w").run()
+    outputs = tmp_path / "outputs"
+
+    # Otra escena (de otro worker) con el mismo scene_id ya en el almacén
+    (outputs / "scene0001").mkdir(parents=True)
+    (outputs / "scene0001" / "result.json").write_bytes(b'{"otra": 1}')
+    with pytest.raises(FileExistsError):
+        queue.merge("u000000", str(outputs))
+    assert not os.path.exists(queue._path("merged", "u000000.json"))
+    assert os.path.isdir(os.path.join(queue.staging_dir("w"), "scene0001"))
+
+    # Sin colisión: repetir la fusión no duplica ni falla
+    first = queue.merge("u000001", str(outputs))
+    os.remove(queue._path("merged", "u000001.json"))
+    assert queue.merge("u000001", str(outputs))["scenes"] == first["scenes"] == ["scene0003", "scene0004"]
@@ -0,0 +1,86 @@
+import os
+import sys
+import json
+import logging
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Model.work_queue_service import WorkQueueService  # noqa: E402
+
+
+def make_controller(args, queue: WorkQueueService, worker_id: str):
+    from Controller.app_controller import AppController
+
+    # Las evidencias van a staging del worker; series y heatmaps se
+    # desactivan: varios nodos no pueden compartir los mismos memmap
+    return AppController(
+        args.model,
+        outputs_dir=queue.staging_dir(worker_id),
+        profiles_dir=args.profiles,
+        pool_size=args.pool_size,
+        timeseries_dir=None,
+        heatmaps_dir=None,
+        reduced_decode=args.reduced_decode,
+        overlay_mode="lazy",
+    )
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Análisis por lotes distribuido sobre una cola en FS compartido")
+    ap.add_argument("queue_dir", help="carpeta de la cola (compartida entre nodos)")
+    ap.add_argument("--lease-ttl", type=float, default=300.0, help="segundos sin latido para dar un worker por muerto")
+    ap.add_argument("--max-attempts", type=int, default=5)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("shard", help="crea las unidades a partir del manifest")
+    p.add_argument("manifest", help="JSONL ({'path', 'source_name', 'poly_points'|'profile_id', ...}) o una ruta por línea")
+    p.add_argument("--unit-size", type=int, default=100)
+
+    p = sub.add_parser("work", help="arranca un worker en este nodo")
+    p.add_argument("--model", default=os.path.join("Yolo", "best_roundabout.pt"))
+    p.add_argument("--profiles", default="profiles")
+    p.add_argument("--pool-size", type=int, default=1)
+    p.add_argument("--reduced-decode", action="store_true")
+    p.add_argument("--worker-id", default=None)
+    p.add_argument("--checkpoint-every", type=int, default=10)
+    p.add_argument("--merge-into", default=None, help="almacén central: fusionar cada unidad al confirmarla")
+    p.add_argument("--max-units", type=int, default=None)
+    p.add_argument("--wait", action="store_true", help="no salir mientras otros tengan unidades (por si caducan)")
+
+    p = sub.add_parser("merge", help="fusiona en el almacén central las unidades confirmadas")
+    p.add_argument("outputs_dir")
+
+    sub.add_parser("status", help="progreso de la cola")
+
+    args = ap.parse_args()
+    queue = WorkQueueService(args.queue_dir, lease_ttl_s=args.lease_ttl, max_attempts=args.max_attempts)
+
+    if args.cmd == "shard":
+        print(json.dumps(queue.shard(args.manifest, unit_size=args.unit_size)))
+    elif args.cmd == "work":
+        from Controller.batch_worker import BatchWorker
+
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+        worker_id = args.worker_id or WorkQueueService.default_worker_id()
+        worker = BatchWorker(
+            make_controller(args, queue, worker_id),
+            queue,
+            worker_id=worker_id,
+            checkpoint_every=args.checkpoint_every,
+            merge_into=args.merge_into,
+        )
+        stats = worker.run(max_units=args.max_units, wait_for_leases=args.wait)
+        print(json.dumps({"worker": worker_id, **stats}))
+    elif args.cmd == "merge":
+        n = queue.merge_all(args.outputs_dir)
+        print(json.dumps({"merged_units": n, **queue.status()}))
+    else:
+        print(json.dumps(queue.status()))
+
+
+if __name__ == "__main__":
+    # Usage: python tools/backfill.py /mnt/shared/q shard manifest.jsonl --unit-size 200
+    #        python tools/backfill.py /mnt/shared/q work --merge-into /mnt/shared/outputs   (en cada nodo)
+    #        python tools/backfill.py /mnt/shared/q status
+    main()
@@ -0,0 +1,140 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Model.image_decode_service import ImageDecodeService  # noqa: E402
+
+
+def synthetic_jpeg(h, w, quality=90):
+    # Ruido suavizado: se parece más a una foto que el ruido puro (tamaño de JPEG realista)
+    rng = np.random.default_rng(h * w)
+    small = rng.integers(0, 255, (max(1, h // 16), max(1, w // 16), 3), dtype=np.uint8)
+    img = cv2.resize(small, (w, h), interpolation=cv2.INTER_CUBIC)
+    return cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+
+
+def _proc_rss_kb():
+    """
+    (VmRSS, VmHWM) en KB de /proc/self/status; None fuera de Linux.
+    """
+    try:
+        with open("/proc/self/status", "r") as f:
+            fields = dict(line.split(":", 1) for line in f if line.startswith(("VmRSS", "VmHWM")))
+    except OSError:
+        return None
+    return int(fields["VmRSS"].split()[0]), int(fields["VmHWM"].split()[0])
+
+
+def _reset_peak_rss() -> bool:
+    # Linux: escribir "5" en clear_refs reinicia VmHWM al RSS actual => el pico
+    # medido es el de la decodificación y no el de importar cv2/numpy (~95 MB)
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return False
+    return _proc_rss_kb() is not None
+
+
+def child(path, scale, repeat):
+    """
+    Se ejecuta en un proceso aparte: así el pico de RSS es el de ESTA
+    decodificación y no el de las anteriores.
+    """
+    import resource
+
+    with open(path, "rb") as f:
+        data = f.read()
+    hwm = _reset_peak_rss()
+    if hwm:
+        rss0 = _proc_rss_kb()[0]
+        unit = 1024
+    else:
+        # Sin clear_refs: ru_maxrss, que incluye el pico de los imports
+        rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux da KB; macOS, bytes
+        unit = 1 if sys.platform == "darwin" else 1024
+    t = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        img = ImageDecodeService.decode(data, scale)
+        crop = img[img.shape[0] // 4:, img.shape[1] // 4:]  # vista, como en el controller
+        t.append(time.perf_counter() - t0)
+        del img, crop
+    rss1 = _proc_rss_kb()[1] if hwm else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        "median_ms": round(1000 * float(np.median(t)), 2),
+        "peak_rss_mb": round(rss1 * unit / 2**20, 1),
+        "decode_rss_mb": round((rss1 - rss0) * unit / 2**20, 1),
+    }))
+
+
+def run_child(path, scale, repeat):
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", path, "--scale", str(scale), "--repeat", str(repeat)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Tiempo de decodificación y pico de RSS por tamaño de imagen y escala")
+    ap.add_argument("images", nargs="*", help="JPEG a medir (por defecto, sintéticos de varios tamaños)")
+    ap.add_argument("--sizes", default="720x1280,1080x1920,2160x3840,3000x4000", help="HxW de los sintéticos")
+    ap.add_argument("--imgsz", type=int, default=1280, help="imgsz del modelo (marca la escala que usaría el controller)")
+    ap.add_argument("--repeat", type=int, default=10)
+    ap.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    ap.add_argument("--scale", type=int, default=1, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        child(args.child, args.scale, args.repeat)
+        return
+
+    import tempfile
+
+    tmp = tempfile.mkdtemp(prefix="bench_decode_")
+    paths = list(args.images)
+    if not paths:
+        for spec in args.sizes.split(","):
+            h, w = (int(v) for v in spec.lower().split("x"))
+            p = os.path.join(tmp, f"{h}x{w}.jpg")
+            with open(p, "wb") as f:
+                f.write(synthetic_jpeg(h, w))
+            paths.append(p)
+
+    for path in paths:
+        with open(path, "rb") as f:
+            probe = ImageDecodeService.probe_jpeg_size(f.read())
+        if probe is None:
+            print(f"{path}: no es JPEG, se omite")
+            continue
+        h, w = probe
+        chosen = ImageDecodeService.choose_scale(h, w, args.imgsz)
+
+        base = run_child(path, 1, args.repeat)
+        rows = {}
+        for scale in (1, 2, 4, 8):
+            r = base if scale == 1 else run_child(path, scale, args.repeat)
+            r["saved_ms"] = round(base["median_ms"] - r["median_ms"], 2)
+            r["saved_rss_mb"] = round(base["decode_rss_mb"] - r["decode_rss_mb"], 1)
+            rows[str(scale)] = r
+
+        print(json.dumps({"image": os.path.basename(path), "size": f"{w}x{h}", "scale_for_imgsz": chosen,
+                          "by_scale": rows}))
+
+
+if __name__ == "__main__":
+    # Usage: python tools/bench_decode.py --imgsz 1280
+    #        python tools/bench_decode.py frames/*.jpg --repeat 20
+    main()
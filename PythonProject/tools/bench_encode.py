@@ -0,0 +1,98 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Model.encoder_pool import EncoderPool  # noqa: E402
+
+
+def synthetic_frame(h, w):
+    # Ruido suavizado + bordes: comprime como una foto, no como ruido puro
+    rng = np.random.default_rng(h * w)
+    small = rng.integers(0, 255, (max(1, h // 16), max(1, w // 16), 3), dtype=np.uint8)
+    img = cv2.resize(small, (w, h), interpolation=cv2.INTER_CUBIC)
+    for _ in range(40):
+        x, y = int(rng.integers(0, w)), int(rng.integers(0, h))
+        cv2.rectangle(img, (x, y), (x + w // 20, y + h // 20), tuple(int(c) for c in rng.integers(0, 255, 3)), 2)
+    return img
+
+
+def parse_config(spec):
+    # "jpeg:90", "jpeg:90:progressive", "webp:80"
+    parts = spec.split(":")
+    return {
+        "fmt": parts[0],
+        "quality": int(parts[1]) if len(parts) > 1 else 90,
+        "progressive": len(parts) > 2 and parts[2] == "progressive",
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Throughput de codificación por formato/calidad y nº de hilos del EncoderPool")
+    ap.add_argument("images", nargs="*", help="imágenes a codificar (por defecto, sintéticas)")
+    ap.add_argument("--sizes", default="1080x1920,2160x3840", help="HxW de las sintéticas")
+    ap.add_argument("--configs", default="jpeg:90,jpeg:90:progressive,jpeg:75,webp:80,webp:90")
+    ap.add_argument("--workers", default="1,2,4")
+    ap.add_argument("--frames", type=int, default=24, help="frames por medida de throughput")
+    ap.add_argument("--max-inflight-mb", type=int, default=256)
+    args = ap.parse_args()
+
+    frames = {}
+    for path in args.images:
+        img = cv2.imread(path)
+        if img is None:
+            print(f"No se pudo abrir {path}")
+            sys.exit(1)
+        frames[os.path.basename(path)] = img
+    if not frames:
+        for spec in args.sizes.split(","):
+            h, w = [int(v) for v in spec.lower().split("x")]
+            frames[spec] = synthetic_frame(h, w)
+
+    for name, img in frames.items():
+        mpix = img.shape[0] * img.shape[1] / 1e6
+        for spec in args.configs.split(","):
+            cfg = parse_config(spec)
+            row = {"image": name, "config": spec}
+
+            # Un hilo, sin pool: coste por imagen y tamaño de salida
+            pool = EncoderPool(workers=1, **cfg)
+            data = pool.encode(img)
+            t = []
+            for _ in range(5):
+                t0 = time.perf_counter()
+                pool.encode(img)
+                t.append(time.perf_counter() - t0)
+            pool.close()
+            ms = 1000 * float(np.median(t))
+            row.update(encode_ms=round(ms, 2), mpix_per_s=round(mpix / (ms / 1000), 1), out_kb=round(len(data) / 1024, 1))
+
+            # Pool: frames/s con N hilos enviando desde un solo productor
+            base = None
+            for workers in [int(v) for v in args.workers.split(",")]:
+                pool = EncoderPool(workers=workers, max_inflight_bytes=args.max_inflight_mb * 2**20, **cfg)
+                pool.submit(img).result()  # calentamiento
+                t0 = time.perf_counter()
+                jobs = [pool.submit(img) for _ in range(args.frames)]
+                for job in jobs:
+                    job.result()
+                dt = time.perf_counter() - t0
+                snap = pool.snapshot()
+                pool.close()
+                fps = args.frames / dt
+                base = base or fps
+                row[f"fps_w{workers}"] = round(fps, 1)
+                row[f"speedup_w{workers}"] = round(fps / base, 2)
+                row[f"peak_inflight_mb_w{workers}"] = round(snap["peak_inflight_bytes"] / 2**20, 1)
+            print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    # Usage: python tools/bench_encode.py --sizes 2160x3840 --workers 1,2,4,8
+    main()
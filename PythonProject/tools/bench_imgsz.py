@@ -0,0 +1,112 @@
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Model.yolo_service import YoloService, ImgszPolicy  # noqa: E402
+
+
+def load_labels(label_path, w, h):
+    """
+    Etiquetas YOLO (cls cx cy bw bh normalizados) -> array (N,4) xyxy en píxeles.
+    """
+    if not os.path.exists(label_path):
+        return np.zeros((0, 4))
+    rows = np.loadtxt(label_path, ndmin=2)
+    if rows.size == 0:
+        return np.zeros((0, 4))
+    cx, cy, bw, bh = rows[:, 1] * w, rows[:, 2] * h, rows[:, 3] * w, rows[:, 4] * h
+    return np.stack([cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2], axis=1)
+
+
+def matched_gt(gt, pred, thr=0.5):
+    # Nº de cajas GT con alguna predicción de IoU >= thr (emparejamiento voraz)
+    if len(gt) == 0 or len(pred) == 0:
+        return 0
+    ix1 = np.maximum(gt[:, None, 0], pred[None, :, 0])
+    iy1 = np.maximum(gt[:, None, 1], pred[None, :, 1])
+    ix2 = np.minimum(gt[:, None, 2], pred[None, :, 2])
+    iy2 = np.minimum(gt[:, None, 3], pred[None, :, 3])
+    inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+    ag = (gt[:, 2] - gt[:, 0]) * (gt[:, 3] - gt[:, 1])
+    ap = (pred[:, 2] - pred[:, 0]) * (pred[:, 3] - pred[:, 1])
+    iou = inter / np.maximum(ag[:, None] + ap[None, :] - inter, 1e-9)
+
+    used = np.zeros(len(pred), dtype=bool)
+    n = 0
+    for g in np.argsort(-iou.max(axis=1)):
+        cand = np.where(~used & (iou[g] >= thr))[0]
+        if len(cand):
+            used[cand[np.argmax(iou[g, cand])]] = True
+            n += 1
+    return n
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Latencia y recall por política de imgsz sobre el split de validación")
+    ap.add_argument("dataset", help="carpeta con images/val y labels/val (formato YOLO)")
+    ap.add_argument("--model", default=os.path.join("Yolo", "best_roundabout.pt"))
+    ap.add_argument("--split", default="val")
+    ap.add_argument("--limit", type=int, default=200)
+    ap.add_argument("--conf", type=float, default=0.25)
+    ap.add_argument("--target-obj-px", type=float, default=None, help="tamaño típico de vehículo en la cámara")
+    ap.add_argument("--train-obj-px", type=float, default=None, help="tamaño típico de vehículo en entrenamiento")
+    args = ap.parse_args()
+
+    images = sorted(glob.glob(os.path.join(args.dataset, "images", args.split, "*")))[: args.limit]
+    if not images:
+        print(f"No hay imágenes en {args.dataset}/images/{args.split}")
+        sys.exit(1)
+
+    policies = {
+        "fixed": ImgszPolicy(mode="fixed"),
+        "adaptive": ImgszPolicy(mode="adaptive", target_obj_px=args.target_obj_px, train_obj_px=args.train_obj_px),
+        "adaptive_rect": ImgszPolicy(
+            mode="adaptive", rect=True, target_obj_px=args.target_obj_px, train_obj_px=args.train_obj_px
+        ),
+    }
+
+    for name, policy in policies.items():
+        yolo = YoloService(args.model, imgsz_policy=policy)
+        yolo.predict(cv2.imread(images[0]), conf=args.conf)  # calentamiento
+
+        lat, gt_total, gt_found, sizes = [], 0, 0, {}
+        for path in images:
+            img = cv2.imread(path)
+            if img is None:
+                continue
+            h, w = img.shape[:2]
+            imgsz = yolo.choose_imgsz(h, w)
+            sizes[str(imgsz)] = sizes.get(str(imgsz), 0) + 1
+
+            t0 = time.perf_counter()
+            res = yolo.predict(img, conf=args.conf, imgsz=imgsz)
+            lat.append(time.perf_counter() - t0)
+
+            label = os.path.splitext(path.replace(os.sep + "images" + os.sep, os.sep + "labels" + os.sep))[0] + ".txt"
+            gt = load_labels(label, w, h)
+            pred = res.boxes.xyxy.cpu().numpy() if res.boxes is not None else np.zeros((0, 4))
+            gt_total += len(gt)
+            gt_found += matched_gt(gt, pred)
+
+        lat = np.array(lat)
+        print(json.dumps({
+            "policy": name,
+            "images": len(lat),
+            "mean_ms": round(1000 * float(lat.mean()), 1),
+            "p95_ms": round(1000 * float(np.percentile(lat, 95)), 1),
+            "recall@0.5": round(gt_found / gt_total, 4) if gt_total else None,
+            "imgsz_used": sizes,
+        }))
+
+
+if __name__ == "__main__":
+    # Usage: python tools/bench_imgsz.py /ruta/yolo_roundabout --limit 200
+    main()
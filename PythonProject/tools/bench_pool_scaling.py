@@ -0,0 +1,73 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Controller.app_controller import AppController  # noqa: E402
+
+
+def run(controller, image_bytes, poly_points, callers: int, per_caller: int) -> dict:
+    def worker(_):
+        lat = []
+        for _ in range(per_caller):
+            t0 = time.perf_counter()
+            controller.analyze_image_bytes(image_bytes, "bench", poly_points=poly_points)
+            lat.append(time.perf_counter() - t0)
+        return lat
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=callers) as ex:
+        lat = [x for xs in ex.map(worker, range(callers)) for x in xs]
+    wall = time.perf_counter() - t0
+
+    lat.sort()
+    n = len(lat)
+    return {
+        "callers": callers,
+        "images": n,
+        "throughput_ips": round(n / wall, 2),
+        "p50_ms": round(1000 * lat[n // 2], 1),
+        "p95_ms": round(1000 * lat[min(n - 1, int(n * 0.95))], 1),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Curva de escalado 1..N llamadores concurrentes sobre AppController")
+    ap.add_argument("image")
+    ap.add_argument("--model", default=os.path.join("Yolo", "best_roundabout.pt"))
+    ap.add_argument("--pool-size", type=int, nargs="+", default=[1, 0], help="0 => tamaño automático (cores/memoria)")
+    ap.add_argument("--max-callers", type=int, default=os.cpu_count() or 4)
+    ap.add_argument("--per-caller", type=int, default=8)
+    ap.add_argument("--poly", default=None, help='JSON [[x,y],...] opcional')
+    args = ap.parse_args()
+
+    with open(args.image, "rb") as f:
+        image_bytes = f.read()
+    poly_points = [tuple(p) for p in json.loads(args.poly)] if args.poly else None
+
+    callers = [1]
+    while callers[-1] * 2 <= args.max_callers:
+        callers.append(callers[-1] * 2)
+
+    for size in args.pool_size:
+        out_dir = tempfile.mkdtemp(prefix="bench_pool_")
+        controller = AppController(args.model, outputs_dir=out_dir, pool_size=size or None)
+        print(f"# pool {json.dumps(controller.pool.snapshot())}")
+        # calentamiento (primera inferencia carga kernels)
+        controller.analyze_image_bytes(image_bytes, "warmup", poly_points=poly_points)
+        base = None
+        for c in callers:
+            row = run(controller, image_bytes, poly_points, c, args.per_caller)
+            base = base or row["throughput_ips"]
+            row["speedup"] = round(row["throughput_ips"] / base, 2)
+            print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    # Usage: python tools/bench_pool_scaling.py imagen.jpg --pool-size 1 4 8 --max-callers 32
+    main()
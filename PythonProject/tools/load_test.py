@@ -0,0 +1,79 @@
+import sys
+import time
+import json
+import asyncio
+import argparse
+
+import aiohttp
+
+
+async def _one(session, url, image_bytes, params):
+    t0 = time.perf_counter()
+    async with session.post(url, data=image_bytes, params=params) as r:
+        body = await r.json()
+        if r.status != 200 or not body.get("ok"):
+            raise RuntimeError(f"HTTP {r.status}: {body}")
+    return time.perf_counter() - t0
+
+
+async def run(url, image_bytes, params, n, concurrency):
+    sem = asyncio.Semaphore(concurrency)
+    lat = []
+
+    async with aiohttp.ClientSession() as session:
+        async def task():
+            async with sem:
+                lat.append(await _one(session, url, image_bytes, params))
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*[task() for _ in range(n)])
+        wall = time.perf_counter() - t0
+
+    lat.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": n,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(n / wall, 2),
+        "p50_ms": round(1000 * lat[len(lat) // 2], 1),
+        "p95_ms": round(1000 * lat[min(len(lat) - 1, int(len(lat) * 0.95))], 1),
+    }
+
+
+async def main():
+    ap = argparse.ArgumentParser(description="Compara llamadas secuenciales vs concurrentes contra /analyze")
+    ap.add_argument("image")
+    ap.add_argument("--url", default="http://127.0.0.1:8080")
+    ap.add_argument("-n", type=int, default=64)
+    ap.add_argument("-c", "--concurrency", type=int, nargs="+", default=[1, 4, 8, 16])
+    ap.add_argument("--poly", default=None, help='JSON [[x,y],...] opcional')
+    args = ap.parse_args()
+
+    with open(args.image, "rb") as f:
+        image_bytes = f.read()
+
+    params = {"source_name": "load_test"}
+    if args.poly:
+        params["poly_points"] = args.poly
+
+    url = args.url.rstrip("/") + "/analyze"
+    rows = []
+    for c in args.concurrency:
+        rows.append(await run(url, image_bytes, params, args.n, c))
+        print(json.dumps(rows[-1]))
+
+    base = rows[0]["throughput_rps"]
+    for r in rows[1:]:
+        print(f"c={r['concurrency']}: x{r['throughput_rps'] / base:.2f} vs c={rows[0]['concurrency']}")
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get(args.url.rstrip("/") + "/stats") as r:
+            print("batcher:", json.dumps(await r.json()))
+
+
+if __name__ == "__main__":
+    # Usage: python tools/load_test.py imagen.jpg -n 64 -c 1 8 16
+    if len(sys.argv) < 2:
+        print("Usage: python tools/load_test.py <imagen> [-n N] [-c 1 8 16]")
+        sys.exit(2)
+    asyncio.run(main())
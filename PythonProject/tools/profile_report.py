@@ -0,0 +1,107 @@
+import os
+import sys
+import glob
+import json
+import pstats
+import argparse
+from collections import defaultdict
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Model.profiling_service import ProfilingService  # noqa: E402
+
+
+def load_captures(outputs_dir):
+    """
+    perf.json con captura propia (los de lote que solo la referencian se saltan).
+    """
+    captures = []
+    pattern = os.path.join(outputs_dir, "*", ProfilingService.DIR_NAME, "perf.json")
+    for path in sorted(glob.glob(pattern)):
+        with open(path, "r", encoding="utf-8") as f:
+            info = json.load(f)
+        if "shared_with" in info:
+            continue
+        info["_dir"] = os.path.dirname(path)
+        captures.append(info)
+    return captures
+
+
+def hot_functions(captures, top):
+    # Se suman los cpu.prof completos (no solo el top de cada perf.json)
+    stats = None
+    for cap in captures:
+        prof = os.path.join(cap["_dir"], "cpu.prof")
+        if not os.path.exists(prof):
+            continue
+        if stats is None:
+            stats = pstats.Stats(prof)
+        else:
+            stats.add(prof)
+    if stats is None:
+        return []
+    rows = []
+    for (filename, lineno, func), (_cc, nc, tt, ct, _callers) in stats.stats.items():
+        rows.append({
+            "function": f"{filename}:{lineno}({func})",
+            "calls": nc,
+            "tottime_ms": round(1000 * tt, 2),
+            "cumtime_ms": round(1000 * ct, 2),
+            "tottime_per_capture_ms": round(1000 * tt / len(captures), 2),
+        })
+    rows.sort(key=lambda r: r["tottime_ms"], reverse=True)
+    return rows[:top]
+
+
+def alloc_sites(captures, top):
+    sites = defaultdict(lambda: {"captures": 0, "size_kb_total": 0.0, "size_kb_max": 0.0, "count_total": 0})
+    for cap in captures:
+        for row in cap.get("alloc_top") or []:
+            s = sites[row["site"]]
+            s["captures"] += 1
+            s["size_kb_total"] += row["size_kb"]
+            s["size_kb_max"] = max(s["size_kb_max"], row["size_kb"])
+            s["count_total"] += row["count"]
+    rows = [{"site": site, **s, "size_kb_total": round(s["size_kb_total"], 1)} for site, s in sites.items()]
+    rows.sort(key=lambda r: r["size_kb_total"], reverse=True)
+    return rows[:top]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Agrega las capturas de perfilado (perf/) de todas las escenas")
+    ap.add_argument("outputs_dir", nargs="?", default="outputs")
+    ap.add_argument("--top", type=int, default=20)
+    args = ap.parse_args()
+
+    captures = load_captures(args.outputs_dir)
+    if not captures:
+        print(f"No hay capturas en {args.outputs_dir}/*/{ProfilingService.DIR_NAME}/ "
+              f"(activa {ProfilingService.ENV_VAR}, p.ej. slow_ms=2000)")
+        sys.exit(1)
+
+    lat = np.array([c["latency_ms"] for c in captures])
+    peaks = [c["memory"].get("py_peak_alloc_mb") for c in captures if c["memory"].get("py_peak_alloc_mb") is not None]
+    slowest = sorted(captures, key=lambda c: c["latency_ms"], reverse=True)[:5]
+    report = {
+        "captures": len(captures),
+        "by_reason": {r: sum(1 for c in captures if c["reason"] == r) for r in sorted({c["reason"] for c in captures})},
+        "latency_ms": {
+            "p50": round(float(np.percentile(lat, 50)), 1),
+            "p95": round(float(np.percentile(lat, 95)), 1),
+            "max": round(float(lat.max()), 1),
+        },
+        "slowest": [{"scenes": c["scenes"], "latency_ms": c["latency_ms"], "kind": c["kind"]} for c in slowest],
+        "py_peak_alloc_mb_max": max(peaks) if peaks else None,
+        "rss_peak_mb_max": max((c["memory"].get("rss_peak_mb") or 0) for c in captures) or None,
+        "hot_functions": hot_functions(captures, args.top),
+        "alloc_sites": alloc_sites(captures, args.top),
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    # Usage: ROUNDABOUT_PROFILE="slow_ms=1500,tracemalloc=10" python server.py
+    #        python tools/profile_report.py outputs --top 20
+    main()
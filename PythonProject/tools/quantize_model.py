@@ -0,0 +1,243 @@
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import argparse
+
+import cv2
+import numpy as np
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Model.model_variant_service import ModelVariantService  # noqa: E402
+
+# Lo que hace ../hackatonduosamba.py al entrenar best_roundabout.pt: imgsz=1024 y
+# el dataset en images/{train,val} (val = 10% del subset barajado con seed 42,
+# entrenado con val=False => val nunca se usó para elegir pesos: es el held-out)
+TRAIN_IMGSZ = 1024
+CALIB_SPLIT = "train"
+HOLDOUT_SPLIT = "val"
+
+
+def write_data_yaml(out_path, dataset, names, val_split):
+    """
+    data.yaml de ultralytics apuntando a la copia local del dataset.
+    El "val" de este yaml es lo que lee tanto model.val como la
+    calibración INT8 del export, así que se elige el split aquí.
+    """
+    data = {
+        "path": os.path.abspath(dataset),
+        "train": "images/train",
+        "val": f"images/{val_split}",
+        "names": names,
+    }
+    with open(out_path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(data, f, sort_keys=False)
+    return out_path
+
+
+def prune_checkpoint(pt_path, amount, out_path):
+    """
+    Poda L1 no estructurada global de las convoluciones (sin reentrenar).
+    En CPU solo acelera si el runtime aprovecha los pesos dispersos: por
+    eso pasa por la misma puerta y el informe lo mide.
+    """
+    import torch
+    import torch.nn.utils.prune as prune
+
+    ckpt = torch.load(pt_path, map_location="cpu", weights_only=False)
+    model = (ckpt.get("ema") or ckpt["model"]).float()
+    convs = [(m, "weight") for m in model.modules() if isinstance(m, torch.nn.Conv2d)]
+    prune.global_unstructured(convs, pruning_method=prune.L1Unstructured, amount=amount)
+    for module, name in convs:
+        prune.remove(module, name)
+    ckpt.update(model=model.half(), ema=None, optimizer=None)
+    torch.save(ckpt, out_path)
+    return out_path
+
+
+def count_labels(label_path):
+    if not os.path.exists(label_path):
+        return 0
+    with open(label_path, "r", encoding="utf-8") as f:
+        return sum(1 for line in f if line.strip())
+
+
+def evaluate(model_path, data_yaml, images, imgsz, conf):
+    """
+    mAP (model.val sobre el split held-out), error relativo de conteo por
+    imagen y latencia CPU de una imagen, igual que en producción.
+    """
+    from ultralytics import YOLO
+
+    task = {} if model_path.endswith(".pt") else {"task": "detect"}
+    model = YOLO(model_path, **task)
+    metrics = model.val(data=data_yaml, split="val", imgsz=imgsz, batch=1, device="cpu", plots=False, verbose=False)
+
+    model = YOLO(model_path, **task)  # sin el estado que deja val()
+    model.predict(cv2.imread(images[0]), conf=conf, imgsz=imgsz, device="cpu", verbose=False)  # calentamiento
+    lat, abs_err, gt_total = [], 0, 0
+    for path in images:
+        img = cv2.imread(path)
+        if img is None:
+            continue
+        t0 = time.perf_counter()
+        res = model.predict(img, conf=conf, imgsz=imgsz, device="cpu", verbose=False)[0]
+        lat.append(time.perf_counter() - t0)
+
+        label = os.path.splitext(path.replace(os.sep + "images" + os.sep, os.sep + "labels" + os.sep))[0] + ".txt"
+        gt = count_labels(label)
+        pred = len(res.boxes) if res.boxes is not None else 0
+        abs_err += abs(pred - gt)
+        gt_total += gt
+
+    lat = np.array(lat)
+    return {
+        "map50": round(float(metrics.box.map50), 5),
+        "map50_95": round(float(metrics.box.map), 5),
+        "count_rel_error": round(abs_err / gt_total, 5) if gt_total else 0.0,
+        "images": int(lat.size),
+        "mean_ms": round(1000 * float(lat.mean()), 1),
+        "p95_ms": round(1000 * float(np.percentile(lat, 95)), 1),
+    }
+
+
+def build_variant(args, variants, name, precision, prune_amount, calib_yaml, calib_fraction, stride):
+    from ultralytics import YOLO
+
+    vdir = variants.variant_dir(args.model, name)
+    if os.path.isdir(vdir):
+        shutil.rmtree(vdir)
+    os.makedirs(vdir)
+
+    source = args.model
+    if prune_amount > 0:
+        source = prune_checkpoint(args.model, prune_amount, os.path.join(vdir, "pruned.pt"))
+
+    export_kwargs = dict(ModelVariantService.PRECISIONS[precision])
+    if export_kwargs.get("int8"):
+        export_kwargs.update(data=calib_yaml, fraction=calib_fraction)
+    # batch=1 explícito: en un export estático el tamaño de lote también queda
+    # fijo (YoloService parte los lotes del DynamicBatcher a ese tamaño)
+    exported = YOLO(source).export(imgsz=args.imgsz, dynamic=args.dynamic, batch=1, device="cpu", **export_kwargs)
+
+    # El export sale junto al .pt de origen: se mueve a la carpeta de la variante
+    target = os.path.join(vdir, os.path.basename(os.path.normpath(exported)))
+    if os.path.abspath(exported) != os.path.abspath(target):
+        shutil.move(exported, target)
+    return {
+        "precision": precision,
+        "prune_amount": prune_amount,
+        "format": export_kwargs["format"],
+        "export": os.path.basename(target),
+        "imgsz": args.imgsz,
+        "stride": stride,
+        "dynamic": bool(args.dynamic),
+        "batch": None if args.dynamic else 1,
+        "calibration": (
+            {"split": args.calib_split, "fraction": round(calib_fraction, 4)} if export_kwargs.get("int8") else None
+        ),
+    }, target
+
+
+def main():
+    ap = argparse.ArgumentParser(
+        description="Variantes FP16/INT8 (y podadas) del modelo para CPU con puerta de precisión frente al FP32"
+    )
+    ap.add_argument("dataset", nargs="?", default=None,
+                    help="carpeta con images/{train,val} y labels/{train,val} de hackatonduosamba.py "
+                         "(por defecto el path del yaml de --data)")
+    ap.add_argument("--model", default=os.path.join("Yolo", "best_roundabout.pt"))
+    ap.add_argument("--data", default=os.path.join("Yolo", "data_roundabout.yaml"),
+                    help="data.yaml que escribe hackatonduosamba.py (clases y path del dataset)")
+    ap.add_argument("--variants-dir", default=None)
+    ap.add_argument("--precisions", default="fp16,int8")
+    ap.add_argument("--prune", default="0", help="fracciones de poda a probar, p.ej. 0,0.2")
+    ap.add_argument("--imgsz", type=int, default=TRAIN_IMGSZ, help="el del entrenamiento (hackatonduosamba.py)")
+    ap.add_argument("--dynamic", action="store_true", help="export con forma dinámica (permite imgsz adaptativo)")
+    ap.add_argument("--calib-split", default=CALIB_SPLIT, help="split para calibrar INT8 (nunca el de evaluación)")
+    ap.add_argument("--calib-images", type=int, default=300)
+    ap.add_argument("--holdout-split", default=HOLDOUT_SPLIT, help="split no visto al entrenar")
+    ap.add_argument("--limit", type=int, default=200, help="imágenes held-out para conteo y latencia")
+    ap.add_argument("--conf", type=float, default=0.25)
+    ap.add_argument("--max-map-drop", type=float, default=0.01)
+    ap.add_argument("--max-count-error-increase", type=float, default=0.02)
+    args = ap.parse_args()
+
+    with open(args.data, "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f)
+    names = data["names"]
+    args.dataset = args.dataset or data.get("path")
+    if not args.dataset:
+        print(f"Indica la carpeta del dataset ({args.data} no trae path)")
+        sys.exit(1)
+
+    if args.calib_split == args.holdout_split:
+        print("La calibración y la evaluación deben usar splits distintos")
+        sys.exit(1)
+    holdout = sorted(glob.glob(os.path.join(args.dataset, "images", args.holdout_split, "*")))[: args.limit]
+    calib_pool = glob.glob(os.path.join(args.dataset, "images", args.calib_split, "*"))
+    if not holdout or not calib_pool:
+        print(f"Faltan imágenes en {args.dataset}/images/{{{args.calib_split},{args.holdout_split}}}")
+        sys.exit(1)
+
+    from ultralytics import YOLO
+
+    base = YOLO(args.model).model
+    stride = int(max(base.stride))
+    # Aviso si los pesos dicen otro imgsz (p.ej. reentrenados con otro script)
+    train_args = base.args if isinstance(base.args, dict) else vars(base.args)
+    trained = train_args.get("imgsz")
+    trained = max(trained) if isinstance(trained, (list, tuple)) else trained
+    if trained and int(trained) != args.imgsz:
+        print(f"Aviso: {os.path.basename(args.model)} se entrenó con imgsz={trained}; se evalúa con {args.imgsz}")
+
+    variants = ModelVariantService(args.variants_dir)
+    work = os.path.dirname(variants.variant_dir(args.model, "x"))
+    os.makedirs(work, exist_ok=True)
+    eval_yaml = write_data_yaml(os.path.join(work, "eval.yaml"), args.dataset, names, args.holdout_split)
+    calib_yaml = write_data_yaml(os.path.join(work, "calib.yaml"), args.dataset, names, args.calib_split)
+    calib_fraction = min(1.0, args.calib_images / float(len(calib_pool)))
+
+    baseline = evaluate(args.model, eval_yaml, holdout, args.imgsz, args.conf)
+    report = {"model": os.path.basename(args.model), "imgsz": args.imgsz, "baseline": baseline, "variants": []}
+    print(json.dumps({"variant": "fp32 (.pt)", **baseline}))
+
+    for amount in [float(x) for x in args.prune.split(",") if x.strip()]:
+        for precision in [p.strip() for p in args.precisions.split(",") if p.strip()]:
+            if precision not in ModelVariantService.PRECISIONS:
+                print(f"Precisión desconocida: {precision}")
+                sys.exit(1)
+            name = precision + (f"-p{int(round(amount * 100))}" if amount > 0 else "")
+            info, path = build_variant(args, variants, name, precision, amount, calib_yaml, calib_fraction, stride)
+            metrics = evaluate(path, eval_yaml, holdout, args.imgsz, args.conf)
+            gate = ModelVariantService.gate(
+                baseline, metrics,
+                max_map_drop=args.max_map_drop,
+                max_count_error_increase=args.max_count_error_increase,
+            )
+            info.update(metrics=metrics, baseline=baseline, gate=gate)
+            variants.save(args.model, name, info)
+
+            row = {
+                "variant": name,
+                **metrics,
+                "speedup": round(baseline["mean_ms"] / max(metrics["mean_ms"], 1e-6), 2),
+                "accepted": gate["accepted"],
+                "reasons": gate["reasons"],
+            }
+            report["variants"].append(row)
+            print(json.dumps(row, ensure_ascii=False))
+
+    with open(os.path.join(work, "report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    # Usage: python tools/quantize_model.py /ruta/yolo_roundabout --precisions fp16,int8 --prune 0,0.2
+    #        (la carpeta que genera hackatonduosamba.py; sin ella, el path de Yolo/data_roundabout.yaml)
+    #        python server.py --model-variant int8   (solo si la puerta la aceptó)
+    main()
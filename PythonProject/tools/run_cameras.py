@@ -0,0 +1,63 @@
+import os
+import sys
+import json
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Controller.app_controller import AppController  # noqa: E402
+from Controller.camera_scheduler import CameraScheduler, CameraSource, folder_frames  # noqa: E402
+
+
+async def main():
+    ap = argparse.ArgumentParser(description="Varias cámaras compartiendo un solo modelo YOLO")
+    ap.add_argument("config", help='JSON: [{"id","folder","fps","priority","deadline_s","poly_points"|"profile_id"}, ...]')
+    ap.add_argument("--model", default=os.path.join("Yolo", "best_roundabout.pt"))
+    ap.add_argument("--outputs", default="outputs")
+    ap.add_argument("--pool-size", type=int, default=None)
+    ap.add_argument("--timeseries", default=None, metavar="DIR", help="activa las series por cámara")
+    ap.add_argument("--heatmaps", default=None, metavar="DIR", help="activa los mapas de calor por cámara")
+    ap.add_argument("--report-s", type=float, default=5.0)
+    args = ap.parse_args()
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        cams = json.load(f)
+
+    controller = AppController(
+        args.model,
+        outputs_dir=args.outputs,
+        pool_size=args.pool_size,
+        timeseries_dir=args.timeseries,
+        heatmaps_dir=args.heatmaps,
+    )
+    sched = CameraScheduler(controller)
+    for c in cams:
+        sched.add_camera(
+            CameraSource(
+                c["id"],
+                folder_frames(c["folder"], fps=c.get("fps", 1.0), loop=c.get("loop", False)),
+                poly_points=[tuple(p) for p in c["poly_points"]] if c.get("poly_points") else None,
+                priority=c.get("priority", 1),
+                deadline_s=c.get("deadline_s", 2.0),
+                profile_id=c.get("profile_id"),
+            )
+        )
+
+    async def report():
+        while True:
+            await asyncio.sleep(args.report_s)
+            print(json.dumps(sched.snapshot()))
+
+    reporter = asyncio.create_task(report())
+    try:
+        await sched.run()
+    finally:
+        reporter.cancel()
+        controller.close()
+    print(json.dumps(sched.snapshot()))
+
+
+if __name__ == "__main__":
+    # Usage: python tools/run_cameras.py cameras.json --pool-size 2
+    asyncio.run(main())